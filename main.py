@@ -2,7 +2,9 @@
 Archivo principal de StockPrep
 Punto de entrada con soporte de argumentos:
   - --gui [pyside|tkinter]
-  - --cli
+  - --cli [--image IMG | --folder CARPETA]
+  - --daemon
+  - --watch CARPETA
 """
 import sys
 import os
@@ -59,33 +61,108 @@ def run_gui_tkinter():
     start_tk()
     return True
 
-def run_cli():
-    """Modo CLI mínimo: procesa una imagen de ejemplo si se pasa --image."""
-    from core.model_manager import Florence2Manager
+def crear_procesador_local():
+    """ImageProcessor con el modelo cargado en este proceso (None si no se pudo cargar)."""
+    from core.model_manager import crear_model_manager
+    from core.model_registry import crear_registro_desde_config
     from core.image_processor import ImageProcessor
+    registro = crear_registro_desde_config()
+    if registro:
+        # Las variantes se cargan bajo demanda según el nivel de detalle
+        return ImageProcessor(registro.manager(), registry=registro)
+    manager = crear_model_manager()
+    if not manager.cargar_modelo(callback=print):
+        print("❌ No se pudo cargar el modelo")
+        return None
+    return ImageProcessor(manager)
+
+def _workers(valor: str):
+    return valor if valor == "auto" else int(valor)
+
+def run_cli() -> int:
+    """
+    Modo CLI: una imagen con --image, o una carpeta completa sin interfaz con
+    --folder (ver core/headless_batch.py). Devuelve el código de salida.
+    """
+    from core.model_daemon import conectar_daemon
+    from core.headless_batch import SALIDA_MODELO, SALIDA_USO, SALIDA_CON_ERRORES, SALIDA_OK, ejecutar_lote
     parser = argparse.ArgumentParser(description="StockPrep Pro - CLI")
     parser.add_argument("--image", help="Ruta a la imagen a procesar")
+    parser.add_argument("--folder", help="Procesar todas las imágenes de una carpeta (recursivo)")
     parser.add_argument("--detail", default="largo", choices=["minimo", "medio", "largo"], help="Nivel de detalle")
+    parser.add_argument("--workers", type=_workers, help="Workers del pool de CPU (entero o 'auto')")
+    parser.add_argument("--batch-size", type=int, default=4, help="Imágenes por llamada al modelo")
+    parser.add_argument("--resume", action="store_true", help="Continuar el último lote sin terminar de la carpeta")
+    parser.add_argument("--output", help="Fichero de resultados .jsonl o .csv (por defecto JSONL en stdout)")
+    parser.add_argument("--format", choices=["jsonl", "csv"], help="Formato de --output si la extensión no lo indica")
+    parser.add_argument("--db", default="stockprep_images.db", help="Base de datos de resultados")
+    parser.add_argument("--no-db", action="store_true", help="No guardar los resultados en la base de datos")
+    parser.add_argument("--progress-interval", type=float, default=10.0, help="Segundos entre líneas de progreso")
+    parser.add_argument("--verbose", action="store_true", help="Mostrar el detalle de cada imagen en el log")
     args_cli, _ = parser.parse_known_args()
 
+    if args_cli.folder:
+        return ejecutar_lote(args_cli, crear_procesador_local)
+
     if not args_cli.image:
         print("Uso: python main.py --cli --image ruta/imagen.jpg [--detail minimo|medio|largo]")
-        return
-
-    manager = Florence2Manager()
-    ok = manager.cargar_modelo(callback=print)
-    if not ok:
-        print("❌ No se pudo cargar el modelo")
-        return
+        print("     python main.py --cli --folder carpeta/ [--workers N] [--batch-size N] [--resume] "
+              "[--output resultados.jsonl|.csv]")
+        return SALIDA_USO
+
+    # Primero el daemon (modelo ya cargado); si no hay, carga en este proceso
+    daemon = conectar_daemon()
+    if daemon:
+        print("🛰️ Usando el modelo del daemon local")
+        _, processor = daemon
+    else:
+        processor = crear_procesador_local()
+        if processor is None:
+            return SALIDA_MODELO
 
-    processor = ImageProcessor(manager)
     result = processor.process_image(args_cli.image, args_cli.detail)
     if result.get("error"):
         print(f"❌ Error: {result['error']}")
-        return
+        return SALIDA_CON_ERRORES
     print("📝 Descripción:", result.get("caption") or result.get("descripcion"))
     print("🏷️ Keywords:", ", ".join(result.get("keywords", [])))
     print("🔍 Objetos:", result.get("objects"))
+    return SALIDA_OK
+
+def run_watch(carpeta: str, detail: str):
+    """Procesa sin parar las imágenes que llegan a `carpeta` (Ctrl+C o SIGTERM para salir)."""
+    import signal
+    from core.batch_engine import BatchEngine
+    from core.enhanced_database_manager import EnhancedDatabaseManager
+    from core.watch_folder import crear_vigilancia_desde_config
+
+    if not Path(carpeta).is_dir():
+        print(f"❌ No existe la carpeta: {carpeta}")
+        return
+    processor = crear_procesador_local()
+    if processor is None:
+        return
+    engine = BatchEngine(
+        processor, status_callback=lambda tipo, dato: print(dato) if tipo == 'log' else None,
+        detail_level=detail, db_manager=EnhancedDatabaseManager("stockprep_images.db"),
+    )
+    vigilancia = crear_vigilancia_desde_config(engine, carpeta)
+    # SIGTERM (systemd) deja terminar las imágenes en curso; Ctrl+C las cancela
+    signal.signal(signal.SIGTERM, lambda *_: vigilancia.detener())
+    try:
+        vigilancia.ejecutar()
+    except KeyboardInterrupt:
+        print("⏹️ Vigilancia detenida por el usuario")
+
+def run_daemon():
+    """Mantiene el modelo cargado y lo sirve a la CLI y la GUI por socket Unix."""
+    from core.model_daemon import ModelDaemon
+    try:
+        ModelDaemon().servir()
+    except RuntimeError as exc:
+        print(f"❌ {exc}")
+    except KeyboardInterrupt:
+        pass
 
 def main():
     """
@@ -95,12 +172,22 @@ def main():
     parser = argparse.ArgumentParser(description="StockPrep Pro v2.0")
     parser.add_argument("--gui", choices=["pyside", "tkinter"], help="Seleccionar interfaz gráfica")
     parser.add_argument("--cli", action="store_true", help="Ejecutar en modo línea de comandos")
+    parser.add_argument("--daemon", action="store_true", help="Mantener el modelo cargado en un daemon local")
+    parser.add_argument("--watch", metavar="CARPETA", help="Procesar las imágenes que lleguen a una carpeta")
+    parser.add_argument("--detail", default="largo", choices=["minimo", "medio", "largo"], help="Nivel de detalle")
     args, unknown = parser.parse_known_args()
 
-    if args.cli:
-        run_cli()
+    if args.daemon:
+        run_daemon()
+        return
+
+    if args.watch:
+        run_watch(args.watch, args.detail)
         return
 
+    if args.cli:
+        sys.exit(run_cli())
+
     gui_choice = args.gui or "pyside"
     print(f"Iniciando StockPrep Pro v2.0 - GUI {gui_choice}...")
 
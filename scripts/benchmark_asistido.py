@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Mide la decodificación asistida (borrador Florence‑2 base) por nivel de detalle.
+
+Para cada nivel procesa el mismo conjunto de imágenes dos veces con el preset
+sin beams (la asistencia no admite beam search): sin borrador y con él.
+Informa la tasa de aceptación de los tokens propuestos, la aceleración de la
+latencia media y cuántos captions salen idénticos (en greedy deberían serlo
+todos; con muestreo cambian por la semilla).
+
+Uso:
+    python scripts/benchmark_asistido.py [--images test_images] [--draft models/Florence-2-base-ft]
+                                         [--levels minimo medio largo]
+                                         [--output logs/benchmark_asistido.json]
+"""
+import argparse
+import json
+import statistics
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]  # raíz del proyecto (Caption/)
+sys.path.insert(0, str(ROOT / "src"))
+
+import torch
+
+from core.assisted_decoding import AssistedDecoder
+from core.image_processor import ImageProcessor
+from core.model_manager import cargar_config_seccion, crear_model_manager
+
+EXTENSIONES = {".jpg", ".jpeg", ".png", ".bmp", ".webp"}
+SEMILLA = 1234
+
+
+def pasada(processor: ImageProcessor, imagenes: list[Path], nivel: str, etiqueta: str) -> dict:
+    tarea = processor._caption_prompt(nivel)
+    processor.process_image(str(imagenes[0]), nivel, tasks=[tarea])  # warmup
+    if processor.asistente is not None:
+        processor.asistente.reiniciar_estadisticas()  # sin contar el warmup
+    latencias, captions = [], {}
+    for img in imagenes:
+        torch.manual_seed(SEMILLA)
+        t0 = time.perf_counter()
+        res = processor.process_image(str(img), nivel, tasks=[tarea])
+        latencias.append(time.perf_counter() - t0)
+        captions[img.name] = res.get("caption") or f"ERROR: {res.get('error')}"
+        print(f"  [{nivel}/{etiqueta}] {img.name}: {latencias[-1]:.2f}s")
+    return {"latencias_s": latencias, "captions": captions}
+
+
+def main():
+    config = cargar_config_seccion("modelo").get("asistente") or {}
+    parser = argparse.ArgumentParser(description="Decodificación asistida: aceptación y aceleración por nivel")
+    parser.add_argument("--images", default=str(ROOT / "test_images"), help="Carpeta de imágenes fija")
+    parser.add_argument("--draft", default=config.get("ruta") or str(ROOT / "models" / "Florence-2-base-ft"))
+    parser.add_argument("--levels", nargs="*", default=["minimo", "medio", "largo"],
+                        choices=["minimo", "medio", "largo"])
+    parser.add_argument("--output", default=str(ROOT / "logs" / "benchmark_asistido.json"))
+    args = parser.parse_args()
+
+    imagenes = sorted(p for p in Path(args.images).iterdir() if p.suffix.lower() in EXTENSIONES)
+    if not imagenes:
+        raise SystemExit(f"No hay imágenes en {args.images}")
+
+    manager = crear_model_manager()
+    if not manager.cargar_modelo(callback=print):
+        raise SystemExit("No se pudo cargar el modelo")
+    asistente = AssistedDecoder(args.draft, niveles=args.levels)
+    if not asistente.preparar(manager.model.device, callback=print):
+        raise SystemExit(f"No se pudo cargar el borrador: {asistente.desactivado}")
+
+    # Ambas pasadas con el preset sin beams, para medir solo el efecto del borrador
+    processor = ImageProcessor(manager, cache=None, asistente=None)
+    sin_beams = {nivel: processor._parametros_sin_beams(nivel) for nivel in args.levels}
+    processor._get_generation_params = lambda level: dict(sin_beams[level])
+
+    informe = {"fecha": time.strftime("%Y-%m-%d %H:%M:%S"), "borrador": asistente.manager.model_id,
+               "modelo": manager.model_id, "dispositivo": str(manager.device), "imagenes": len(imagenes),
+               "niveles": {}}
+    for nivel in args.levels:
+        processor.asistente = None
+        base = pasada(processor, imagenes, nivel, "normal")
+        processor.asistente = asistente
+        asistida = pasada(processor, imagenes, nivel, "asistida")
+        if asistente.desactivado:
+            raise SystemExit(f"La decodificación asistida falló: {asistente.desactivado}")
+
+        stats = asistente.estadisticas().get(nivel, {})
+        media_base = statistics.mean(base["latencias_s"])
+        media_asistida = statistics.mean(asistida["latencias_s"])
+        informe["niveles"][nivel] = {
+            "params": sin_beams[nivel],
+            "latencia_media_s": round(media_base, 3),
+            "latencia_media_asistida_s": round(media_asistida, 3),
+            "aceleracion": round(media_base / media_asistida, 2) if media_asistida else None,
+            "tasa_aceptacion": stats.get("tasa_aceptacion"),
+            "tokens_por_s_asistida": stats.get("tokens_por_s"),
+            "captions_identicos": sum(
+                1 for nombre, texto in base["captions"].items() if asistida["captions"].get(nombre) == texto
+            ),
+        }
+
+    salida = Path(args.output)
+    salida.parent.mkdir(parents=True, exist_ok=True)
+    salida.write_text(json.dumps(informe, ensure_ascii=False, indent=2), encoding="utf-8")
+
+    print()
+    for nivel, r in informe["niveles"].items():
+        print(f"{nivel:>7}: x{r['aceleracion']} ({r['latencia_media_s']}s -> {r['latencia_media_asistida_s']}s), "
+              f"aceptación {r['tasa_aceptacion']}, idénticos {r['captions_identicos']}/{len(imagenes)}")
+    print(f"Informe: {salida}")
+
+
+if __name__ == "__main__":
+    main()
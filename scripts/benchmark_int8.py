@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Compara Florence‑2 en CPU fp32 frente a int8 dinámico sobre un conjunto fijo de imágenes.
+
+Informa la aceleración (latencia media por imagen) y la deriva de los captions
+int8 respecto a fp32, para decidir si compensa activar `modelo.cuantizacion_cpu`.
+
+Uso:
+    python scripts/benchmark_int8.py [--images test_images] [--detail minimo]
+                                     [--encoder] [--output logs/benchmark_int8.json]
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+from difflib import SequenceMatcher
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]  # raíz del proyecto (Caption/)
+sys.path.insert(0, str(ROOT / "src"))
+
+# La comparación solo tiene sentido en CPU: ocultar las GPU antes de importar torch
+os.environ["CUDA_VISIBLE_DEVICES"] = ""
+
+from core.image_processor import ImageProcessor
+from core.model_manager import Florence2Manager
+
+EXTENSIONES = {".jpg", ".jpeg", ".png", ".bmp", ".webp"}
+
+
+def ejecutar(modo: str, imagenes: list[Path], detail: str, encoder: bool) -> dict:
+    """Carga el modelo en el modo indicado y procesa todas las imágenes."""
+    manager = Florence2Manager(cpu_quantization=modo)
+    manager.quantize_encoder = encoder
+
+    inicio = time.perf_counter()
+    if not manager.cargar_modelo(callback=print):
+        raise SystemExit(f"No se pudo cargar el modelo en modo {modo}")
+    tiempo_carga = time.perf_counter() - inicio
+
+    processor = ImageProcessor(manager, cache=None)  # medir inferencia, no la caché
+    # Decodificación determinista: sin sampling la deriva mide solo la cuantización
+    params_originales = processor._get_generation_params
+    processor._get_generation_params = lambda level: {**params_originales(level), "do_sample": False}
+
+    processor.process_image(str(imagenes[0]), detail)  # warmup
+
+    captions, latencias = {}, []
+    for img in imagenes:
+        t0 = time.perf_counter()
+        res = processor.process_image(str(img), detail)
+        latencias.append(time.perf_counter() - t0)
+        captions[img.name] = res.get("caption") or f"ERROR: {res.get('error')}"
+        print(f"  [{modo}] {img.name}: {latencias[-1]:.2f}s")
+
+    manager.descargar_modelo()
+    return {"carga_s": tiempo_carga, "latencias_s": latencias, "captions": captions}
+
+
+def deriva(a: str, b: str) -> float:
+    """1 - similitud por palabras entre dos captions (0 = idénticos)."""
+    return 1.0 - SequenceMatcher(None, a.lower().split(), b.lower().split()).ratio()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark CPU fp32 vs int8 dinámico")
+    parser.add_argument("--images", default=str(ROOT / "test_images"), help="Carpeta de imágenes fija")
+    parser.add_argument("--detail", default="minimo", choices=["minimo", "medio", "largo"])
+    parser.add_argument("--encoder", action="store_true", help="Cuantizar también el encoder de visión")
+    parser.add_argument("--output", default=str(ROOT / "logs" / "benchmark_int8.json"))
+    args = parser.parse_args()
+
+    imagenes = sorted(p for p in Path(args.images).iterdir() if p.suffix.lower() in EXTENSIONES)
+    if not imagenes:
+        raise SystemExit(f"No hay imágenes en {args.images}")
+
+    fp32 = ejecutar("none", imagenes, args.detail, args.encoder)
+    int8 = ejecutar("int8", imagenes, args.detail, args.encoder)
+
+    media_fp32 = statistics.mean(fp32["latencias_s"])
+    media_int8 = statistics.mean(int8["latencias_s"])
+    derivas = {
+        nombre: deriva(fp32["captions"][nombre], int8["captions"][nombre])
+        for nombre in fp32["captions"]
+    }
+    informe = {
+        "detail_level": args.detail,
+        "cuantizar_encoder": args.encoder,
+        "imagenes": len(imagenes),
+        "latencia_media_fp32_s": round(media_fp32, 3),
+        "latencia_media_int8_s": round(media_int8, 3),
+        "aceleracion": round(media_fp32 / media_int8, 2) if media_int8 else None,
+        "carga_fp32_s": round(fp32["carga_s"], 1),
+        "carga_int8_s": round(int8["carga_s"], 1),
+        "deriva_media": round(statistics.mean(derivas.values()), 3),
+        "captions_identicos": sum(1 for d in derivas.values() if d == 0.0),
+        "por_imagen": {
+            nombre: {
+                "fp32": fp32["captions"][nombre],
+                "int8": int8["captions"][nombre],
+                "deriva": round(derivas[nombre], 3),
+            }
+            for nombre in derivas
+        },
+    }
+
+    salida = Path(args.output)
+    salida.parent.mkdir(parents=True, exist_ok=True)
+    salida.write_text(json.dumps(informe, ensure_ascii=False, indent=2), encoding="utf-8")
+
+    print()
+    print(f"Aceleración int8: x{informe['aceleracion']} "
+          f"({informe['latencia_media_fp32_s']}s -> {informe['latencia_media_int8_s']}s por imagen)")
+    print(f"Deriva media de captions: {informe['deriva_media']:.3f} "
+          f"({informe['captions_identicos']}/{len(imagenes)} idénticos)")
+    print(f"Informe: {salida}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Prueba de carga del pipeline por lotes con el modelo simulado (sin pesos).
+
+Genera imágenes sintéticas en una carpeta temporal, las procesa con
+`BatchEngine` + `ImageProcessor` sobre `FakeFlorence2Manager` y guarda los
+resultados en una base de datos temporal. Informa el tiempo total frente al
+tiempo simulado del modelo, para ver cuánto se va en E/S, keywords y SQLite.
+
+Uso:
+    python scripts/benchmark_pipeline.py [--images 200] [--size 3000x2000]
+                                         [--batch-size 4] [--encoder-ms 40] [--token-ms 8]
+"""
+import argparse
+import json
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]  # raíz del proyecto (Caption/)
+sys.path.insert(0, str(ROOT / "src"))
+
+from PIL import Image
+
+from core.batch_engine import BatchEngine
+from core.enhanced_database_manager import EnhancedDatabaseManager
+from core.fake_backend import FakeFlorence2Manager
+from core.image_processor import ImageProcessor
+
+
+def crear_imagenes(carpeta: Path, cantidad: int, size: tuple) -> None:
+    for i in range(cantidad):
+        color = ((i * 37) % 256, (i * 91) % 256, (i * 53) % 256)
+        Image.new("RGB", size, color).save(carpeta / f"sintetica_{i:05d}.jpg", quality=90)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prueba de carga del pipeline con modelo simulado")
+    parser.add_argument("--images", type=int, default=200)
+    parser.add_argument("--size", default="3000x2000", help="Tamaño de las imágenes sintéticas")
+    parser.add_argument("--detail", default="largo", choices=["minimo", "medio", "largo"])
+    parser.add_argument("--batch-size", type=int, default=4)
+    parser.add_argument("--encoder-ms", type=float, default=40.0)
+    parser.add_argument("--token-ms", type=float, default=8.0)
+    parser.add_argument("--output", default=str(ROOT / "logs" / "benchmark_pipeline.json"))
+    args = parser.parse_args()
+    size = tuple(int(v) for v in args.size.lower().split("x"))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        carpeta = Path(tmp) / "imagenes"
+        carpeta.mkdir()
+        print(f"🖼️ Generando {args.images} imágenes de {size[0]}x{size[1]}...")
+        crear_imagenes(carpeta, args.images, size)
+
+        manager = FakeFlorence2Manager(latencia_encoder_ms=args.encoder_ms, latencia_token_ms=args.token_ms)
+        manager.cargar_modelo(callback=print)
+        processor = ImageProcessor(manager, cache=None)
+
+        # Tiempo que pasa dentro del modelo simulado
+        tiempo_modelo = 0.0
+        generate_original = manager.model.generate
+        encode_original = manager.model._encode_image
+
+        def medir(funcion):
+            def envoltura(*a, **kw):
+                nonlocal tiempo_modelo
+                t0 = time.perf_counter()
+                try:
+                    return funcion(*a, **kw)
+                finally:
+                    tiempo_modelo += time.perf_counter() - t0
+            return envoltura
+
+        manager.model.generate = medir(generate_original)
+        manager.model._encode_image = medir(encode_original)
+
+        engine = BatchEngine(processor, detail_level=args.detail, batch_size=args.batch_size, workers=1)
+        t0 = time.perf_counter()
+        resultados = engine.run(str(carpeta))
+        tiempo_lote = time.perf_counter() - t0
+
+        db = EnhancedDatabaseManager(str(Path(tmp) / "benchmark.db"))
+        t0 = time.perf_counter()
+        for res in resultados:
+            imagen_id = db.obtener_o_crear_registro_id(res.get("ruta_renombrada") or res["ruta_original"])
+            db.actualizar_procesamiento_completo(imagen_id, res, res.get("archivo_renombrado"), None)
+        tiempo_db = time.perf_counter() - t0
+
+    errores = sum(1 for r in resultados if r.get("error"))
+    informe = {
+        "imagenes": args.images,
+        "tamano": list(size),
+        "detail_level": args.detail,
+        "batch_size": args.batch_size,
+        "errores": errores,
+        "lote_s": round(tiempo_lote, 3),
+        "modelo_simulado_s": round(tiempo_modelo, 3),
+        "fuera_del_modelo_s": round(tiempo_lote - tiempo_modelo, 3),
+        "imagenes_por_s": round(args.images / tiempo_lote, 2) if tiempo_lote else None,
+        "db_s": round(tiempo_db, 3),
+        "db_ms_por_imagen": round(1000 * tiempo_db / max(1, len(resultados)), 2),
+    }
+    salida = Path(args.output)
+    salida.parent.mkdir(parents=True, exist_ok=True)
+    salida.write_text(json.dumps(informe, ensure_ascii=False, indent=2), encoding="utf-8")
+
+    print()
+    print(f"Lote: {informe['lote_s']}s ({informe['imagenes_por_s']} img/s), "
+          f"modelo simulado {informe['modelo_simulado_s']}s, resto {informe['fuera_del_modelo_s']}s")
+    print(f"Base de datos: {informe['db_s']}s ({informe['db_ms_por_imagen']} ms/imagen)")
+    print(f"Informe: {salida}")
+
+
+if __name__ == "__main__":
+    main()
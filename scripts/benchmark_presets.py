@@ -0,0 +1,270 @@
+#!/usr/bin/env python3
+"""
+Compara los presets de generación (latencia frente a calidad del caption).
+
+Ejecuta cada preset de `ImageProcessor._get_generation_params` (minimo, medio,
+largo) y las variantes definidas por el usuario sobre un conjunto fijo de
+imágenes, y por preset informa:
+
+• latencia p50 / p95 por imagen
+• tokens generados por segundo
+• longitud del caption (palabras)
+• solapamiento de keywords (Jaccard) con el preset de referencia
+• memoria pico (VRAM en GPU, RSS en CPU)
+
+Las variantes se definen en un YAML/JSON partiendo de un preset base:
+
+    variantes:
+      largo_greedy:
+        base: largo
+        params: {do_sample: false, num_beams: 1}
+      medio_3beams:
+        base: medio
+        params: {num_beams: 3, do_sample: false}
+
+Uso:
+    python scripts/benchmark_presets.py [--images test_images] [--variants variantes.yaml]
+                                        [--presets minimo medio largo] [--referencia largo]
+                                        [--output logs/benchmark_presets]
+"""
+import argparse
+import csv
+import json
+import statistics
+import sys
+import threading
+import time
+from pathlib import Path
+
+import yaml
+
+ROOT = Path(__file__).resolve().parents[1]  # raíz del proyecto (Caption/)
+sys.path.insert(0, str(ROOT / "src"))
+
+import torch
+
+from core.image_processor import ImageProcessor
+from core.model_manager import crear_model_manager
+
+EXTENSIONES = {".jpg", ".jpeg", ".png", ".bmp", ".webp"}
+PRESETS = ["minimo", "medio", "largo"]
+SEMILLA = 1234
+
+
+class MuestreadorRSS:
+    """Muestrea VmRSS del proceso en segundo plano y guarda el máximo (Linux)."""
+
+    def __init__(self, intervalo_s: float = 0.05):
+        self.intervalo_s = intervalo_s
+        self.pico_mb = 0.0
+        self._parar = threading.Event()
+        self._hilo = threading.Thread(target=self._bucle, daemon=True)
+
+    @staticmethod
+    def rss_mb() -> float:
+        try:
+            with open("/proc/self/status", "r", encoding="utf-8") as f:
+                for linea in f:
+                    if linea.startswith("VmRSS:"):
+                        return int(linea.split()[1]) / 1024
+        except OSError:
+            pass
+        return 0.0
+
+    def _bucle(self):
+        while not self._parar.is_set():
+            self.pico_mb = max(self.pico_mb, self.rss_mb())
+            self._parar.wait(self.intervalo_s)
+
+    def __enter__(self):
+        self._hilo.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._parar.set()
+        self._hilo.join()
+        self.pico_mb = max(self.pico_mb, self.rss_mb())
+
+
+def percentil(valores: list, p: float) -> float:
+    """Percentil por interpolación lineal (p en 0..100)."""
+    ordenados = sorted(valores)
+    if len(ordenados) == 1:
+        return ordenados[0]
+    pos = (len(ordenados) - 1) * p / 100
+    bajo = int(pos)
+    alto = min(bajo + 1, len(ordenados) - 1)
+    return ordenados[bajo] + (ordenados[alto] - ordenados[bajo]) * (pos - bajo)
+
+
+def jaccard(a: list, b: list) -> float:
+    a, b = {k.lower() for k in a}, {k.lower() for k in b}
+    return len(a & b) / len(a | b) if a | b else 1.0
+
+
+def cargar_variantes(ruta: str | None) -> dict:
+    """Variantes de usuario del fichero: `{nombre: {"base": preset, "params": {...}}}`."""
+    if not ruta:
+        return {}
+    datos = yaml.safe_load(Path(ruta).read_text(encoding="utf-8")) or {}
+    return datos.get("variantes", datos)
+
+
+def ejecutar_preset(processor: ImageProcessor, manager, nombre: str, base: str, params: dict,
+                    imagenes: list[Path]) -> dict:
+    """Procesa todas las imágenes con un juego de parámetros y mide cada una."""
+    processor._get_generation_params = lambda level: dict(params)
+    tarea = processor._caption_prompt(base)
+
+    # Tokens generados por la última llamada (sin el token de inicio ni el padding)
+    tokens = {"n": 0}
+    generate_original = manager.model.generate
+    pad = getattr(manager.processor.tokenizer, "pad_token_id", None)
+
+    def generate_contando(*a, **kw):
+        salida = generate_original(*a, **kw)
+        validos = salida != pad if pad is not None else torch.ones_like(salida, dtype=torch.bool)
+        tokens["n"] = int(validos.sum()) - salida.shape[0]
+        return salida
+
+    manager.model.generate = generate_contando
+    usar_cuda = str(manager.device).startswith("cuda")
+    if usar_cuda:
+        torch.cuda.synchronize()
+        torch.cuda.reset_peak_memory_stats()
+
+    filas = []
+    try:
+        processor.process_image(str(imagenes[0]), base, tasks=[tarea])  # warmup
+        with MuestreadorRSS() as rss:
+            for img in imagenes:
+                torch.manual_seed(SEMILLA)
+                t0 = time.perf_counter()
+                res = processor.process_image(str(img), base, tasks=[tarea])
+                if usar_cuda:
+                    torch.cuda.synchronize()
+                latencia = time.perf_counter() - t0
+                caption = res.get("caption") or ""
+                filas.append({
+                    "preset": nombre,
+                    "imagen": img.name,
+                    "latencia_s": round(latencia, 4),
+                    "tokens": tokens["n"],
+                    "palabras": len(caption.split()),
+                    "caption": caption,
+                    "keywords": res.get("keywords", []),
+                    "error": res.get("error"),
+                })
+                print(f"  [{nombre}] {img.name}: {latencia:.2f}s, {tokens['n']} tokens")
+    finally:
+        manager.model.generate = generate_original
+
+    pico_mb = torch.cuda.max_memory_allocated() / 1024 ** 2 if usar_cuda else rss.pico_mb
+    return {"filas": filas, "pico_mb": round(pico_mb, 1)}
+
+
+def resumir(nombre: str, base: str, params: dict, ejecucion: dict, referencia: dict | None) -> dict:
+    filas = [f for f in ejecucion["filas"] if not f["error"]]
+    if not filas:
+        return {"preset": nombre, "base": base, "errores": len(ejecucion["filas"])}
+    latencias = [f["latencia_s"] for f in filas]
+    total_tokens = sum(f["tokens"] for f in filas)
+    resumen = {
+        "preset": nombre,
+        "base": base,
+        "p50_s": round(percentil(latencias, 50), 3),
+        "p95_s": round(percentil(latencias, 95), 3),
+        "tokens_por_s": round(total_tokens / sum(latencias), 1) if sum(latencias) else None,
+        "tokens_medios": round(total_tokens / len(filas), 1),
+        "palabras_medias": round(statistics.mean(f["palabras"] for f in filas), 1),
+        "solapamiento_keywords": None,
+        "pico_memoria_mb": ejecucion["pico_mb"],
+        "errores": len(ejecucion["filas"]) - len(filas),
+        "params": json.dumps(params, sort_keys=True),
+    }
+    if referencia is not None:
+        por_imagen = {f["imagen"]: f["keywords"] for f in referencia["filas"] if not f["error"]}
+        solapes = [jaccard(f["keywords"], por_imagen[f["imagen"]]) for f in filas if f["imagen"] in por_imagen]
+        if solapes:
+            resumen["solapamiento_keywords"] = round(statistics.mean(solapes), 3)
+    return resumen
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de presets de generación (latencia vs calidad)")
+    parser.add_argument("--images", default=str(ROOT / "test_images"), help="Carpeta de imágenes fija")
+    parser.add_argument("--presets", nargs="*", default=PRESETS, choices=PRESETS)
+    parser.add_argument("--variants", help="YAML/JSON con variantes de usuario (ver docstring)")
+    parser.add_argument("--referencia", default="largo", help="Preset o variante de referencia para las keywords")
+    parser.add_argument("--limit", type=int, default=0, help="Máximo de imágenes (0 = todas)")
+    parser.add_argument("--output", default=str(ROOT / "logs" / "benchmark_presets"),
+                        help="Prefijo de salida (.json y .csv)")
+    args = parser.parse_args()
+
+    imagenes = sorted(p for p in Path(args.images).iterdir() if p.suffix.lower() in EXTENSIONES)
+    if args.limit:
+        imagenes = imagenes[:args.limit]
+    if not imagenes:
+        raise SystemExit(f"No hay imágenes en {args.images}")
+
+    manager = crear_model_manager()
+    if not manager.cargar_modelo(callback=print):
+        raise SystemExit("No se pudo cargar el modelo")
+    processor = ImageProcessor(manager, cache=None)  # medir inferencia, no la caché
+    presets_originales = processor._get_generation_params
+
+    candidatos = {nombre: (nombre, presets_originales(nombre)) for nombre in args.presets}
+    for nombre, variante in cargar_variantes(args.variants).items():
+        base = variante.get("base", "largo")
+        candidatos[nombre] = (base, {**presets_originales(base), **(variante.get("params") or {})})
+    if args.referencia not in candidatos:
+        raise SystemExit(f"La referencia '{args.referencia}' no está entre los presets/variantes")
+
+    # La referencia primero: las demás se comparan con sus keywords
+    orden = [args.referencia] + [n for n in candidatos if n != args.referencia]
+    ejecuciones = {}
+    for nombre in orden:
+        base, params = candidatos[nombre]
+        print(f"\n▶ {nombre} (base {base}): {params}")
+        ejecuciones[nombre] = ejecutar_preset(processor, manager, nombre, base, params, imagenes)
+
+    resumenes = [
+        resumir(nombre, candidatos[nombre][0], candidatos[nombre][1], ejecuciones[nombre],
+                ejecuciones[args.referencia] if nombre != args.referencia else None)
+        for nombre in orden
+    ]
+
+    informe = {
+        "fecha": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "modelo": manager.firma_modelo(),
+        "dispositivo": str(manager.device),
+        "imagenes": len(imagenes),
+        "referencia": args.referencia,
+        "presets": resumenes,
+        "por_imagen": [fila for nombre in orden for fila in ejecuciones[nombre]["filas"]],
+    }
+    salida = Path(args.output)
+    salida.parent.mkdir(parents=True, exist_ok=True)
+    ruta_json = salida.with_suffix(".json")
+    ruta_csv = salida.with_suffix(".csv")
+    ruta_json.write_text(json.dumps(informe, ensure_ascii=False, indent=2), encoding="utf-8")
+    columnas = ["preset", "base", "p50_s", "p95_s", "tokens_por_s", "tokens_medios", "palabras_medias",
+                "solapamiento_keywords", "pico_memoria_mb", "errores", "params"]
+    with open(ruta_csv, "w", newline="", encoding="utf-8") as f:
+        escritor = csv.DictWriter(f, fieldnames=columnas, extrasaction="ignore")
+        escritor.writeheader()
+        escritor.writerows(resumenes)
+
+    print()
+    for r in resumenes:
+        if "p50_s" not in r:
+            print(f"{r['preset']:>16}: todas las imágenes fallaron")
+            continue
+        solape = "-" if r["solapamiento_keywords"] is None else f"{r['solapamiento_keywords']:.2f}"
+        print(f"{r['preset']:>16}: p50 {r['p50_s']}s · p95 {r['p95_s']}s · {r['tokens_por_s']} tok/s · "
+              f"{r['palabras_medias']} palabras · keywords {solape} · pico {r['pico_memoria_mb']} MB")
+    print(f"Informe: {ruta_json} · {ruta_csv}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+Mide el arranque en frío de cada punto de entrada de StockPrep.
+
+Cada medición se hace en un proceso nuevo: importa el módulo (y, para las
+ventanas Qt, crea la ventana con la plataforma "offscreen") y anota si torch
+o transformers llegaron a importarse. Guarda la mediana de varias ejecuciones
+en logs/arranque.json para comparar entre versiones.
+
+Uso:
+    python scripts/medir_arranque.py [--repeticiones 5]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]  # raíz del proyecto (Caption/)
+
+# nombre -> (módulo a importar, código opcional para crear la ventana)
+PUNTOS_DE_ENTRADA = {
+    "main": ("main", None),
+    "centro_de_control": (
+        "gui.main_control_pyside",
+        "from PySide6.QtWidgets import QApplication; app = QApplication([]); "
+        "mod.MainControlPyside()",
+    ),
+    "gestor_base_datos": (
+        "gui.database_gui_pyside",
+        "from PySide6.QtWidgets import QApplication; app = QApplication([]); "
+        "mod.DatabaseManagerAppPyside()",
+    ),
+    "procesador_imagenes": ("gui.modern_gui_win11", None),
+    "batch_engine": ("core.batch_engine", None),
+}
+
+PLANTILLA = """
+import importlib, json, sys, time
+sys.path.insert(0, {root!r}); sys.path.insert(0, {src!r})
+t0 = time.perf_counter()
+mod = importlib.import_module({modulo!r})
+t_import = time.perf_counter() - t0
+{ventana}
+t_total = time.perf_counter() - t0
+print(json.dumps({{"import_s": t_import, "total_s": t_total,
+                  "torch": "torch" in sys.modules, "transformers": "transformers" in sys.modules}}))
+"""
+
+
+def medir(modulo: str, ventana: str | None) -> dict:
+    codigo = PLANTILLA.format(root=str(ROOT), src=str(ROOT / "src"), modulo=modulo, ventana=ventana or "")
+    entorno = {**os.environ, "QT_QPA_PLATFORM": "offscreen"}
+    proceso = subprocess.run([sys.executable, "-c", codigo], capture_output=True, text=True,
+                             cwd=str(ROOT), env=entorno)
+    if proceso.returncode != 0:
+        return {"error": proceso.stderr.strip().splitlines()[-1] if proceso.stderr.strip() else "desconocido"}
+    return json.loads(proceso.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tiempo de arranque en frío por punto de entrada")
+    parser.add_argument("--repeticiones", type=int, default=5)
+    parser.add_argument("--output", default=str(ROOT / "logs" / "arranque.json"))
+    args = parser.parse_args()
+
+    informe = {"fecha": time.strftime("%Y-%m-%d %H:%M:%S"), "python": sys.version.split()[0], "entradas": {}}
+    for nombre, (modulo, ventana) in PUNTOS_DE_ENTRADA.items():
+        muestras = [medir(modulo, ventana) for _ in range(max(1, args.repeticiones))]
+        validas = [m for m in muestras if "error" not in m]
+        if not validas:
+            informe["entradas"][nombre] = {"modulo": modulo, "error": muestras[0]["error"]}
+            print(f"  ❌ {nombre}: {muestras[0]['error']}")
+            continue
+        resumen = {
+            "modulo": modulo,
+            "import_s": round(statistics.median(m["import_s"] for m in validas), 3),
+            "total_s": round(statistics.median(m["total_s"] for m in validas), 3),
+            "importa_torch": any(m["torch"] for m in validas),
+            "importa_transformers": any(m["transformers"] for m in validas),
+        }
+        informe["entradas"][nombre] = resumen
+        aviso = " ⚠️ importa torch" if resumen["importa_torch"] else ""
+        print(f"  ⏱️ {nombre}: {resumen['total_s']}s (import {resumen['import_s']}s){aviso}")
+
+    salida = Path(args.output)
+    salida.parent.mkdir(parents=True, exist_ok=True)
+    salida.write_text(json.dumps(informe, ensure_ascii=False, indent=2), encoding="utf-8")
+    print(f"Informe: {salida}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+"""
+Decodificación asistida (especulativa) con un modelo borrador.
+
+Florence‑2 base propone varios tokens por paso y el modelo grande los verifica
+en una sola pasada del decoder (assisted generation de transformers). En las
+descripciones largas, donde manda el nº de pasos del decoder, reduce mucho las
+pasadas del modelo grande sin cambiar la salida en greedy.
+
+Restricciones de transformers: una fila por llamada y `num_beams=1`. Como el
+borrador tiene otra dimensión oculta, su encoder se ejecuta aparte sobre sus
+propias features de imagen y se pasa como `assistant_encoder_outputs`.
+
+Configuración (settings.yaml):
+
+    modelo:
+      asistente:
+        activado: false
+        ruta: models/Florence-2-base-ft
+        niveles: [medio, largo]
+"""
+import logging
+import threading
+from typing import Dict, Iterable, Optional
+
+from core.model_manager import cargar_config_seccion, crear_model_manager
+from utils.lazy_import import lazy_import
+
+torch = lazy_import("torch")
+
+logger = logging.getLogger(__name__)
+
+
+class AssistedDecoder:
+    """
+    Modelo borrador y estadísticas de aceptación por nivel de detalle.
+
+    Args:
+        model_path: Checkpoint del borrador (Florence‑2 base)
+        niveles: Niveles de detalle que se decodifican con asistencia
+        manager_factory: Crea el gestor del borrador (por defecto `crear_model_manager`)
+    """
+
+    def __init__(self, model_path: str, niveles: Iterable[str] = ("medio", "largo"), manager_factory=None):
+        self.niveles = set(niveles)
+        self.manager = (manager_factory or crear_model_manager)(model_path=model_path)
+        self.desactivado: Optional[str] = None
+        self._lock = threading.Lock()
+        self._stats: Dict[str, Dict[str, float]] = {}
+
+    def aplica(self, detail_level: str) -> bool:
+        return self.desactivado is None and detail_level in self.niveles
+
+    def preparar(self, device, callback=None) -> bool:
+        """Carga el borrador (una vez) en el dispositivo del modelo grande."""
+        with self._lock:
+            if self.manager.model is None:
+                self.manager.device = str(device)
+                if not self.manager.cargar_modelo(callback):
+                    self.desactivar(f"no se pudo cargar el borrador {self.manager.model_id}")
+            return self.desactivado is None
+
+    def desactivar(self, motivo: str):
+        if self.desactivado is None:
+            logger.warning(f"⚠️ Decodificación asistida desactivada: {motivo}")
+        self.desactivado = motivo
+
+    # ------------------------------------------------------------------
+    #  Entradas del borrador
+    # ------------------------------------------------------------------
+    def salidas_encoder(self, pixel_values, input_ids, attention_mask):
+        """Encoder del borrador sobre sus propias features de imagen + prompt."""
+        borrador = self.manager.model
+        pixel_values = pixel_values.to(borrador.device, dtype=borrador.dtype)
+        with torch.no_grad():
+            features = borrador._encode_image(pixel_values)
+            texto = borrador.get_input_embeddings()(input_ids.to(borrador.device))
+            inputs_embeds, _ = borrador._merge_input_ids_with_image_features(features, texto)
+            return borrador.language_model.get_encoder()(
+                inputs_embeds=inputs_embeds, attention_mask=attention_mask.to(borrador.device)
+            )
+
+    def modelo_asistente(self):
+        """Decoder que propone tokens (el language model del borrador)."""
+        return self.manager.model.language_model
+
+    # ------------------------------------------------------------------
+    #  Estadísticas
+    # ------------------------------------------------------------------
+    def contar_propuestas(self):
+        """
+        Envuelve `generate` del borrador para contar rondas y tokens propuestos.
+
+        Cada ronda de assisted generation llama una vez al borrador y el modelo
+        grande añade un token propio, así que aceptados = generados - rondas.
+        Devuelve `(contador, restaurar)`.
+        """
+        asistente = self.modelo_asistente()
+        original = asistente.generate
+        contador = {"rondas": 0, "propuestos": 0}
+
+        def generate_contando(*args, **kwargs):
+            salida = original(*args, **kwargs)
+            secuencias = getattr(salida, "sequences", salida)
+            entrada = kwargs.get("decoder_input_ids")
+            previos = entrada.shape[-1] if entrada is not None else 0
+            contador["rondas"] += 1
+            contador["propuestos"] += max(0, secuencias.shape[-1] - previos)
+            return salida
+
+        asistente.generate = generate_contando
+
+        def restaurar():
+            asistente.generate = original
+
+        return contador, restaurar
+
+    def registrar(self, detail_level: str, generados: int, contador: Dict, segundos: float):
+        with self._lock:
+            s = self._stats.setdefault(
+                detail_level, {"llamadas": 0, "generados": 0, "propuestos": 0, "aceptados": 0, "segundos": 0.0}
+            )
+            s["llamadas"] += 1
+            s["generados"] += generados
+            s["propuestos"] += contador["propuestos"]
+            s["aceptados"] += max(0, min(contador["propuestos"], generados - contador["rondas"]))
+            s["segundos"] += segundos
+
+    def estadisticas(self) -> Dict[str, Dict]:
+        """Por nivel: tasa de aceptación del borrador y tokens/s del modelo grande."""
+        with self._lock:
+            return {
+                nivel: {
+                    "llamadas": int(s["llamadas"]),
+                    "tokens": int(s["generados"]),
+                    "tasa_aceptacion": round(s["aceptados"] / s["propuestos"], 3) if s["propuestos"] else None,
+                    "tokens_por_s": round(s["generados"] / s["segundos"], 1) if s["segundos"] else None,
+                }
+                for nivel, s in self._stats.items()
+            }
+
+    def reiniciar_estadisticas(self):
+        with self._lock:
+            self._stats.clear()
+
+
+def crear_asistente_desde_config() -> Optional[AssistedDecoder]:
+    """Asistente según `modelo.asistente` de settings.yaml, o None si está desactivado."""
+    config = cargar_config_seccion("modelo").get("asistente") or {}
+    if not config.get("activado") or not config.get("ruta"):
+        return None
+    return AssistedDecoder(config["ruta"], config.get("niveles") or ("medio", "largo"))
+
@@ -1,84 +1,508 @@
 """
 Orquestador de procesamiento por lotes con Florence-2
+
+El lote es una cadena de etapas conectadas por colas acotadas:
+
+    descubrir → decodificar → inferir → keywords → archivos → persistir
+
+Cada etapa tiene sus propios hilos (`procesamiento.etapas` en settings.yaml),
+así que los renombrados en disco y las escrituras en la base de datos se
+solapan con la inferencia del siguiente lote. Los callbacks de estado se
+emiten siempre desde el hilo que llama a `run()`.
+
+`status_callback('progress', (procesadas, total))`: `total` es None mientras
+se recorre la carpeta y el nº de imágenes encontradas en cuanto termina (el
+recorrido va por delante de las colas, así que suele conocerse enseguida);
+con un origen en vivo (`procesar`) no se conoce nunca.
+
+Con un `JobJournal` cada imagen queda apuntada en el diario de trabajos y
+`run(carpeta, reanudar=True)` continúa el último lote sin terminar de esa carpeta.
 """
-import os
-from pathlib import Path
+import queue
+from collections import deque
 import shutil
-from typing import Callable, List
+import threading
+from dataclasses import dataclass, field
+from functools import partial
+from itertools import chain
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from core.job_journal import EN_VUELO, PENDIENTE, estado_de_resultado
+from core.model_manager import cargar_config_seccion
+from core.pipeline import FIN, Etapa, Mapeo, por_trabajo, tomar_lote
+from core.prefetch import ImagePrefetcher
+from core.worker_pool import InferenceWorkerPool, resolver_workers
+from utils.image_discovery import descubrir_imagenes, extension_de
+
+# Hilos por etapa si settings.yaml no dice otra cosa
+ETAPAS_POR_DEFECTO = {"keywords": 1, "archivos": 2, "persistir": 1}
+# Con un origen en vivo, cuánto se espera a completar un lote antes de lanzarlo a medias
+ESPERA_LOTE_EN_VIVO_S = 0.1
+
+
+def ruta_libre(carpeta: Path, nombre: str) -> Path:
+    """Ruta en `carpeta` que no pisa otro fichero (añade _1, _2… si hace falta)."""
+    carpeta.mkdir(parents=True, exist_ok=True)
+    ruta = carpeta / nombre
+    n = 1
+    while ruta.exists():
+        ruta = carpeta / f"{Path(nombre).stem}_{n}{Path(nombre).suffix}"
+        n += 1
+    return ruta
+
+
+@dataclass
+class _Trabajo:
+    """Una imagen a su paso por las etapas."""
+    indice: int
+    path: Path
+    item: Optional[Dict] = None       # imagen preparada (hasta la inferencia)
+    resultado: Optional[Dict] = None
+    logs: List[str] = field(default_factory=list)
 
 
 class BatchEngine:
-    def __init__(self, image_processor, status_callback: Callable = None):
+    def __init__(self, image_processor, status_callback: Callable = None,
+                 detail_level: str = "largo", batch_size: int = 4,
+                 prefetch_depth: int = 8, prefetch_workers: int = 2,
+                 prefetch_mode: str = "thread", workers=None, threads_per_worker=None,
+                 db_manager=None, etapas: Optional[Dict[str, int]] = None, journal=None,
+                 carpeta_destino: Optional[str] = None, recursivo: Optional[bool] = None):
         self.image_processor = image_processor
         self.status_callback = status_callback
+        self.detail_level = detail_level
+        # Nº de imágenes que comparten cada llamada a generate()
+        self.batch_size = max(1, int(batch_size))
+        # Decodificación/preprocesado por adelantado ("thread" o "process")
+        self.prefetch_depth = max(self.batch_size, int(prefetch_depth))
+        self.prefetch_workers = prefetch_workers
+        self.prefetch_mode = prefetch_mode
+        # Pool de procesos en CPU: nº de workers ("auto" o entero) y hilos por worker
+        config = cargar_config_seccion("procesamiento")
+        self.workers = workers if workers is not None else config.get("workers", 1)
+        self.threads_per_worker = (threads_per_worker if threads_per_worker is not None
+                                   else config.get("hilos_por_worker", 0))
+        # Incluir las subcarpetas de la carpeta del lote
+        self.recursivo = recursivo if recursivo is not None else config.get("recursivo", True)
+        # Etapa de persistencia: solo si hay base de datos (EnhancedDatabaseManager)
+        self.db_manager = db_manager
+        # Diario de trabajos (JobJournal) para poder reanudar el lote
+        self.journal = journal
+        self.job_id: Optional[str] = None
+        # Si se indica, los ficheros procesados se mueven aquí (renombrados) en vez
+        # de renombrarse en su carpeta; el modo vigilancia lo usa para vaciar la entrada
+        self.carpeta_destino = carpeta_destino
+        self._lock_renombrado = threading.Lock()
+        # Hilos de las etapas posteriores a la inferencia y tamaño de las colas
+        self.etapas = {**ETAPAS_POR_DEFECTO, **(config.get("etapas") or {}), **(etapas or {})}
+        self.tamano_cola = max(1, int(self.etapas.get("cola") or self.prefetch_depth))
         self.stop_processing = False
+        self._eventos: "queue.Queue" = queue.Queue()
+        self._fallo: Optional[BaseException] = None
+        self._origen_vivo = None
 
     def _log(self, message):
         if self.status_callback:
             self.status_callback('log', message)
 
-    def run(self, image_folder_path: str) -> List[dict]:
-        """Procesa todas las imágenes compatibles en una carpeta."""
+    def _emitir(self, tipo: str, dato=None):
+        """Envía un mensaje desde una etapa al hilo que ejecuta el lote."""
+        self._eventos.put((tipo, dato))
+
+    def run(self, image_folder_path: str, reanudar: bool = False, al_resultado: Callable = None,
+            acumular: bool = True) -> List[dict]:
+        """
+        Procesa todas las imágenes compatibles en una carpeta.
+
+        Con `reanudar` y diario de trabajos, continúa el último lote sin
+        terminar de la carpeta (si lo hay) en lugar de empezar de cero.
+        `al_resultado` y `acumular` funcionan como en `procesar()`.
+        """
+        origen = self._origen(image_folder_path, reanudar)
+        if origen is None:
+            return []
+        return self._ejecutar(origen, al_resultado, acumular, carpeta=True)
+
+    def procesar(self, rutas: Iterable, al_resultado: Callable = None, acumular: bool = True) -> List[dict]:
+        """
+        Procesa las rutas según las va entregando `rutas` (por ejemplo un
+        `FolderWatcher`, que no se agota hasta que se detiene), sin diario de
+        trabajos. `al_resultado` recibe cada resultado en el hilo que llama;
+        con `acumular=False` no se guardan y la memoria no crece con el tiempo.
+        Si `rutas` tiene `detener()`, `stop()` la llama para cortar la espera.
+        """
+        self.job_id = None
+        self._origen_vivo = rutas
+        try:
+            return self._ejecutar(enumerate(rutas), al_resultado, acumular)
+        finally:
+            self._origen_vivo = None
+
+    def _ejecutar(self, origen: Iterable[Tuple[int, str]], al_resultado: Callable = None,
+                  acumular: bool = True, carpeta: bool = False) -> List[dict]:
         self.stop_processing = False
-        image_paths = [
-            p for p in Path(image_folder_path).iterdir()
-            if p.suffix.lower() in ['.jpg', '.jpeg', '.png', '.bmp', '.webp']
-        ]
+        self._fallo = None
+        self._eventos = queue.Queue()
+        token = getattr(self.image_processor, "cancel_token", None)
+        if token is not None:
+            token.reiniciar()
+
+        etapas = self._montar_etapas(origen)
+        for etapa in etapas:
+            etapa.iniciar()
+
+        all_results = []
+        procesadas = 0
+        encontradas = None  # total: desconocido hasta que termina el recorrido
+        terminado = False
+        try:
+            while True:
+                evento = self._eventos.get()
+                if evento is FIN:
+                    terminado = True
+                    break
+                if isinstance(evento, _Trabajo):
+                    procesadas += 1
+                    if acumular:
+                        all_results.append(evento)
+                    if self.status_callback:
+                        self.status_callback('progress', (procesadas, encontradas))
+                    for mensaje in evento.logs:
+                        self._log(mensaje)
+                    if al_resultado:
+                        al_resultado(evento.resultado)
+                    continue
+                tipo, dato = evento
+                if tipo == "log":
+                    self._log(dato)
+                elif tipo == "descubiertas":
+                    encontradas = dato
+                    if dato and carpeta:
+                        self._log(f"📂 Se encontraron {dato} imágenes. Iniciando procesamiento...")
+                    if dato and self.status_callback:
+                        self.status_callback('progress', (procesadas, encontradas))
+        finally:
+            if not terminado:
+                self.stop()
+            for etapa in etapas:
+                etapa.esperar()
 
-        if not image_paths:
+        if self.job_id is not None:
+            self.journal.finalizar(self.job_id)
+        if self._fallo is not None:
+            raise self._fallo
+        if encontradas == 0 and carpeta:
             self._log("❌ No se encontraron imágenes compatibles en la carpeta.")
             return []
 
-        self._log(f"📂 Se encontraron {len(image_paths)} imágenes. Iniciando procesamiento...")
-        all_results = []
+        if self.stop_processing:
+            self._log("⏹️ Procesamiento detenido por el usuario.")
+        else:
+            self._log("✅ ¡Procesamiento de lote completado!")
 
-        for i, path in enumerate(image_paths):
-            if self.stop_processing:
-                self._log("⏹️ Procesamiento detenido por el usuario.")
-                break
-
-            if self.status_callback:
-                self.status_callback('progress', (i + 1, len(image_paths)))
-
-            self._log(f"🖼️ Procesando: {path.name}")
-
-            resultado = self.image_processor.procesar_imagen(str(path))
-            resultado['archivo_original'] = path.name
-            resultado['ruta_original'] = str(path)
-
-            if not resultado.get("error"):
-                # Usar keywords ya calculadas si existen; solo extraer si faltan
-                if not resultado.get("keywords"):
-                    keywords = self.image_processor.extraer_keywords(resultado)
-                    resultado['keywords'] = keywords
-
-                # Renombrar archivo si hay descripción
-                descripcion = resultado.get("descripcion", "").strip()
-                if descripcion:
-                    nuevo_nombre = descripcion.split('.')[0][:70].replace(' ', '_').replace('/', '-') + path.suffix.lower()
-                    nuevo_path = path.parent / nuevo_nombre
-                    try:
-                        shutil.move(str(path), str(nuevo_path))
-                        resultado['archivo_renombrado'] = nuevo_nombre
-                        resultado['ruta_renombrada'] = str(nuevo_path)
-                        self._log(f"  ➡ Archivo renombrado a: {nuevo_nombre}")
-                    except Exception as e:
-                        self._log(f"  ⚠️ No se pudo renombrar: {e}")
-
-                self._log(f"  ✍️ Descripción: {descripcion[:80]}...")
-                self._log(f"  🌐 Keywords: {', '.join(resultado.get('keywords', []))}")
+        self._log_estadisticas()
+        # Las etapas con varios hilos pueden reordenar: se devuelve en el orden de entrada
+        return [t.resultado for t in sorted(all_results, key=lambda t: t.indice)]
+
+    # ------------------------------------------------------------------
+    #  Montaje de las etapas
+    # ------------------------------------------------------------------
+    def _origen(self, image_folder_path: str, reanudar: bool) -> Optional[Iterable[Tuple[int, str]]]:
+        """`(indice, ruta)` a procesar: el lote reanudado, o la carpeta (apuntándola en el diario)."""
+        self.job_id = None
+        if self.journal is None:
+            return enumerate(self._descubrir(image_folder_path))
+
+        # Rutas absolutas: al reanudar se comparan con las ya apuntadas
+        carpeta = str(Path(image_folder_path).resolve())
+        rutas = self._descubrir(carpeta)
+        job_id = self.journal.trabajo_pendiente(carpeta, self.detail_level) if reanudar else None
+        if job_id is None:
+            self.job_id = self.journal.crear_trabajo(carpeta, self.detail_level)
+            return self.journal.registrar_entradas(self.job_id, rutas)
+
+        self.job_id = job_id
+        pendientes = self.journal.reanudar(job_id)
+        hechas = sum(n for estado, n in self.journal.resumen(job_id).items()
+                     if estado not in (PENDIENTE, EN_VUELO))
+        if self.journal.descubierto(job_id):
+            if not pendientes:
+                self.journal.finalizar(job_id)
+                self._log(f"✅ El trabajo {job_id} ya estaba terminado ({hechas} imágenes).")
+                return None
+            self._log(f"♻️ Reanudando el trabajo {job_id}: {len(pendientes)} pendientes, {hechas} ya procesadas")
+            return pendientes
+        # El lote se cortó antes de recorrer toda la carpeta: lo apuntado primero y
+        # después el resto, saltando lo que el diario ya tiene
+        self._log(f"♻️ Reanudando el trabajo {job_id}: {len(pendientes)} pendientes, {hechas} ya procesadas; "
+                  "se completa la lista de la carpeta")
+        return chain(pendientes, self.journal.registrar_entradas(job_id, rutas))
+
+    def _montar_etapas(self, origen: Iterable[Tuple[int, str]]) -> List[Etapa]:
+        """Crea las etapas y sus colas, de `descubrir` a la última."""
+        funciones = [("descubrir", lambda _: self._enumerar(origen), 1)]
+        if self._usar_pool():
+            # Los workers del pool decodifican e infieren en sus procesos
+            funciones.append(("inferir", self._inferir_en_pool, 1))
+        else:
+            # El prefetcher reparte la decodificación en su propio pool de hilos/procesos
+            funciones.append(("decodificar", self._decodificar, 1))
+            scheduler = getattr(self.image_processor, "scheduler", None)
+            if scheduler is not None:
+                # Con continuous batching, una imagen por hilo y el planificador las agrupa
+                funciones.append(("inferir", partial(self._inferir, tamano=1), scheduler.max_lote))
             else:
-                self._log(f"  ❌ Error: {resultado['error']}")
+                funciones.append(("inferir", partial(self._inferir, tamano=self.batch_size), 1))
+        funciones.append(("keywords", por_trabajo(self._keywords), self.etapas["keywords"]))
+        funciones.append(("archivos", por_trabajo(self._archivos), self.etapas["archivos"]))
+        if self.db_manager is not None:
+            funciones.append(("persistir", por_trabajo(self._persistir), self.etapas["persistir"]))
+        if self.job_id is not None:
+            funciones.append(("diario", por_trabajo(self._apuntar), 1))
 
-            all_results.append(resultado)
+        etapas, entrada = [], None
+        for i, (nombre, funcion, workers) in enumerate(funciones):
+            # La última etapa entrega en la cola de eventos (sin límite: la vacía run())
+            ultima = i == len(funciones) - 1
+            salida = self._eventos if ultima else queue.Queue(maxsize=self.tamano_cola)
+            etapas.append(Etapa(nombre, funcion, entrada, salida, workers, al_fallar=self._al_fallar))
+            entrada = salida
+        return etapas
 
-        if not self.stop_processing:
-            self._log("✅ ¡Procesamiento de lote completado!")
+    def _al_fallar(self, nombre: str, exc: BaseException):
+        if self._fallo is None:
+            self._fallo = exc
+        self.stop()
+
+    # ------------------------------------------------------------------
+    #  Etapas
+    # ------------------------------------------------------------------
+    def _descubrir(self, image_folder_path: str) -> Iterator[str]:
+        # Sin la carpeta de destino: lo ya procesado no vuelve a entrar
+        return descubrir_imagenes(image_folder_path, recursivo=self.recursivo,
+                                  excluir=(self.carpeta_destino,))
+
+    def _enumerar(self, origen: Iterable[Tuple[int, str]]) -> Iterator[_Trabajo]:
+        """
+        Recorre el origen en un hilo aparte, sin el límite de las colas, para
+        conocer pronto el total (y apuntar la lista en el diario); las rutas
+        pasan a la siguiente etapa según esta las acepta.
+        """
+        rutas: "queue.Queue" = queue.Queue()
+
+        def explorar():
+            try:
+                n = 0
+                for elemento in origen:
+                    if self.stop_processing:
+                        break
+                    rutas.put(elemento)
+                    n += 1
+                else:
+                    self._emitir("descubiertas", n)
+            except Exception as exc:
+                rutas.put(exc)
+            finally:
+                rutas.put(FIN)
+
+        hilo = threading.Thread(target=explorar, name="etapa-explorar", daemon=True)
+        hilo.start()
+        try:
+            while True:
+                elemento = rutas.get()
+                if elemento is FIN or self.stop_processing:
+                    return
+                if isinstance(elemento, Exception):
+                    raise elemento
+                indice, path = elemento
+                yield _Trabajo(indice, Path(path))
+        finally:
+            hilo.join()
+
+    def _decodificar(self, trabajos: Iterator[_Trabajo]) -> Iterator[_Trabajo]:
+        """Entrega los trabajos con la imagen preparada, en orden."""
+        pendientes = deque()
+
+        def ruta(trabajo):
+            if self.stop_processing:
+                raise StopIteration  # fin del flujo para el prefetcher
+            pendientes.append(trabajo)
+            return str(trabajo.path)
+
+        # Mapeo conserva la lectura sin bloqueo de la cola: el prefetcher entrega
+        # lo que ya tiene sin esperar a que lleguen más rutas
+        prefetcher = ImagePrefetcher(
+            Mapeo(trabajos, ruta), self.image_processor, depth=self.prefetch_depth,
+            workers=self.prefetch_workers, mode=self.prefetch_mode
+        )
+        with prefetcher:
+            for item in prefetcher:
+                trabajo = pendientes.popleft()
+                if self.stop_processing:
+                    return
+                trabajo.item = item
+                yield trabajo
+
+    def _espera_lote(self) -> Optional[float]:
+        """Plazo para completar un lote: sin límite en una carpeta, corto con un origen en vivo."""
+        return ESPERA_LOTE_EN_VIVO_S if self._origen_vivo is not None else None
+
+    def _inferir(self, trabajos: Iterator[_Trabajo], tamano: int) -> Iterator[_Trabajo]:
+        espera = self._espera_lote()
+        while True:
+            lote = tomar_lote(trabajos, tamano, espera)
+            if not lote or self.stop_processing:
+                return
+            if self.job_id is not None:
+                self.journal.marcar_en_vuelo(
+                    self.job_id, [(t.indice, str(t.path), t.item.get("hash")) for t in lote]
+                )
+            resultados = self.image_processor.process_prepared([t.item for t in lote], self.detail_level)
+            for trabajo, resultado in zip(lote, resultados):
+                trabajo.item = None  # liberar la imagen en cuanto hay resultado
+                yield self._inferido(trabajo, resultado)
+
+    def _inferir_en_pool(self, trabajos: Iterator[_Trabajo]) -> Iterator[_Trabajo]:
+        pool = InferenceWorkerPool(self.workers, self.threads_per_worker, chunk_size=self.batch_size)
+        self._emitir("log", f"⚙️ Pool de CPU: {pool.workers} workers x {pool.threads_per_worker} hilos")
+        pendientes = deque()
+
+        def ruta(trabajo):
+            if self.stop_processing:
+                raise StopIteration  # no se encolan más lotes en el pool
+            pendientes.append(trabajo)
+            if self.job_id is not None:
+                self.journal.marcar_en_vuelo(self.job_id, [(trabajo.indice, str(trabajo.path), None)])
+            return str(trabajo.path)
+
+        with pool:
+            # El pool para entre lotes: el lote en curso termina y los encolados se cancelan
+            for paths, resultados in pool.imap(Mapeo(trabajos, ruta), self.detail_level,
+                                               espera_s=self._espera_lote()):
+                for resultado in resultados:
+                    yield self._inferido(pendientes.popleft(), resultado)
+                if self.stop_processing:
+                    return
+
+    @staticmethod
+    def _inferido(trabajo: _Trabajo, resultado: Dict) -> _Trabajo:
+        trabajo.resultado = resultado
+        trabajo.logs.append(f"🖼️ Procesado: {trabajo.path.name}")
+        return trabajo
+
+    def _keywords(self, trabajo: _Trabajo) -> _Trabajo:
+        resultado = trabajo.resultado
+        resultado['archivo_original'] = trabajo.path.name
+        resultado['ruta_original'] = str(trabajo.path)
+
+        if resultado.get("interrumpido") and not resultado.get("error"):
+            trabajo.logs.append(f"  ⏱️ Generación truncada por límite de tiempo: {trabajo.path.name}")
+
+        # Usar keywords ya calculadas si existen; solo extraer si faltan
+        if not resultado.get("error") and not resultado.get("keywords"):
+            resultado['keywords'] = self.image_processor.extraer_keywords(resultado)
+        return trabajo
+
+    def _archivos(self, trabajo: _Trabajo) -> _Trabajo:
+        """Renombra el archivo según la descripción (o lo mueve a `carpeta_destino`)."""
+        resultado, path = trabajo.resultado, trabajo.path
+        if resultado.get("error"):
+            trabajo.logs.append(f"  ❌ Error: {resultado['error']}")
+            return trabajo
+
+        descripcion = resultado.get("descripcion", "").strip()
+        if descripcion or self.carpeta_destino:
+            nuevo_nombre = path.name
+            if descripcion:
+                # Extensión según el contenido: el descubrimiento admite ficheros sin ella o con otra
+                nuevo_nombre = descripcion.split('.')[0][:70].replace(' ', '_').replace('/', '-') + extension_de(str(path))
+            try:
+                if self.carpeta_destino:
+                    nuevo_path = self._mover(path, nuevo_nombre, Path(self.carpeta_destino))
+                elif path.name != nuevo_nombre:
+                    # Dos imágenes con la misma descripción no deben pisarse
+                    nuevo_path = self._mover(path, nuevo_nombre, path.parent)
+                else:
+                    nuevo_path = path
+                nuevo_nombre = nuevo_path.name
+                resultado['archivo_renombrado'] = nuevo_nombre
+                resultado['ruta_renombrada'] = str(nuevo_path)
+                if self.job_id is not None:
+                    # En el diario antes que nada: si el proceso cae ahora, reanudar encuentra el fichero
+                    self.journal.registrar_ruta(self.job_id, trabajo.indice, str(nuevo_path))
+                trabajo.logs.append(f"  ➡ Archivo renombrado a: {nuevo_nombre}")
+            except Exception as e:
+                trabajo.logs.append(f"  ⚠️ No se pudo renombrar: {e}")
+
+        trabajo.logs.append(f"  ✍️ Descripción: {descripcion[:80]}...")
+        trabajo.logs.append(f"  🌐 Keywords: {', '.join(resultado.get('keywords', []))}")
+        return trabajo
+
+    def _mover(self, path: Path, nombre: str, carpeta: Path) -> Path:
+        """Mueve `path` a `carpeta` con el primer nombre libre (el lock evita carreras entre hilos)."""
+        with self._lock_renombrado:
+            nuevo_path = ruta_libre(carpeta, nombre)
+            shutil.move(str(path), str(nuevo_path))
+        return nuevo_path
+
+    def _persistir(self, trabajo: _Trabajo) -> _Trabajo:
+        """Guarda el resultado en la base de datos."""
+        resultado = trabajo.resultado
+        if resultado.get("error"):
+            return trabajo
+        ruta = resultado.get("ruta_renombrada") or resultado["ruta_original"]
+        imagen_id = self.db_manager.obtener_o_crear_registro_id(ruta)
+        if imagen_id is None or not self.db_manager.actualizar_procesamiento_completo(
+                imagen_id, resultado, resultado.get("archivo_renombrado"), None):
+            trabajo.logs.append(f"  ⚠️ No se pudo guardar en la base de datos: {trabajo.path.name}")
+        return trabajo
+
+    def _apuntar(self, trabajo: _Trabajo) -> _Trabajo:
+        """Cierra la imagen en el diario de trabajos (última etapa)."""
+        resultado = trabajo.resultado
+        self.journal.marcar(self.job_id, trabajo.indice, estado_de_resultado(resultado), resultado.get("error"))
+        return trabajo
+
+    # ------------------------------------------------------------------
+    def _usar_pool(self) -> bool:
+        """El pool de procesos solo compensa en CPU y con más de un worker."""
+        if self.image_processor.manager.device != "cpu":
+            return False
+        return resolver_workers(self.workers, self.threads_per_worker)[0] > 1
+
+    def _log_estadisticas(self):
+        scheduler = getattr(self.image_processor, "scheduler", None)
+        if scheduler is not None:
+            stats = scheduler.estadisticas()
+            self._log(f"🔀 Continuous batching: {stats['tokens']} tokens en {stats['pasos']} pasos "
+                      f"(ocupación media {stats['ocupacion_media']})")
+
+        asistente = getattr(self.image_processor, "asistente", None)
+        if asistente is not None:
+            for nivel, stats in asistente.estadisticas().items():
+                self._log(f"🤝 Decodificación asistida [{nivel}]: aceptación {stats['tasa_aceptacion']}, "
+                          f"{stats['tokens_por_s']} tokens/s en {stats['llamadas']} imágenes")
 
-        return all_results
+        cache = getattr(self.image_processor, "cache", None)
+        if cache is not None:
+            stats = cache.estadisticas()
+            self._log(f"🗃️ Caché de inferencia: {stats['hits']} aciertos, {stats['misses']} fallos "
+                      f"({stats['entradas']} entradas, {stats['tamano_mb']} MB)")
 
     def stop(self):
+        """
+        Detiene el lote. Con el modelo en este proceso, el `generate` en curso se
+        corta en el siguiente token; con el pool de workers se para entre lotes.
+        Las imágenes ya inferidas terminan sus etapas (keywords, renombrado, base de datos).
+        """
         self.stop_processing = True
+        token = getattr(self.image_processor, "cancel_token", None)
+        if token is not None:
+            token.cancelar()
+        detener_origen = getattr(self._origen_vivo, "detener", None)
+        if detener_origen is not None:
+            detener_origen()
 
     # ------------------------------------------------------------------
     # Alias de compatibilidad con documentación antigua
@@ -0,0 +1,40 @@
+"""
+Cancelación cooperativa de la inferencia.
+
+`CancellationToken` se comparte entre quien procesa (ImageProcessor) y quien
+pide parar (BatchEngine.stop, botones de la GUI). El decoder lo consulta en
+cada paso a través de `generation_utils.CriterioInterrupcion`, así que parar
+no espera a que termine una beam search de 2048 tokens.
+
+Sin dependencias de torch: se puede importar desde la GUI sin coste.
+"""
+import threading
+
+# Motivos de interrupción que se anotan en el resultado de la imagen
+MOTIVO_CANCELADO = "cancelado"
+MOTIVO_TIEMPO = "tiempo_agotado"
+
+
+class CancellationToken:
+    """Señal de cancelación compartida entre el hilo que genera y el que la pide."""
+
+    def __init__(self):
+        self._evento = threading.Event()
+
+    def cancelar(self):
+        self._evento.set()
+
+    def reiniciar(self):
+        self._evento.clear()
+
+    @property
+    def cancelado(self) -> bool:
+        return self._evento.is_set()
+
+
+class GeneracionInterrumpida(Exception):
+    """`generate` se detuvo por cancelación o por límite de tiempo en modo abortar."""
+
+    def __init__(self, motivo: str):
+        super().__init__(motivo)
+        self.motivo = motivo
@@ -0,0 +1,318 @@
+"""
+Planificador de continuous batching para el decoder de Florence‑2.
+
+Con lotes estáticos, un `<CAPTION>` de 20 tokens espera con padding a que
+termine un `<MORE_DETAILED_CAPTION>` de 600. `ContinuousBatchScheduler`
+mantiene un lote vivo en un hilo propio: en cada paso del decoder avanza
+todas las secuencias activas, retira las que terminan y admite solicitudes
+nuevas en los huecos, vengan de `BatchEngine` o de la GUI.
+
+Detalles:
+
+• El encoder (imagen + prompt) lo ejecuta quien envía la solicitud; el
+  planificador solo hace pasos de decoder.
+• La KV‑cache del lote se guarda alineada a la derecha (padding a la
+  izquierda, enmascarado). Solo se reconstruye cuando cambia la composición
+  del lote; entre cambios crece en su sitio.
+• Cada fila tiene su propia longitud real: la posición aprendida que aplica
+  el decoder (la de la cache con padding) se corrige por fila sumando la
+  diferencia de embeddings de posición a `decoder_inputs_embeds`.
+• Solo búsqueda voraz o muestreo (sin beams), con los procesadores de logits
+  de cada solicitud aplicados por fila.
+"""
+import logging
+import queue
+import threading
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+from utils.lazy_import import lazy_import
+
+torch = lazy_import("torch")
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class SolicitudDecoder:
+    """Una secuencia a decodificar: salida del encoder, parámetros y criterio de parada."""
+    encoder_hidden: "torch.Tensor"      # (S, d)
+    encoder_mask: "torch.Tensor"        # (S,)
+    params: Dict
+    criterio: Optional[object] = None   # CriterioInterrupcion u otro StoppingCriteria
+    futuro: Future = field(default_factory=Future)
+
+
+class _Secuencia:
+    """Estado de una solicitud admitida en el lote."""
+
+    def __init__(self, solicitud: SolicitudDecoder, procesadores, max_nuevos: int, decoder_start: int):
+        self.solicitud = solicitud
+        self.procesadores = procesadores
+        self.max_nuevos = max_nuevos
+        self.do_sample = bool(solicitud.params.get("do_sample"))
+        self.ids = torch.tensor([[decoder_start]], dtype=torch.long)
+        # KV propias por capa: (self_k, self_v, cross_k, cross_v), sin padding
+        self.kv = None
+        self.terminada = False
+
+
+class ContinuousBatchScheduler:
+    """
+    Lote vivo de decodificación sobre el language model de un `Florence2Manager`.
+
+    Args:
+        manager: Gestor con el modelo Florence‑2 (PyTorch) cargado
+        max_lote: Secuencias activas como máximo en cada paso del decoder
+    """
+
+    def __init__(self, manager, max_lote: int = 8):
+        self.manager = manager
+        self.max_lote = max(1, int(max_lote))
+        self._cola: "queue.Queue[SolicitudDecoder]" = queue.Queue()
+        self._activas: List[_Secuencia] = []
+        self._lote = None   # estado del lote con padding (ver _reconstruir)
+        self._hilo: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._parar = threading.Event()
+        self.pasos = 0
+        self.tokens = 0
+
+    # ------------------------------------------------------------------
+    #  API
+    # ------------------------------------------------------------------
+    def enviar(self, solicitud: SolicitudDecoder) -> Future:
+        """Encola una secuencia; el futuro devuelve sus ids `(1, n)` como `generate`."""
+        self._arrancar()
+        self._cola.put(solicitud)
+        return solicitud.futuro
+
+    def cerrar(self):
+        self._parar.set()
+        self._cola.put(None)
+        if self._hilo is not None:
+            self._hilo.join()
+            self._hilo = None
+
+    def estadisticas(self) -> Dict:
+        return {
+            "pasos": self.pasos,
+            "tokens": self.tokens,
+            "ocupacion_media": round(self.tokens / self.pasos, 2) if self.pasos else None,
+        }
+
+    def _arrancar(self):
+        with self._lock:
+            if self._hilo is None or not self._hilo.is_alive():
+                self._parar.clear()
+                self._hilo = threading.Thread(target=self._bucle, name="continuous-batching", daemon=True)
+                self._hilo.start()
+
+    # ------------------------------------------------------------------
+    #  Bucle
+    # ------------------------------------------------------------------
+    def _bucle(self):
+        while not self._parar.is_set():
+            nuevas = self._admitir(bloquear=not self._activas)
+            if self._parar.is_set():
+                break
+            try:
+                with torch.no_grad():
+                    if nuevas:
+                        self._prefill(nuevas)
+                    if self._activas:
+                        self._paso()
+            except Exception as exc:
+                logger.error(f"❌ Continuous batching: {exc}")
+                for secuencia in self._activas + nuevas:
+                    if not secuencia.solicitud.futuro.done():
+                        secuencia.solicitud.futuro.set_exception(exc)
+                self._activas, self._lote = [], None
+
+        for secuencia in self._activas:
+            secuencia.solicitud.futuro.cancel()
+        self._activas, self._lote = [], None
+
+    def _admitir(self, bloquear: bool) -> List[_Secuencia]:
+        """Saca de la cola tantas solicitudes como huecos haya en el lote."""
+        nuevas = []
+        while len(self._activas) + len(nuevas) < self.max_lote:
+            try:
+                solicitud = self._cola.get(block=bloquear and not nuevas)
+            except queue.Empty:
+                break
+            if solicitud is None:
+                break
+            if solicitud.futuro.set_running_or_notify_cancel():
+                nuevas.append(self._nueva_secuencia(solicitud))
+        return nuevas
+
+    def _nueva_secuencia(self, solicitud: SolicitudDecoder) -> _Secuencia:
+        from core.generation_utils import crear_procesadores_logits
+
+        lm = self.manager.model.language_model
+        config = lm.config
+        generacion = getattr(lm, "generation_config", config)
+        params = solicitud.params
+        procesadores = crear_procesadores_logits(
+            config.eos_token_id, getattr(generacion, "forced_bos_token_id", None),
+            extra=params.get("logits_processor"), **{k: v for k, v in params.items() if k != "logits_processor"}
+        )
+        # El decoder tiene posiciones aprendidas: no se puede pasar de max_position_embeddings
+        max_nuevos = min(int(params.get("max_new_tokens", 1024)), config.max_position_embeddings - 1)
+        return _Secuencia(solicitud, procesadores, max_nuevos, config.decoder_start_token_id)
+
+    # ------------------------------------------------------------------
+    #  Pasos del decoder
+    # ------------------------------------------------------------------
+    def _prefill(self, nuevas: List[_Secuencia]):
+        """Primer paso de las secuencias admitidas (token de inicio, sin cache) y unión al lote."""
+        lm = self.manager.model.language_model
+        device = lm.device
+        hidden, mask = self._encoder_con_padding(nuevas)
+        salida = lm(
+            encoder_outputs=(hidden,), attention_mask=mask,
+            decoder_input_ids=torch.cat([s.ids for s in nuevas]).to(device),
+            use_cache=True, return_dict=True,
+        )
+        past = self._legacy(salida.past_key_values)
+        for fila, secuencia in enumerate(nuevas):
+            largo_enc = int(secuencia.solicitud.encoder_mask.shape[0])
+            secuencia.kv = [
+                (k[fila:fila + 1], v[fila:fila + 1], ck[fila:fila + 1, :, :largo_enc], cv[fila:fila + 1, :, :largo_enc])
+                for k, v, ck, cv in past
+            ]
+        self._avanzar(nuevas, salida.logits[:, -1, :])
+        self._activas = self._retirar(self._extraer_kv() + nuevas)
+        self._lote = None
+
+    def _paso(self):
+        """Un token más para todas las secuencias activas."""
+        if self._lote is None:
+            self._reconstruir()
+        lm = self.manager.model.language_model
+        decoder = lm.get_decoder()
+        lote = self._lote
+        device = lm.device
+
+        # Embedding del último token + corrección de posición por fila
+        ultimos = torch.cat([s.ids[:, -1:] for s in self._activas]).to(device)
+        embeds = decoder.embed_tokens(ultimos) * getattr(decoder, "embed_scale", 1.0)
+        posiciones = decoder.embed_positions
+        offset = getattr(posiciones, "offset", 2)
+        reales = torch.tensor([s.ids.shape[1] - 1 for s in self._activas], device=device)
+        largo_cache = lote["mask_dec"].shape[1]
+        correccion = posiciones.weight[reales + offset] - posiciones.weight[largo_cache + offset]
+        embeds = embeds + correccion.unsqueeze(1).to(embeds.dtype)
+
+        mask_dec = torch.cat([lote["mask_dec"], torch.ones_like(lote["mask_dec"][:, :1])], dim=1)
+        salida = lm(
+            encoder_outputs=(lote["hidden"],), attention_mask=lote["mask_enc"],
+            decoder_inputs_embeds=embeds, decoder_attention_mask=mask_dec,
+            past_key_values=lote["past"], use_cache=True, return_dict=True,
+        )
+        lote["past"] = self._legacy(salida.past_key_values)
+        lote["mask_dec"] = mask_dec
+
+        self._avanzar(self._activas, salida.logits[:, -1, :])
+        if any(s.terminada for s in self._activas):
+            self._activas = self._retirar(self._extraer_kv())
+            self._lote = None
+
+    def _avanzar(self, secuencias: List[_Secuencia], logits):
+        """Aplica los procesadores de cada fila, elige el siguiente token y marca las terminadas."""
+        eos = self.manager.model.language_model.config.eos_token_id
+        self.pasos += 1
+        self.tokens += len(secuencias)
+        for fila, secuencia in enumerate(secuencias):
+            ids = secuencia.ids.to(logits.device)
+            scores = secuencia.procesadores(ids, logits[fila:fila + 1].float())
+            if secuencia.do_sample:
+                siguiente = torch.multinomial(torch.softmax(scores, dim=-1), num_samples=1)
+            else:
+                siguiente = scores.argmax(dim=-1, keepdim=True)
+            secuencia.ids = torch.cat([secuencia.ids, siguiente.cpu()], dim=1)
+
+            criterio = secuencia.solicitud.criterio
+            secuencia.terminada = (
+                int(siguiente) == eos
+                or secuencia.ids.shape[1] - 1 >= secuencia.max_nuevos
+                or (criterio is not None and bool(torch.as_tensor(criterio(secuencia.ids, scores)).all()))
+            )
+
+    def _retirar(self, secuencias: List[_Secuencia]) -> List[_Secuencia]:
+        """Entrega los resultados de las terminadas y devuelve las que siguen."""
+        siguen = []
+        for secuencia in secuencias:
+            if secuencia.terminada:
+                secuencia.kv = None
+                secuencia.solicitud.futuro.set_result(secuencia.ids)
+            else:
+                siguen.append(secuencia)
+        return siguen
+
+    # ------------------------------------------------------------------
+    #  KV‑cache
+    # ------------------------------------------------------------------
+    @staticmethod
+    def _legacy(past):
+        return past.to_legacy_cache() if hasattr(past, "to_legacy_cache") else past
+
+    def _extraer_kv(self) -> List[_Secuencia]:
+        """Recupera del lote con padding la KV propia de cada secuencia activa."""
+        if self._lote is not None:
+            for fila, secuencia in enumerate(self._activas):
+                largo = secuencia.ids.shape[1] - 1
+                secuencia.kv = [
+                    (k[fila:fila + 1, :, -largo:], v[fila:fila + 1, :, -largo:], ck, cv)
+                    for (k, v, _, _), (_, _, ck, cv) in zip(self._lote["past"], secuencia.kv)
+                ]
+        return self._activas
+
+    def _encoder_con_padding(self, secuencias: List[_Secuencia]):
+        """Salidas del encoder apiladas con padding a la derecha y su máscara."""
+        device = self.manager.model.language_model.device
+        largo = max(s.solicitud.encoder_hidden.shape[0] for s in secuencias)
+        hidden, mask = [], []
+        for s in secuencias:
+            h, m = s.solicitud.encoder_hidden.to(device), s.solicitud.encoder_mask.to(device)
+            falta = largo - h.shape[0]
+            hidden.append(torch.nn.functional.pad(h, (0, 0, 0, falta)))
+            mask.append(torch.nn.functional.pad(m.long(), (0, falta)))
+        return torch.stack(hidden), torch.stack(mask)
+
+    def _reconstruir(self):
+        """Lote con padding: self‑KV a la izquierda, cross‑KV y encoder a la derecha."""
+        secuencias = self._activas
+        hidden, mask_enc = self._encoder_con_padding(secuencias)
+        largo_enc = hidden.shape[1]
+        largo_dec = max(s.ids.shape[1] - 1 for s in secuencias)
+
+        past = []
+        for capa in range(len(secuencias[0].kv)):
+            ks, vs, cks, cvs = [], [], [], []
+            for s in secuencias:
+                k, v, ck, cv = s.kv[capa]
+                izquierda = largo_dec - k.shape[2]
+                ks.append(torch.nn.functional.pad(k, (0, 0, izquierda, 0)))
+                vs.append(torch.nn.functional.pad(v, (0, 0, izquierda, 0)))
+                derecha = largo_enc - ck.shape[2]
+                cks.append(torch.nn.functional.pad(ck, (0, 0, 0, derecha)))
+                cvs.append(torch.nn.functional.pad(cv, (0, 0, 0, derecha)))
+            past.append((torch.cat(ks), torch.cat(vs), torch.cat(cks), torch.cat(cvs)))
+
+        mask_dec = torch.zeros((len(secuencias), largo_dec), dtype=torch.long, device=hidden.device)
+        for fila, s in enumerate(secuencias):
+            mask_dec[fila, largo_dec - (s.ids.shape[1] - 1):] = 1
+        self._lote = {"past": tuple(past), "hidden": hidden, "mask_enc": mask_enc, "mask_dec": mask_dec}
+
+
+def crear_scheduler_desde_config(manager) -> Optional[ContinuousBatchScheduler]:
+    """Planificador según `procesamiento.continuous_batching`, o None si está desactivado."""
+    from core.model_manager import cargar_config_seccion
+
+    config = cargar_config_seccion("procesamiento").get("continuous_batching") or {}
+    if not config.get("activado"):
+        return None
+    return ContinuousBatchScheduler(manager, config.get("max_lote", 8))
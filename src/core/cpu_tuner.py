@@ -0,0 +1,178 @@
+"""
+Autoajuste de hilos de CPU y calentamiento del modelo al cargarlo.
+
+En CPU el rendimiento de Florence‑2 depende mucho de `torch.set_num_threads`
+y la primera llamada a `generate` paga la inicialización de kernels. Al cargar:
+
+• si ya hay una calibración para esta máquina y este modelo, se aplica
+• si no, se prueba cada configuración candidata sobre una imagen sintética,
+  se elige la de más imágenes/s y se guarda en `modelo.ruta_ajuste_cpu`
+• en ambos casos se hace una pasada de calentamiento
+
+Los hilos inter-op solo se pueden fijar antes del primer trabajo paralelo del
+proceso, así que no se calibran: se aplica `interop` guardado (1 por defecto,
+`generate` es secuencial) y se ignora si el proceso ya no lo admite.
+"""
+import hashlib
+import json
+import logging
+import os
+import platform
+import statistics
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from utils.lazy_import import lazy_import
+
+torch = lazy_import("torch")
+
+logger = logging.getLogger(__name__)
+
+# Tarea y longitud de la pasada de calibración (corta, pero con decoder)
+TAREA_CALIBRACION = "<CAPTION>"
+TOKENS_CALIBRACION = 16
+LADO_IMAGEN_CALIBRACION = 768
+
+
+def nucleos_disponibles() -> int:
+    """Núcleos que puede usar este proceso (respeta taskset / cgroups)."""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def huella_maquina() -> str:
+    """Identifica el equipo: modelo de CPU, núcleos utilizables, arquitectura y versión de torch."""
+    cpu = platform.processor()
+    try:
+        with open("/proc/cpuinfo", "r", encoding="utf-8") as f:
+            for linea in f:
+                if linea.startswith("model name"):
+                    cpu = linea.split(":", 1)[1].strip()
+                    break
+    except OSError:
+        pass
+    return f"{cpu}|{nucleos_disponibles()}|{platform.machine()}|torch {torch.__version__}"
+
+
+def configuraciones_candidatas(nucleos: Optional[int] = None) -> List[int]:
+    """Hilos intra-op a probar: potencias de 2 hasta los núcleos, más la mitad y el total."""
+    nucleos = nucleos or nucleos_disponibles()
+    candidatas = {nucleos, max(1, nucleos // 2)}
+    hilos = 2
+    while hilos < nucleos:
+        candidatas.add(hilos)
+        hilos *= 2
+    return sorted(candidatas)
+
+
+def _clave(manager) -> str:
+    firma = hashlib.sha1(manager.firma_modelo().encode("utf-8")).hexdigest()[:12]
+    return f"{huella_maquina()}|{Path(manager.model_id).name}|{firma}"
+
+
+def _leer(ruta: Path) -> Dict:
+    try:
+        return json.loads(ruta.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+
+
+def _entradas_sinteticas(manager) -> Dict:
+    """Imagen con degradado (no uniforme, para no favorecer atajos) lista para `generate`."""
+    from PIL import Image
+
+    lado = LADO_IMAGEN_CALIBRACION
+    imagen = Image.linear_gradient("L").resize((lado, lado)).convert("RGB")
+    entradas = manager.processor(text=[TAREA_CALIBRACION], images=[imagen], return_tensors="pt")
+    modelo = manager.model
+    return {
+        "input_ids": entradas["input_ids"].to(modelo.device),
+        "pixel_values": entradas["pixel_values"].to(modelo.device, modelo.dtype),
+    }
+
+
+def _pasada(manager, entradas: Dict) -> float:
+    t0 = time.perf_counter()
+    with torch.no_grad():
+        manager.model.generate(
+            **entradas, max_new_tokens=TOKENS_CALIBRACION, num_beams=1, do_sample=False,
+        )
+    return time.perf_counter() - t0
+
+
+def aplicar(ajuste: Dict):
+    """Fija los hilos del ajuste en este proceso."""
+    torch.set_num_threads(int(ajuste["hilos"]))
+    interop = int(ajuste.get("interop") or 0)
+    if interop:
+        try:
+            torch.set_num_interop_threads(interop)
+        except RuntimeError:
+            # Ya hubo trabajo paralelo en el proceso: se mantiene el valor actual
+            pass
+
+
+def calentar(manager, entradas: Optional[Dict] = None):
+    """Primera llamada a `generate` fuera del camino crítico del primer lote."""
+    _pasada(manager, entradas or _entradas_sinteticas(manager))
+
+
+def calibrar(manager, repeticiones: int = 3, candidatas: Optional[List[int]] = None, callback=None) -> Dict:
+    """
+    Mide imágenes/s con cada nº de hilos candidato y devuelve el mejor ajuste.
+
+    Cada candidata hace una pasada de calentamiento y `repeticiones` medidas;
+    se compara la mediana.
+    """
+    entradas = _entradas_sinteticas(manager)
+    original = torch.get_num_threads()
+    resultados = {}
+    try:
+        for hilos in candidatas or configuraciones_candidatas():
+            torch.set_num_threads(hilos)
+            _pasada(manager, entradas)
+            mediana = statistics.median(_pasada(manager, entradas) for _ in range(max(1, repeticiones)))
+            resultados[hilos] = round(1.0 / mediana, 3) if mediana else 0.0
+            if callback:
+                callback(f"   🧵 {hilos} hilos: {resultados[hilos]} img/s")
+    finally:
+        torch.set_num_threads(original)
+
+    mejor = max(resultados, key=resultados.get)
+    return {
+        "hilos": mejor,
+        "interop": 1,
+        "imagenes_por_s": resultados[mejor],
+        "medidas": {str(h): v for h, v in resultados.items()},
+        "fecha": time.strftime("%Y-%m-%d %H:%M:%S"),
+    }
+
+
+def ajustar_cpu(manager, ruta: Path, recalibrar: bool = False, callback=None) -> Dict:
+    """
+    Aplica el ajuste guardado para esta máquina y modelo (calibrando si no lo hay)
+    y calienta el modelo. Devuelve el ajuste aplicado.
+    """
+    clave = _clave(manager)
+    datos = _leer(ruta)
+    ajuste = None if recalibrar else datos.get(clave)
+
+    if ajuste is None:
+        if callback:
+            callback("🧵 Calibrando hilos de CPU para este equipo (solo la primera vez)...")
+        ajuste = calibrar(manager, callback=callback)
+        datos[clave] = ajuste
+        try:
+            ruta.parent.mkdir(parents=True, exist_ok=True)
+            ruta.write_text(json.dumps(datos, ensure_ascii=False, indent=2), encoding="utf-8")
+        except OSError as exc:
+            logger.warning(f"⚠️ No se pudo guardar el ajuste de CPU: {exc}")
+
+    aplicar(ajuste)
+    calentar(manager)
+    if callback:
+        callback(f"🧵 CPU: {ajuste['hilos']} hilos ({ajuste.get('imagenes_por_s')} img/s en calibración)")
+    return ajuste
@@ -9,6 +9,8 @@ from typing import Dict, List, Optional, Tuple, Any
 import logging
 from PIL import Image
 
+from utils.image_discovery import descubrir_imagenes
+
 class EnhancedDatabaseManager:
     """
     Sistema avanzado de gestión de base de datos SQLite para StockPrep Pro v2.0
@@ -62,7 +64,7 @@ class EnhancedDatabaseManager:
                         objetos_detectados TEXT, -- JSON array con posiciones
                         
                         -- Estados y tracking
-                        estado TEXT DEFAULT 'pending', -- pending/processing/completed/error
+                        estado TEXT DEFAULT 'pending', -- pending/processing/completed/truncated/error
                         modelo_ia_usado TEXT,
                         version_modelo TEXT,
                         confianza_promedio REAL,
@@ -851,6 +853,8 @@ class EnhancedDatabaseManager:
             caption = results.get('descripcion') or results.get('caption', '')
             keywords = json.dumps(results.get('keywords', []), ensure_ascii=False)
             objetos = json.dumps(results.get('objetos_detectados', []), ensure_ascii=False)
+            # Salida cortada por el límite de tiempo por imagen
+            estado = 'truncated' if results.get('interrumpido') else 'completed'
             
             with sqlite3.connect(self.db_path) as conn:
                 cursor = conn.cursor()
@@ -859,10 +863,10 @@ class EnhancedDatabaseManager:
                     UPDATE imagenes SET
                         caption = ?, keywords = ?, objetos_detectados = ?,
                         nombre_renombrado = ?, ruta_salida = ?,
-                        estado = 'completed', fecha_procesamiento = CURRENT_TIMESTAMP
+                        estado = ?, fecha_procesamiento = CURRENT_TIMESTAMP
                     WHERE id = ?
                     """,
-                    (caption, keywords, objetos, nombre_renombrado, ruta_salida, imagen_id)
+                    (caption, keywords, objetos, nombre_renombrado, ruta_salida, estado, imagen_id)
                 )
                 conn.commit()
                 return cursor.rowcount > 0
@@ -960,7 +964,7 @@ def crear_base_datos(db_path: str = "stockprep_images.db") -> EnhancedDatabaseMa
     return EnhancedDatabaseManager(db_path)
 
 def procesar_directorio_imagenes(directorio: str, output_dir: str = None, 
-                                db_path: str = "stockprep_images.db") -> Dict:
+                                db_path: str = "stockprep_images.db", recursivo: bool = True) -> Dict:
     """
     Procesar todas las imágenes de un directorio y agregarlas a la base de datos
     
@@ -968,6 +972,7 @@ def procesar_directorio_imagenes(directorio: str, output_dir: str = None,
         directorio: Directorio con imágenes
         output_dir: Directorio con archivos de procesamiento TXT
         db_path: Ruta a la base de datos
+        recursivo: Incluir las subcarpetas
         
     Returns:
         Diccionario con estadísticas del procesamiento
@@ -976,26 +981,18 @@ def procesar_directorio_imagenes(directorio: str, output_dir: str = None,
     if not directorio.exists():
         raise ValueError(f"El directorio no existe: {directorio}")
     
-    # Extensiones de imagen soportadas
-    extensiones_imagen = {'.jpg', '.jpeg', '.png', '.bmp', '.tiff', '.webp', '.gif'}
-    
-    # Encontrar todas las imágenes
-    imagenes = []
-    for ext in extensiones_imagen:
-        imagenes.extend(directorio.glob(f"*{ext}"))
-        imagenes.extend(directorio.glob(f"*{ext.upper()}"))
-    
-    # Procesar imágenes
+    # Procesar imágenes según se encuentran
     db_manager = EnhancedDatabaseManager(db_path)
     
     estadisticas = {
-        'total_encontradas': len(imagenes),
+        'total_encontradas': 0,
         'insertadas_exitosamente': 0,
         'ya_existian': 0,
         'errores': 0
     }
     
-    for imagen_path in imagenes:
+    for imagen_path in descubrir_imagenes(str(directorio), recursivo=recursivo):
+        estadisticas['total_encontradas'] += 1
         try:
             if db_manager.insertar_imagen_automatica(str(imagen_path), output_dir):
                 estadisticas['insertadas_exitosamente'] += 1
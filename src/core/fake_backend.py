@@ -0,0 +1,245 @@
+"""
+Backend simulado de Florence‑2 para medir el pipeline sin descargar pesos.
+
+`FakeFlorence2Manager` sustituye a `Florence2Manager` con un processor y un
+modelo falsos que:
+
+• tardan lo configurado en cargar, codificar cada imagen y generar cada token
+• devuelven salidas deterministas por contenido de imagen y tarea
+• respetan los formatos reales de `post_process_generation`
+  (`{"<CAPTION>": "texto"}`, `{"<OD>": {"bboxes": [...], "labels": [...]}}`)
+
+Con él se pueden cargar de trabajo `BatchEngine`, `ImageProcessor`, la base
+de datos y el bucle por lotes de la GUI en cualquier máquina, y separar los
+cuellos de botella de E/S o SQLite de los del modelo.
+
+Activación: `modelo.backend: fake` o STOCKPREP_BACKEND=fake.
+
+torch, PIL y transformers se importan al usarse (ver `utils.lazy_import`):
+el módulo se puede importar aunque no estén instalados.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import random
+import time
+from typing import Dict, List, Optional
+
+from core.model_manager import Florence2Manager
+from utils.lazy_import import lazy_import
+
+torch = lazy_import("torch")
+
+# Tareas conocidas -> id de token del prompt simulado
+TAREAS = ["<CAPTION>", "<DETAILED_CAPTION>", "<MORE_DETAILED_CAPTION>", "<OD>"]
+TOKEN_TAREA_BASE = 10
+EOS_TOKEN_ID = 2
+
+# Tokens de salida por tarea antes de llegar a EOS (recortados por max_new_tokens)
+TOKENS_POR_TAREA = {
+    "<CAPTION>": 12,
+    "<DETAILED_CAPTION>": 60,
+    "<MORE_DETAILED_CAPTION>": 120,
+    "<OD>": 40,
+}
+
+VOCABULARIO = [
+    "a", "the", "with", "and", "on", "in", "of", "near", "under", "beside",
+    "woman", "man", "dog", "cat", "car", "tree", "building", "street", "beach", "mountain",
+    "red", "blue", "green", "old", "modern", "small", "large", "sunny", "wooden", "bright",
+    "sitting", "walking", "standing", "holding", "looking", "parked", "growing", "reflecting",
+]
+ETIQUETAS_OD = ["person", "car", "dog", "cat", "tree", "chair", "bicycle", "bottle", "building", "bird"]
+
+# Lado al que se reduce la imagen en el image processor simulado
+LADO_PIXEL_VALUES = 32
+
+
+class _FakeImageProcessor:
+    """Convierte imágenes en `pixel_values` pequeños pero dependientes del contenido."""
+
+    def __call__(self, images, return_tensors="pt", **kwargs):
+        from PIL import Image
+        from transformers import BatchFeature
+
+        arrays = []
+        for image in images:
+            reducida = image.convert("RGB").resize((LADO_PIXEL_VALUES, LADO_PIXEL_VALUES), Image.BILINEAR)
+            datos = torch.frombuffer(bytearray(reducida.tobytes()), dtype=torch.uint8)
+            arrays.append(datos.view(LADO_PIXEL_VALUES, LADO_PIXEL_VALUES, 3).permute(2, 0, 1).float() / 255)
+        return BatchFeature({"pixel_values": torch.stack(arrays)})
+
+
+class _FakeTokenizer:
+    """Un token por prompt de tarea; decodifica las salidas del modelo simulado."""
+
+    eos_token_id = EOS_TOKEN_ID
+    pad_token_id = 1
+
+    def __call__(self, prompts, return_tensors="pt", padding=True, **kwargs):
+        from transformers import BatchFeature
+
+        ids = torch.tensor([[TOKEN_TAREA_BASE + _indice_tarea(p)] for p in prompts], dtype=torch.long)
+        return BatchFeature({"input_ids": ids, "attention_mask": torch.ones_like(ids)})
+
+    def batch_decode(self, sequences, skip_special_tokens=False, **kwargs) -> List[str]:
+        # Cada secuencia simulada es [tarea, semilla, nº de tokens]
+        return [f"{int(s[0])}|{int(s[1])}|{int(s[2])}" for s in sequences]
+
+
+def _indice_tarea(prompt: str) -> int:
+    return TAREAS.index(prompt) if prompt in TAREAS else 0
+
+
+class FakeProcessor:
+    """Imita el `AutoProcessor` de Florence‑2."""
+
+    def __init__(self, objetos_od: int = 3):
+        self.image_processor = _FakeImageProcessor()
+        self.tokenizer = _FakeTokenizer()
+        self.objetos_od = objetos_od
+
+    def __call__(self, text=None, images=None, return_tensors="pt", **kwargs):
+        from transformers import BatchFeature
+
+        datos = dict(self.image_processor(images))
+        datos.update(self.tokenizer(text))
+        return BatchFeature(datos)
+
+    def batch_decode(self, sequences, skip_special_tokens=False, **kwargs) -> List[str]:
+        return self.tokenizer.batch_decode(sequences, skip_special_tokens)
+
+    def post_process_generation(self, text: str, task: str, image_size=(768, 768)) -> Dict:
+        """Genera un resultado determinista con el mismo formato que Florence‑2."""
+        _, semilla, n_tokens = (int(x) for x in text.split("|"))
+        rng = random.Random(f"{semilla}:{task}")
+        if task == "<OD>":
+            ancho, alto = image_size
+            bboxes, labels = [], []
+            for _ in range(self.objetos_od):
+                x1, y1 = rng.uniform(0, ancho * 0.7), rng.uniform(0, alto * 0.7)
+                x2, y2 = rng.uniform(x1 + 1, ancho), rng.uniform(y1 + 1, alto)
+                bboxes.append([round(x1, 2), round(y1, 2), round(x2, 2), round(y2, 2)])
+                labels.append(rng.choice(ETIQUETAS_OD))
+            return {task: {"bboxes": bboxes, "labels": labels}}
+
+        palabras = [rng.choice(VOCABULARIO) for _ in range(max(1, n_tokens))]
+        return {task: " ".join(palabras).capitalize() + "."}
+
+
+class FakeFlorence2Model:
+    """
+    Modelo simulado con la superficie de Florence‑2 que usa `ImageProcessor`.
+
+    Los embeddings tienen una sola dimensión: la primera posición lleva la
+    semilla de la imagen (24 bits, exacta en float32) y la última el token de
+    la tarea, así `generate` sabe qué devolver en cada fila sin modelo real.
+    """
+
+    def __init__(self, latencia_encoder_ms: float, latencia_token_ms: float, tokens_por_tarea: Dict[str, int]):
+        self.device = torch.device("cpu")
+        self.dtype = torch.float32
+        self.latencia_encoder_ms = latencia_encoder_ms
+        self.latencia_token_ms = latencia_token_ms
+        self.tokens_por_tarea = tokens_por_tarea
+
+    def eval(self):
+        return self
+
+    def _encode_image(self, pixel_values: torch.Tensor) -> torch.Tensor:
+        time.sleep(self.latencia_encoder_ms * pixel_values.shape[0] / 1000)
+        semillas = [
+            int(hashlib.sha1(fila.numpy().tobytes()).hexdigest()[:6], 16) for fila in pixel_values.float().cpu()
+        ]
+        return torch.tensor(semillas, dtype=torch.float64).view(-1, 1, 1).to(self.dtype)
+
+    def get_input_embeddings(self):
+        return lambda input_ids: input_ids.to(self.dtype).unsqueeze(-1)
+
+    def _merge_input_ids_with_image_features(self, image_features, inputs_embeds):
+        merged = torch.cat([image_features, inputs_embeds], dim=1)
+        return merged, torch.ones(merged.shape[:2], dtype=torch.long)
+
+    def generate(self, input_ids=None, pixel_values=None, inputs_embeds=None, attention_mask=None,
+                 max_new_tokens: int = 1024, num_beams: int = 1, stopping_criteria=None,
+                 **kwargs) -> torch.LongTensor:
+        if inputs_embeds is None:
+            inputs_embeds, _ = self._merge_input_ids_with_image_features(
+                self._encode_image(pixel_values), self.get_input_embeddings()(input_ids)
+            )
+
+        filas = []
+        for fila in inputs_embeds:
+            tarea = TAREAS[int(fila[-1, 0]) - TOKEN_TAREA_BASE]
+            n_tokens = min(max_new_tokens, self.tokens_por_tarea.get(tarea, 20))
+            filas.append([TOKEN_TAREA_BASE + TAREAS.index(tarea), int(fila[0, 0]), n_tokens])
+
+        # El decoder avanza al ritmo de la fila más larga; los beams encarecen cada paso
+        pasos = max(f[2] for f in filas)
+        for paso in range(1, pasos + 1):
+            time.sleep(self.latencia_token_ms * (1 + 0.15 * (max(1, num_beams) - 1)) / 1000)
+            ids = torch.zeros((len(filas), paso + 1), dtype=torch.long)
+            if stopping_criteria is not None and bool(torch.as_tensor(stopping_criteria(ids, None)).all()):
+                # Corte por cancelación o límite de tiempo: salida truncada
+                for f in filas:
+                    f[2] = min(f[2], paso)
+                break
+        return torch.tensor([[f[0] - TOKEN_TAREA_BASE, f[1], f[2]] for f in filas], dtype=torch.long)
+
+
+class FakeFlorence2Manager(Florence2Manager):
+    """
+    `Florence2Manager` sin pesos, para pruebas de carga del pipeline.
+
+    Los parámetros salen de los argumentos o de `modelo.fake` en settings.yaml.
+
+    Args:
+        latencia_carga_s: Tiempo simulado de `cargar_modelo`
+        latencia_encoder_ms: Tiempo del encoder de visión por imagen
+        latencia_token_ms: Tiempo de cada paso del decoder (compartido por el lote)
+        tokens_por_tarea: Tokens generados por tarea (ver TOKENS_POR_TAREA)
+        objetos_od: Nº de cajas que devuelve `<OD>`
+    """
+
+    def __init__(self, latencia_carga_s: Optional[float] = None, latencia_encoder_ms: Optional[float] = None,
+                 latencia_token_ms: Optional[float] = None, tokens_por_tarea: Optional[Dict[str, int]] = None,
+                 objetos_od: Optional[int] = None, **kwargs):
+        super().__init__(**kwargs)
+        config = self.config.get("fake", {}) or {}
+
+        def elegir(valor, clave, defecto):
+            return valor if valor is not None else config.get(clave, defecto)
+
+        self.device = "cpu"
+        self.model_id = "fake-florence-2"
+        self.parametros_fake = {
+            "latencia_carga_s": float(elegir(latencia_carga_s, "latencia_carga_s", 0.0)),
+            "latencia_encoder_ms": float(elegir(latencia_encoder_ms, "latencia_encoder_ms", 40.0)),
+            "latencia_token_ms": float(elegir(latencia_token_ms, "latencia_token_ms", 8.0)),
+            "tokens_por_tarea": {**TOKENS_POR_TAREA, **(elegir(tokens_por_tarea, "tokens_por_tarea", {}) or {})},
+            "objetos_od": int(elegir(objetos_od, "objetos_od", 3)),
+        }
+
+    def _detect_best_device(self):
+        return "cpu"
+
+    def _resolver_dtype(self, nombre):
+        return torch.float32
+
+    def _get_gpu_info(self):
+        return {"available": False, "reason": "Backend simulado"}
+
+    def firma_modelo(self) -> str:
+        return "FakeFlorence2Manager|" + json.dumps(self.parametros_fake, sort_keys=True)
+
+    def cargar_modelo(self, callback=None):
+        p = self.parametros_fake
+        if callback:
+            callback("🧪 Cargando modelo simulado (sin pesos)...")
+        time.sleep(p["latencia_carga_s"])
+        self.processor = FakeProcessor(objetos_od=p["objetos_od"])
+        self.model = FakeFlorence2Model(p["latencia_encoder_ms"], p["latencia_token_ms"], p["tokens_por_tarea"])
+        if callback:
+            callback("✅ Modelo simulado listo")
+        return True
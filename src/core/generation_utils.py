@@ -0,0 +1,142 @@
+"""
+Utilidades de generación para Florence‑2.
+
+Piezas que se enchufan en `model.generate()` sin depender del checkpoint:
+• `PerRowGenerationParams`: parámetros de longitud y repetición distintos por
+  fila, para poder agrupar varias tareas en una sola llamada a `generate`.
+• `StreamerCallback`: entrega el texto decodificado a una función a medida que
+  se generan los tokens (streaming hacia la GUI).
+• `crear_procesadores_logits`: los procesadores de `generate` para bucles de
+  decodificación propios (ONNX, continuous batching).
+• `CriterioInterrupcion`: cancelación cooperativa (`CancellationToken`) y
+  límite de tiempo comprobados en cada paso del decoder.
+"""
+import time
+from typing import Callable, List, Optional
+
+import torch
+from transformers import (
+    ForcedBOSTokenLogitsProcessor,
+    LogitsProcessor,
+    LogitsProcessorList,
+    MinLengthLogitsProcessor,
+    NoRepeatNGramLogitsProcessor,
+    RepetitionPenaltyLogitsProcessor,
+    StoppingCriteria,
+    TemperatureLogitsWarper,
+    TextStreamer,
+    TopKLogitsWarper,
+    TopPLogitsWarper,
+)
+
+from core.cancelacion import MOTIVO_CANCELADO, MOTIVO_TIEMPO, CancellationToken
+
+
+class PerRowGenerationParams(LogitsProcessor):
+    """
+    Aplica `max_new_tokens`, `min_length` y `repetition_penalty` por tarea.
+
+    Las filas del batch se ordenan por tarea (todas las filas de la tarea 0,
+    luego las de la tarea 1…), incluidas las beams, así que cada fila se asigna
+    a su tarea dividiendo el nº de filas entre el nº de tareas.
+    """
+
+    def __init__(self, max_new_tokens: List[int], min_length: List[int],
+                 repetition_penalty: List[float], eos_token_id: int):
+        self.max_new_tokens = torch.tensor(max_new_tokens, dtype=torch.long)
+        self.min_length = torch.tensor(min_length, dtype=torch.long)
+        self.repetition_penalty = torch.tensor(repetition_penalty, dtype=torch.float32)
+        self.eos_token_id = eos_token_id
+
+    def _por_fila(self, valores: torch.Tensor, filas: int, device) -> torch.Tensor:
+        """Expande un valor por tarea a un valor por fila del batch."""
+        return valores.to(device).repeat_interleave(filas // len(valores))
+
+    def __call__(self, input_ids: torch.LongTensor, scores: torch.FloatTensor) -> torch.FloatTensor:
+        filas = input_ids.shape[0]
+        cur_len = input_ids.shape[-1]
+        device = scores.device
+
+        # 1. Penalización de repetición (misma fórmula que transformers, por fila)
+        penalty = self._por_fila(self.repetition_penalty, filas, device).to(scores.dtype).unsqueeze(1)
+        score = torch.gather(scores, 1, input_ids)
+        score = torch.where(score < 0, score * penalty, score / penalty)
+        scores = scores.scatter(1, input_ids, score)
+
+        # 2. Longitud mínima: prohibir EOS mientras la fila sea demasiado corta
+        min_length = self._por_fila(self.min_length, filas, device)
+        scores[cur_len < min_length, self.eos_token_id] = -float("inf")
+
+        # 3. Longitud máxima: forzar EOS como último token nuevo de la fila
+        # (el decoder empieza con el token de inicio, así que van cur_len - 1 tokens)
+        max_new = self._por_fila(self.max_new_tokens, filas, device)
+        agotadas = cur_len >= max_new
+        if agotadas.any():
+            scores[agotadas] = -float("inf")
+            scores[agotadas, self.eos_token_id] = 0.0
+        return scores
+
+
+def crear_procesadores_logits(eos_token_id: int, forced_bos_token_id: Optional[int] = None,
+                              min_length: int = 0, repetition_penalty: float = 1.0,
+                              no_repeat_ngram_size: int = 0, do_sample: bool = False,
+                              temperature: float = 1.0, top_k: int = 0, top_p: float = 1.0,
+                              extra=None, **_ignorados) -> LogitsProcessorList:
+    """Procesadores y warpers con la misma semántica que `model.generate()`."""
+    procesadores = LogitsProcessorList()
+    if forced_bos_token_id is not None:
+        procesadores.append(ForcedBOSTokenLogitsProcessor(forced_bos_token_id))
+    if min_length:
+        procesadores.append(MinLengthLogitsProcessor(min_length, eos_token_id))
+    if repetition_penalty and repetition_penalty != 1.0:
+        procesadores.append(RepetitionPenaltyLogitsProcessor(repetition_penalty))
+    if no_repeat_ngram_size:
+        procesadores.append(NoRepeatNGramLogitsProcessor(no_repeat_ngram_size))
+    if extra:
+        procesadores.extend(extra)
+    if do_sample:
+        if temperature and temperature != 1.0:
+            procesadores.append(TemperatureLogitsWarper(temperature))
+        if top_k:
+            procesadores.append(TopKLogitsWarper(top_k))
+        if top_p and top_p < 1.0:
+            procesadores.append(TopPLogitsWarper(top_p))
+    return procesadores
+
+
+class StreamerCallback(TextStreamer):
+    """
+    `TextStreamer` que llama a `callback(fragmento)` en lugar de imprimir.
+
+    Solo admite lotes de una fila y `num_beams=1` (limitación de transformers).
+    Se omiten el token de inicio del decoder y los tokens especiales.
+    """
+
+    def __init__(self, tokenizer, callback: Callable[[str], None], **decode_kwargs):
+        decode_kwargs.setdefault("skip_special_tokens", True)
+        super().__init__(tokenizer, skip_prompt=True, **decode_kwargs)
+        self.callback = callback
+
+    def on_finalized_text(self, text: str, stream_end: bool = False):
+        if text:
+            self.callback(text)
+
+
+class CriterioInterrupcion(StoppingCriteria):
+    """
+    Detiene `generate` en el siguiente paso si se cancela el token o se pasa
+    `limite` (instante de `time.monotonic()`). Deja el motivo en `self.motivo`.
+    """
+
+    def __init__(self, token: Optional[CancellationToken] = None, limite: Optional[float] = None):
+        self.token = token
+        self.limite = limite
+        self.motivo: Optional[str] = None
+
+    def __call__(self, input_ids: torch.LongTensor, scores: torch.FloatTensor, **kwargs) -> torch.BoolTensor:
+        if self.motivo is None:
+            if self.token is not None and self.token.cancelado:
+                self.motivo = MOTIVO_CANCELADO
+            elif self.limite is not None and time.monotonic() >= self.limite:
+                self.motivo = MOTIVO_TIEMPO
+        return torch.full((input_ids.shape[0],), self.motivo is not None, dtype=torch.bool, device=input_ids.device)
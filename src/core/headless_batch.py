@@ -0,0 +1,215 @@
+"""
+Lote sin interfaz para servidores (python main.py --cli --folder CARPETA).
+
+Pensado para cron o systemd en nodos Linux sin pantalla:
+
+• cada resultado se escribe en cuanto sale (JSONL o CSV; por defecto JSONL
+  en stdout) y se guarda en la base de datos
+• el progreso va a stderr cada `--progress-interval` segundos
+• con `--resume` continúa el último lote sin terminar de la carpeta
+• SIGTERM y Ctrl+C detienen el lote de forma ordenada
+
+Códigos de salida:
+
+    0    todas las imágenes procesadas (o no había ninguna)
+    1    alguna imagen falló
+    2    argumentos no válidos
+    3    no se pudo cargar el modelo
+    4    el lote se interrumpió por un error inesperado
+    128+n  detenido por la señal n (130 = Ctrl+C, 143 = SIGTERM)
+"""
+import contextlib
+import csv
+import json
+import logging
+import os
+import signal
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Dict, Optional
+
+SALIDA_OK = 0
+SALIDA_CON_ERRORES = 1
+SALIDA_USO = 2
+SALIDA_MODELO = 3
+SALIDA_FALLO = 4
+
+# Columnas del CSV (las keywords van separadas por comas en una sola celda)
+CAMPOS_CSV = ("archivo_original", "ruta_original", "archivo_renombrado", "ruta_renombrada",
+              "descripcion", "keywords", "error", "interrumpido")
+
+logger = logging.getLogger(__name__)
+
+
+class EscritorResultados:
+    """
+    Escribe cada resultado según llega, una línea por imagen y con flush, para
+    que un lote cortado deje un fichero válido hasta la última imagen.
+
+    Args:
+        destino: Fichero de salida (None = stdout)
+        formato: "jsonl" o "csv" (por defecto según la extensión de `destino`)
+        anexar: Añadir al fichero existente (al reanudar) en lugar de reescribirlo
+    """
+
+    def __init__(self, destino: Optional[str] = None, formato: Optional[str] = None, anexar: bool = False):
+        if formato is None:
+            formato = "csv" if destino and destino.lower().endswith(".csv") else "jsonl"
+        self.formato = formato
+        if destino:
+            Path(destino).parent.mkdir(parents=True, exist_ok=True)
+            nuevo = not anexar or not os.path.exists(destino) or os.path.getsize(destino) == 0
+            self._f = open(destino, "a" if anexar else "w", newline="", encoding="utf-8")
+        else:
+            nuevo = True
+            self._f = sys.stdout
+        self._csv = None
+        if formato == "csv":
+            self._csv = csv.DictWriter(self._f, fieldnames=CAMPOS_CSV, extrasaction="ignore")
+            if nuevo:
+                self._csv.writeheader()
+
+    def escribir(self, resultado: Dict):
+        if self._csv is not None:
+            fila = dict(resultado)
+            fila["keywords"] = ", ".join(resultado.get("keywords") or [])
+            self._csv.writerow(fila)
+        else:
+            self._f.write(json.dumps(resultado, ensure_ascii=False, default=str) + "\n")
+        self._f.flush()
+
+    def cerrar(self):
+        if self._f is not sys.stdout:
+            self._f.close()
+
+
+class ProgresoStderr:
+    """Línea de progreso en stderr cada `intervalo_s`, aunque el modelo tarde en responder."""
+
+    def __init__(self, intervalo_s: float = 10.0):
+        self.intervalo_s = max(0.5, float(intervalo_s))
+        self.procesadas = 0
+        self.total: Optional[int] = None  # desconocido hasta que BatchEngine termina de recorrer la carpeta
+        self.errores = 0
+        self._inicio = time.monotonic()
+        self._parar = threading.Event()
+        self._hilo = threading.Thread(target=self._bucle, name="progreso-cli", daemon=True)
+
+    def iniciar(self):
+        self._inicio = time.monotonic()
+        self._hilo.start()
+
+    def _bucle(self):
+        while not self._parar.wait(self.intervalo_s):
+            self.escribir()
+
+    def escribir(self):
+        transcurrido = time.monotonic() - self._inicio
+        ritmo = self.procesadas / transcurrido if transcurrido else 0.0
+        total = "?" if self.total is None else self.total
+        pendientes = 0 if self.total is None else max(0, self.total - self.procesadas)
+        eta = f", ETA {_duracion(pendientes / ritmo)}" if ritmo and pendientes else ""
+        print(f"[{_duracion(transcurrido)}] {self.procesadas}/{total} imágenes "
+              f"({ritmo:.2f} img/s{eta}), {self.errores} errores", file=sys.stderr, flush=True)
+
+    def detener(self):
+        self._parar.set()
+        if self._hilo.is_alive():
+            self._hilo.join()
+        self.escribir()
+
+
+def _duracion(segundos: float) -> str:
+    segundos = int(segundos)
+    horas, resto = divmod(segundos, 3600)
+    return f"{horas}:{resto // 60:02d}:{resto % 60:02d}" if horas else f"{resto // 60:02d}:{resto % 60:02d}"
+
+
+def ejecutar_lote(args, crear_procesador: Callable) -> int:
+    """
+    Procesa `args.folder` y devuelve el código de salida.
+
+    `args` trae folder, workers, batch_size, detail, resume, output, format,
+    db, no_db, progress_interval y verbose; `crear_procesador()` devuelve un
+    `ImageProcessor` con el modelo cargado (o None si no se pudo cargar).
+    """
+    from core.batch_engine import BatchEngine
+    from core.image_processor import ImageProcessor
+    from core.job_journal import crear_diario_desde_config
+    from core.model_manager import cargar_config_seccion, crear_model_manager
+    from core.worker_pool import resolver_workers
+
+    if not Path(args.folder).is_dir():
+        print(f"❌ No existe la carpeta: {args.folder}", file=sys.stderr)
+        return SALIDA_USO
+
+    config = cargar_config_seccion("procesamiento")
+    workers = args.workers if args.workers is not None else config.get("workers", 1)
+    hilos = config.get("hilos_por_worker", 0)
+    manager = crear_model_manager()
+    # stdout es para los resultados: los mensajes de carga del modelo van a stderr
+    with contextlib.redirect_stdout(sys.stderr):
+        if manager.device == "cpu" and resolver_workers(workers, hilos)[0] > 1:
+            # Cada worker del pool carga su propio modelo: aquí solo hacen falta las keywords
+            processor = ImageProcessor(manager)
+        else:
+            processor = crear_procesador()
+    if processor is None:
+        return SALIDA_MODELO
+
+    journal = crear_diario_desde_config()
+    if args.resume and journal is None:
+        logger.warning("⚠️ El diario de trabajos está desactivado (settings.yaml: diario); no se puede reanudar")
+    db_manager = None
+    if not args.no_db:
+        from core.enhanced_database_manager import EnhancedDatabaseManager
+        db_manager = EnhancedDatabaseManager(args.db)
+
+    progreso = ProgresoStderr(args.progress_interval)
+    nivel_detalle = logging.INFO if args.verbose else logging.DEBUG
+
+    def estado(tipo, dato):
+        if tipo == 'progress':
+            progreso.procesadas, progreso.total = dato
+        elif tipo == 'log':
+            # El detalle por imagen (líneas sangradas y "Procesado") solo con --verbose
+            detalle = dato.startswith("  ") or dato.startswith("🖼️")
+            logger.log(nivel_detalle if detalle else logging.INFO, dato)
+
+    engine = BatchEngine(
+        processor, status_callback=estado, detail_level=args.detail, batch_size=args.batch_size,
+        workers=workers, threads_per_worker=hilos, db_manager=db_manager, journal=journal,
+    )
+    escritor = EscritorResultados(args.output, args.format, anexar=args.resume)
+
+    def al_resultado(resultado):
+        if resultado.get("error"):
+            progreso.errores += 1
+        escritor.escribir(resultado)
+
+    senal = {"n": None}
+
+    def detener(signum, _frame):
+        senal["n"] = signum
+        engine.stop()
+
+    anteriores = {s: signal.signal(s, detener) for s in (signal.SIGINT, signal.SIGTERM)}
+    progreso.iniciar()
+    try:
+        engine.run(args.folder, reanudar=args.resume, al_resultado=al_resultado, acumular=False)
+    except Exception:
+        logger.exception("❌ El lote se interrumpió")
+        return SALIDA_FALLO
+    finally:
+        progreso.detener()
+        escritor.cerrar()
+        for s, anterior in anteriores.items():
+            signal.signal(s, anterior)
+        if journal is not None:
+            journal.cerrar()
+
+    if senal["n"] is not None:
+        return 128 + senal["n"]
+    return SALIDA_CON_ERRORES if progreso.errores else SALIDA_OK
@@ -2,106 +2,860 @@
 Procesador de imágenes con Florence‑2.
 
 — Revisión junio 2025 —
-• Asegura coherencia de **dtype** y **device** con el modelo (float32)
+• Asegura coherencia de **dtype** y **device** con el modelo (fp32, bf16 o fp16)
 • Mantiene la misma API pública
 • Integración con YAKE para extracción avanzada de keywords
 • Soporte para niveles de detalle configurables
+• El encoder de visión se ejecuta una sola vez por imagen y sus features
+  se reutilizan en todas las tareas (caption, OD…)
+• Varias tareas por imagen (`tasks=[...]`) en el mínimo de llamadas a generate
+• Decodificación/preprocesado separable (`preparar_imagen`) para hacer prefetch
+• Caché persistente de resultados deterministas por hash de contenido
+• Registro opcional de variantes (base/large) por nivel de detalle o tarea
+• Streaming del caption token a token (`on_token`) para la GUI
+• Cancelación dentro de `generate` (`cancel_token`) y límite de tiempo por imagen
+• Decodificación asistida opcional con Florence‑2 base como borrador
+• Continuous batching opcional: las secuencias entran y salen de un lote vivo
 """
+import hashlib
+import io
+import time
 from pathlib import Path
-from typing import Dict, List
+from typing import Dict, List, Optional, Tuple
 
-import torch
 from PIL import Image
+from core.cancelacion import MOTIVO_CANCELADO, CancellationToken, GeneracionInterrumpida
+from core.inference_cache import InferenceCache
+from core.model_manager import cargar_config_seccion
 from utils.keyword_extractor import KeywordExtractor
+from utils.lazy_import import lazy_import
+
+# torch solo se importa al generar (ver utils.lazy_import)
+torch = lazy_import("torch")
+
+# Preset de `_get_generation_params` asociado a cada tarea de Florence‑2
+TASK_DETAIL_LEVELS = {
+    "<CAPTION>": "minimo",
+    "<DETAILED_CAPTION>": "medio",
+    "<MORE_DETAILED_CAPTION>": "largo",
+    "<OD>": "objects",
+}
+
+# Parámetros que pueden variar por fila dentro de una misma llamada a generate
+PER_ROW_PARAMS = ("max_new_tokens", "min_length", "repetition_penalty")
+
+# Tareas de texto que se pueden transmitir token a token
+STREAMING_TASKS = ("<CAPTION>", "<DETAILED_CAPTION>", "<MORE_DETAILED_CAPTION>")
+
+# Parámetros que solo tienen sentido con beam search (se quitan en streaming)
+BEAM_ONLY_PARAMS = ("length_penalty", "early_stopping", "num_beam_groups")
+
+# Florence‑2 redimensiona a 768x768: los JPEG se decodifican a escala reducida
+# (DCT scaling) sin bajar de este lado, lo que abarata mucho las fotos de 40 MP
+DECODE_MIN_SIDE = 1536
+
+
+def preparar_imagen(image_path: str, image_processor=None) -> Dict:
+    """
+    Decodifica una imagen y, si se pasa `image_processor`, calcula sus `pixel_values`.
+
+    Función de módulo (sin estado del modelo) para poder ejecutarse en hilos o
+    procesos de prefetch. `image_size` siempre es el tamaño original del fichero,
+    que es el que usa el post‑procesado de Florence‑2 para escalar las cajas.
+    `hash` es el SHA‑256 del fichero (clave de la caché de inferencia).
+    """
+    datos = Path(image_path).read_bytes()
+    with Image.open(io.BytesIO(datos)) as raw:
+        image_size = raw.size
+        raw.draft("RGB", (DECODE_MIN_SIDE, DECODE_MIN_SIDE))
+        image = raw.convert("RGB")
+
+    item = {"path": str(image_path), "image_size": image_size, "hash": hashlib.sha256(datos).hexdigest()}
+    if image_processor is not None:
+        item["pixel_values"] = image_processor([image], return_tensors="pt")["pixel_values"]
+    else:
+        item["image"] = image
+    return item
 
 
 class ImageProcessor:
     """Procesa una imagen con Florence‑2 a través de un `Florence2Manager`."""
 
-    def __init__(self, model_manager, keyword_extractor=None, idioma: str = "es"):
-        """`model_manager` debe exponer `.model`, `.processor` y `.model.device`."""
+    def __init__(self, model_manager, keyword_extractor=None, idioma: str = "es",
+                 share_image_features: bool = True, cache="auto", registry=None, asistente="auto",
+                 scheduler="auto"):
+        """
+        `model_manager` debe exponer `.model`, `.processor` y `.model.device`.
+
+        Con `share_image_features` las features del encoder DaViT se calculan
+        una vez por imagen y se reutilizan en cada prompt de tarea, de modo que
+        añadir o quitar tareas solo cuesta tiempo de decoder.
+
+        `cache` es una `InferenceCache`, None para desactivarla o "auto" para
+        crearla según la sección `cache` de settings.yaml.
+
+        Con `registry` (un `ModelRegistry`) cada tarea se ejecuta con la variante
+        asignada a su nivel de detalle, cargada bajo demanda; `model_manager`
+        queda apuntando a la última variante usada.
+
+        `asistente` es un `AssistedDecoder`, None o "auto" (según `modelo.asistente`):
+        en sus niveles de detalle el caption se decodifica sin beams, imagen a
+        imagen, con el borrador proponiendo tokens que el modelo grande verifica.
+
+        `scheduler` es un `ContinuousBatchScheduler`, None o "auto" (según
+        `procesamiento.continuous_batching`): cada tarea de cada imagen entra
+        como una secuencia en el lote vivo del decoder, compartido entre todos
+        los hilos que usen este procesador (lotes de BatchEngine y la GUI).
+
+        `cancel_token.cancelar()` detiene el `generate` en curso en el siguiente
+        token. `procesamiento.limite_por_imagen_s` acota el tiempo de generación:
+        al agotarse se trunca la salida ("truncar") o se descarta ("abortar") y
+        el resultado queda marcado en `interrumpido`.
+        """
         self.manager = model_manager
         self.keyword_extractor = keyword_extractor or KeywordExtractor(language=idioma)
+        self.share_image_features = share_image_features
+        if cache == "auto":
+            config = cargar_config_seccion("cache")
+            cache = None
+            if config.get("activada", True):
+                cache = InferenceCache(config.get("ruta", "stockprep_cache.db"), config.get("max_mb", 64))
+        self.cache = cache
+        self.registry = registry
+        if asistente == "auto":
+            from core.assisted_decoding import crear_asistente_desde_config
+            asistente = crear_asistente_desde_config()
+        self.asistente = asistente
+        if scheduler == "auto":
+            from core.continuous_batching import crear_scheduler_desde_config
+            scheduler = crear_scheduler_desde_config(model_manager)
+        self.scheduler = scheduler
+
+        self.cancel_token = CancellationToken()
+        config = cargar_config_seccion("procesamiento")
+        self.limite_por_imagen_s = float(config.get("limite_por_imagen_s") or 0)
+        self.accion_limite = str(config.get("accion_limite") or "truncar").lower()
 
     # ------------------------------------------------------------------
     #  API pública
     # ------------------------------------------------------------------
-    def process_image(self, image_path: str, detail_level: str = "largo") -> Dict:
+    def process_image(self, image_path: str, detail_level: str = "largo",
+                      tasks: Optional[List[str]] = None, on_token=None) -> Dict:
         """
         Procesa imagen y devuelve caption, keywords y objetos.
         
         Args:
             image_path: Ruta de la imagen
             detail_level: Nivel de detalle ("minimo", "medio", "largo")
+            tasks: Tareas de Florence‑2 a ejecutar (p. ej. ["<CAPTION>", "<OD>"]).
+                Por defecto, el caption de `detail_level` más "<OD>". La salida de
+                cada tarea queda en `resultado["tasks"]`.
+            on_token: Si se indica, el caption se genera en streaming (sin beams)
+                y cada fragmento de texto se pasa a `on_token` según se genera.
+                En niveles con beams cambia el caption: ver `admite_streaming`.
+                El resultado devuelto sigue siendo el post-procesado completo.
         """
-        if self.manager.model is None:
+        if not self._modelo_disponible():
             return {"error": "Modelo no cargado", "archivo": Path(image_path).name}
+        if self.cancel_token.cancelado:
+            return self._resultado_interrumpido(image_path, MOTIVO_CANCELADO)
 
         try:
-            image = Image.open(image_path).convert("RGB")
+            item = self.preparar_imagen(image_path)
+            limite = self._nuevo_limite()
             
-            # Mapear nivel de detalle a prompt de PromptGen v2.0
-            # PromptGen v2.0 tiene mejoras específicas en estos prompts
-            prompt_map = {
-                "minimo": "<CAPTION>",                    # Caption simple de una línea
-                "medio": "<DETAILED_CAPTION>",            # Caption estructurado con posiciones
-                "largo": "<MORE_DETAILED_CAPTION>"        # Descripción muy detallada (mejorada en v2.0)
-            }
-            
-            caption_prompt = prompt_map.get(detail_level, "<MORE_DETAILED_CAPTION>")
-            
-            # Generar caption con el nivel de detalle seleccionado
-            caption = self._generar_descripcion(image, caption_prompt, detail_level)
-            
-            # Generar objetos detectados (usar parámetros específicos para OD)
-            objects_raw = self._generar_descripcion(image, "<OD>", "objects")
-            objects = self._format_objects(objects_raw)
-            
-            # Extraer keywords del caption
-            keywords = self.keyword_extractor.extract_keywords(caption)
+            # Caption con el nivel de detalle seleccionado + objetos detectados
+            # (parámetros específicos para OD), compartiendo el encoder de visión
+            tareas = self._resolver_tareas(detail_level, tasks)
+            if on_token is not None:
+                salidas = self._generar_en_streaming(item, tareas, on_token, limite)
+            else:
+                salidas = self._generar_tareas([item], tareas, limite)
             
-            return {
-                "caption": caption,
-                "descripcion": caption,  # Alias de compatibilidad con código legacy
-                "keywords": keywords,
-                "objects": objects,
-                "file_path": str(image_path),
-                "file_name": Path(image_path).name,
-                "image_size": image.size,
-                "detail_level": detail_level
-            }
+            return self._marcar(self._construir_resultado(
+                image_path, item["image_size"], {tag: valores[0] for tag, valores in salidas.items()}, detail_level
+            ), item)
 
+        except GeneracionInterrumpida as exc:
+            return self._resultado_interrumpido(image_path, exc.motivo)
         except Exception as exc:
             return {"error": f"Error al procesar imagen: {exc}", "archivo": Path(image_path).name}
     
-    def procesar_imagen(self, ruta_imagen: str, detail_level: str = "largo") -> Dict:
+    def process_images(self, image_paths: List[str], detail_level: str = "largo",
+                       batch_size: int = 4, tasks: Optional[List[str]] = None) -> List[Dict]:
+        """
+        Procesa varias imágenes agrupándolas en lotes de `batch_size`.
+
+        Cada lote hace una sola llamada a `generate` por grupo de tareas
+        (caption y OD) con los `pixel_values` apilados. Devuelve un dict por imagen, en el
+        mismo orden que `image_paths`; los errores quedan aislados por imagen.
+        """
+        image_paths = [str(p) for p in image_paths]
+        if not self._modelo_disponible():
+            return [{"error": "Modelo no cargado", "archivo": Path(p).name} for p in image_paths]
+
+        batch_size = max(1, int(batch_size or 1))
+        resultados: List[Dict] = []
+        for inicio in range(0, len(image_paths), batch_size):
+            resultados.extend(self._procesar_lote(image_paths[inicio:inicio + batch_size], detail_level, tasks))
+        return resultados
+
+    def process_prepared(self, items: List[Dict], detail_level: str = "largo",
+                         tasks: Optional[List[str]] = None) -> List[Dict]:
+        """
+        Procesa como un único lote imágenes ya decodificadas con `preparar_imagen`.
+
+        Los items con clave `error` (fallos de decodificación en el prefetch) se
+        devuelven como resultado de error sin pasar por el modelo.
+        """
+        if not self._modelo_disponible():
+            return [{"error": "Modelo no cargado", "archivo": Path(item["path"]).name} for item in items]
+        if self.cancel_token.cancelado:
+            return [self._resultado_interrumpido(item["path"], MOTIVO_CANCELADO) for item in items]
+
+        resultados: List[Dict] = [None] * len(items)
+        validos = []
+        for i, item in enumerate(items):
+            if item.get("error"):
+                resultados[i] = {"error": f"Error al procesar imagen: {item['error']}", "archivo": Path(item["path"]).name}
+            else:
+                validos.append(i)
+        if not validos:
+            return resultados
+
+        # Inferencia conjunta; si el lote falla se reintenta imagen a imagen
+        lote = [items[i] for i in validos]
+        limite = self._nuevo_limite()
+        try:
+            salidas = self._generar_tareas(lote, self._resolver_tareas(detail_level, tasks), limite)
+        except GeneracionInterrumpida as exc:
+            for i in validos:
+                resultados[i] = self._resultado_interrumpido(items[i]["path"], exc.motivo)
+            return resultados
+        except Exception:
+            for i in validos:
+                resultados[i] = self.process_image(items[i]["path"], detail_level, tasks)
+            return resultados
+
+        # Repartir las salidas en un resultado por imagen
+        for k, i in enumerate(validos):
+            try:
+                resultados[i] = self._marcar(self._construir_resultado(
+                    items[i]["path"], items[i]["image_size"],
+                    {tag: valores[k] for tag, valores in salidas.items()}, detail_level
+                ), items[i])
+            except Exception as exc:
+                resultados[i] = {"error": f"Error al procesar imagen: {exc}", "archivo": Path(items[i]["path"]).name}
+        return resultados
+
+    def admite_streaming(self, detail_level: str) -> bool:
+        """
+        Niveles que se pueden transmitir token a token: los que no usan beams y
+        los de muestreo (medio, largo), que en streaming pierden los beams pero
+        no el muestreo. Los deterministas con beams (minimo) no se transmiten.
+        """
+        params = self._get_generation_params(detail_level)
+        return params.get("num_beams", 1) == 1 or bool(params.get("do_sample"))
+
+    def preparar_imagen(self, image_path: str) -> Dict:
+        """
+        Decodifica y preprocesa una imagen sin usar el modelo.
+
+        Es seguro llamarlo desde hilos de prefetch mientras otra imagen genera.
+        """
+        image_processor = None
+        if self.share_image_features and self._soporta_features():
+            image_processor = self.manager.processor.image_processor
+        return preparar_imagen(image_path, image_processor)
+
+    def procesar_imagen(self, ruta_imagen: str, detail_level: str = "largo",
+                        tasks: Optional[List[str]] = None) -> Dict:
         """Método de compatibilidad con la API anterior."""
-        return self.process_image(ruta_imagen, detail_level)
+        return self.process_image(ruta_imagen, detail_level, tasks)
+
+    def procesar_imagenes(self, rutas_imagenes: List[str], detail_level: str = "largo",
+                          batch_size: int = 4, tasks: Optional[List[str]] = None) -> List[Dict]:
+        """Alias en español de `process_images`."""
+        return self.process_images(rutas_imagenes, detail_level, batch_size, tasks)
+
+    # ------------------------------------------------------------------
+    #  Procesamiento por lotes
+    # ------------------------------------------------------------------
+    def _procesar_lote(self, image_paths: List[str], detail_level: str,
+                       tasks: Optional[List[str]] = None) -> List[Dict]:
+        """Procesa un lote de rutas con una llamada a `generate` por grupo de tareas."""
+        items = []
+        # Decodificar imágenes: un fichero corrupto no debe tumbar el lote
+        for path in image_paths:
+            try:
+                items.append(self.preparar_imagen(path))
+            except Exception as exc:
+                items.append({"path": str(path), "error": str(exc)})
+        return self.process_prepared(items, detail_level, tasks)
+
+    def _construir_resultado(self, image_path: str, image_size: Tuple[int, int], salidas: Dict,
+                             detail_level: str) -> Dict:
+        """Construye el dict de resultado público a partir de las salidas por tarea."""
+        # Caption del nivel pedido; si no se ejecutó, el más detallado disponible
+        caption = salidas.get(self._caption_prompt(detail_level))
+        if caption is None:
+            caption = next(
+                (salidas[tag] for tag in ("<MORE_DETAILED_CAPTION>", "<DETAILED_CAPTION>", "<CAPTION>")
+                 if tag in salidas),
+                ""
+            )
+        objects = self._format_objects(salidas.get("<OD>"))
+
+        # Extraer keywords del caption
+        keywords = self.keyword_extractor.extract_keywords(caption)
+
+        return {
+            "caption": caption,
+            "descripcion": caption,  # Alias de compatibilidad con código legacy
+            "keywords": keywords,
+            "objects": objects,
+            "file_path": str(image_path),
+            "file_name": Path(image_path).name,
+            "image_size": tuple(image_size),
+            "detail_level": detail_level,
+            "tasks": {
+                tag: objects if tag == "<OD>" else valor
+                for tag, valor in salidas.items()
+            }
+        }
+
+    @classmethod
+    def _resolver_tareas(cls, detail_level: str, tasks: Optional[List[str]] = None) -> List[Tuple[str, str]]:
+        """Convierte la lista de tareas en pares `(task_tag, preset de generación)`."""
+        if tasks is None:
+            return [(cls._caption_prompt(detail_level), detail_level), ("<OD>", "objects")]
+        # Tareas sin preset propio (<OCR>, <DENSE_REGION_CAPTION>…) usan el determinista de OD
+        return [(tag, TASK_DETAIL_LEVELS.get(tag, "objects")) for tag in dict.fromkeys(tasks)]
+
+    @staticmethod
+    def _caption_prompt(detail_level: str) -> str:
+        """Mapea el nivel de detalle al prompt de Florence‑2."""
+        # PromptGen v2.0 tiene mejoras específicas en estos prompts
+        prompt_map = {
+            "minimo": "<CAPTION>",                    # Caption simple de una línea
+            "medio": "<DETAILED_CAPTION>",            # Caption estructurado con posiciones
+            "largo": "<MORE_DETAILED_CAPTION>"        # Descripción muy detallada (mejorada en v2.0)
+        }
+        return prompt_map.get(detail_level, "<MORE_DETAILED_CAPTION>")
 
     # ------------------------------------------------------------------
     #  Descripción / objetos
     # ------------------------------------------------------------------
+    def _generar_tareas(self, items: List[Dict], tareas: List[Tuple[str, str]],
+                        limite: Optional[float] = None) -> Dict[str, List]:
+        """
+        Ejecuta varias tareas `(task_tag, detail_level)` sobre las mismas imágenes.
+
+        `items` son imágenes preparadas (ver `preparar_imagen`); `limite` es el
+        instante (`time.monotonic()`) en que se agota el tiempo de generación.
+
+        Devuelve `{task_tag: [salida por imagen]}`. Con registro de modelos, las
+        tareas se reparten por variante. Las tareas deterministas que ya están
+        en la caché no se generan; el resto pasa por `_inferir_tareas`.
+
+        El gestor y el límite viajan como argumentos y no en la instancia: con
+        continuous batching varios hilos generan a la vez con este procesador.
+        """
+        if self.registry is not None:
+            salidas = {}
+            for variante, grupo in self.registry.agrupar(tareas).items():
+                salidas.update(self._generar_con_cache(self.registry.obtener(variante), items, grupo, limite))
+            return salidas
+        return self._generar_con_cache(self.manager, items, tareas, limite)
+
+    def _modelo_disponible(self) -> bool:
+        """Con registro las variantes se cargan bajo demanda; sin él, el modelo debe estar cargado."""
+        return self.registry is not None or self.manager.model is not None
+
+    def _generar_con_cache(self, manager, items: List[Dict], tareas: List[Tuple[str, str]],
+                           limite: Optional[float]) -> Dict[str, List]:
+        """
+        Sirve de la caché lo que esté y genera con `manager` el resto.
+
+        La clave lleva los parámetros con los que se decodifica de verdad (sin
+        beams con continuous batching o con asistencia, y en ese caso marcada
+        como asistida): se busca con los previstos
+        y se guarda con los que se usaron, así que una salida nunca queda bajo
+        la clave de otra estrategia de decodificación.
+        """
+        if self.cache is None:
+            return self._inferir_tareas(manager, items, tareas, limite)
+
+        firma = manager.firma_modelo()
+        previstos = self._parametros_previstos(manager, tareas)
+        salidas = {task_tag: [None] * len(items) for task_tag, _ in tareas}
+        faltan: Dict[tuple, List[int]] = {}  # tareas pendientes -> índices de imagen
+        for i, item in enumerate(items):
+            pendientes = []
+            for task_tag, detail_level in tareas:
+                params = previstos[task_tag]
+                if item.get("hash") and InferenceCache.es_cacheable(params):
+                    guardado = self.cache.obtener(InferenceCache.clave(item["hash"], task_tag, firma, params))
+                    if guardado is not None:
+                        salidas[task_tag][i] = guardado
+                        continue
+                pendientes.append((task_tag, detail_level))
+            if pendientes:
+                faltan.setdefault(tuple(pendientes), []).append(i)
+
+        for pendientes, indices in faltan.items():
+            usados: Dict[str, Dict] = {}
+            generadas = self._inferir_tareas(manager, [items[i] for i in indices], list(pendientes), limite, usados)
+            for task_tag, valores in generadas.items():
+                params = usados.get(task_tag)
+                for i, valor in zip(indices, valores):
+                    salidas[task_tag][i] = valor
+                    item = items[i]
+                    if (params is not None and item.get("hash") and not item.get("interrumpido")
+                            and InferenceCache.es_cacheable(params)):
+                        self.cache.guardar(InferenceCache.clave(item["hash"], task_tag, firma, params), valor)
+        return salidas
+
+    def _parametros_previstos(self, manager, tareas: List[Tuple[str, str]]) -> Dict[str, Dict]:
+        """Parámetros con los que `_inferir_tareas` generará cada tarea (para buscar en la caché)."""
+        if not (self.share_image_features and self._soporta_features(manager)):
+            return {task_tag: self._get_generation_params(detail_level) for task_tag, detail_level in tareas}
+        if self._usar_scheduler(manager):
+            return {task_tag: self._parametros_sin_beams(detail_level) for task_tag, detail_level in tareas}
+        previstos = {}
+        for grupo in self._agrupar_tareas(tareas):
+            # Sin cargar el borrador: solo se mira si el nivel tiene asistencia
+            asistido = self._asistente_aplicable(manager, grupo)
+            for task_tag, detail_level in grupo:
+                previstos[task_tag] = (self._parametros_asistidos(detail_level) if asistido
+                                       else self._get_generation_params(detail_level))
+        return previstos
+
+    def _inferir_tareas(self, manager, items: List[Dict], tareas: List[Tuple[str, str]],
+                        limite: Optional[float], usados: Optional[Dict[str, Dict]] = None) -> Dict[str, List]:
+        """
+        Genera las tareas con el modelo. Si el modelo lo permite, el encoder de
+        visión se ejecuta una sola vez y las tareas con la misma estrategia de
+        decodificación comparten una única llamada a `generate`.
+
+        En `usados` (si se pasa) quedan, por tarea, los parámetros con los que
+        se generó de verdad; son los que identifican la salida en la caché.
+        """
+        usados = {} if usados is None else usados
+        if self.share_image_features and self._soporta_features(manager):
+            image_features = self._codificar_imagenes(manager, items)
+            if self._usar_scheduler(manager):
+                for task_tag, detail_level in tareas:
+                    usados[task_tag] = self._parametros_sin_beams(detail_level)
+                return self._generar_con_scheduler(manager, image_features, items, tareas, limite)
+            salidas = {}
+            for grupo in self._agrupar_tareas(tareas):
+                if self._usar_asistente(manager, grupo):
+                    salidas.update(self._generar_asistido(manager, image_features, items, grupo[0], limite, usados))
+                    continue
+                salidas.update(self._generar_con_features(manager, image_features, items, grupo, limite))
+                for task_tag, detail_level in grupo:
+                    usados[task_tag] = self._get_generation_params(detail_level)
+            return salidas
+        for task_tag, detail_level in tareas:
+            usados[task_tag] = self._get_generation_params(detail_level)
+        return {
+            task_tag: self._generar_lote(manager, items, task_tag, detail_level, limite)
+            for task_tag, detail_level in tareas
+        }
+
+    def _agrupar_tareas(self, tareas: List[Tuple[str, str]]) -> List[List[Tuple[str, str]]]:
+        """
+        Agrupa las tareas que pueden compartir un `generate`.
+
+        `num_beams`, `do_sample`, temperatura, etc. son globales a la llamada;
+        solo los parámetros de `PER_ROW_PARAMS` pueden variar dentro de un grupo.
+        """
+        grupos: Dict[tuple, List[Tuple[str, str]]] = {}
+        for task_tag, detail_level in tareas:
+            params = self._get_generation_params(detail_level)
+            clave = tuple(sorted((k, v) for k, v in params.items() if k not in PER_ROW_PARAMS))
+            grupos.setdefault(clave, []).append((task_tag, detail_level))
+        return list(grupos.values())
+
+    def _parametros_grupo(self, manager, detail_levels: List[str]) -> Dict:
+        """Parámetros de `generate` para un grupo de tareas que comparten llamada."""
+        if len(detail_levels) == 1:
+            return self._get_generation_params(detail_levels[0])
+
+        from transformers import LogitsProcessorList
+        from core.generation_utils import PerRowGenerationParams
+
+        presets = [self._get_generation_params(level) for level in detail_levels]
+        params = {k: v for k, v in presets[0].items() if k not in PER_ROW_PARAMS}
+        params["max_new_tokens"] = max(p["max_new_tokens"] for p in presets)
+        params["logits_processor"] = LogitsProcessorList([
+            PerRowGenerationParams(
+                max_new_tokens=[p["max_new_tokens"] for p in presets],
+                min_length=[p.get("min_length", 0) for p in presets],
+                repetition_penalty=[p.get("repetition_penalty", 1.0) for p in presets],
+                eos_token_id=manager.processor.tokenizer.eos_token_id,
+            )
+        ])
+        return params
+
+    def _soporta_features(self, manager=None) -> bool:
+        """Indica si el modelo (de `manager`, o el principal) expone los hooks de Florence‑2 para reutilizar features."""
+        manager = manager or self.manager
+        model = manager.model
+        return all(
+            hasattr(model, attr)
+            for attr in ("_encode_image", "get_input_embeddings", "_merge_input_ids_with_image_features")
+        ) and hasattr(manager.processor, "image_processor")
+
+    def _pixel_values(self, manager, items: List[Dict]):
+        """`pixel_values` apilados de los items (preprocesados en el prefetch o aquí)."""
+        return torch.cat([
+            item["pixel_values"] if "pixel_values" in item
+            else manager.processor.image_processor([item["image"]], return_tensors="pt")["pixel_values"]
+            for item in items
+        ])
+
+    def _codificar_imagenes(self, manager, items: List[Dict]):
+        """Ejecuta el encoder de visión (DaViT) una sola vez sobre los `pixel_values` apilados."""
+        model = manager.model
+        pixel_values = self._pixel_values(manager, items).to(model.device, dtype=model.dtype)
+        with torch.no_grad():
+            return model._encode_image(pixel_values)
+
+    def _tokenizar_prompts(self, manager, task_tags: List[str]):
+        """Tokeniza los prompts de tarea tal y como lo haría el processor de Florence‑2."""
+        processor = manager.processor
+        prompts = task_tags
+        if hasattr(processor, "_construct_prompts"):
+            prompts = processor._construct_prompts(task_tags)
+        tokens = processor.tokenizer(prompts, return_tensors="pt", padding=True)
+        return tokens.to(manager.model.device)
+
+    def _generar_con_features(self, manager, image_features, items: List[Dict],
+                              tareas: List[Tuple[str, str]], limite: Optional[float]) -> Dict[str, List]:
+        """
+        Genera las salidas de un grupo de tareas a partir de features ya calculadas.
+
+        Las filas del batch van ordenadas por tarea y, dentro de cada tarea, por
+        imagen; las features se repiten una vez por tarea sin recalcularlas.
+        """
+        model = manager.model
+        n = len(items)
+        task_tags = [task_tag for task_tag, _ in tareas]
+        tokens = self._tokenizar_prompts(manager, [task_tag for task_tag in task_tags for _ in range(n)])
+        if len(tareas) > 1:
+            image_features = image_features.repeat(len(tareas), 1, 1)
+
+        # Solo se ejecuta el decoder (y el encoder de texto) sobre las features reutilizadas
+        generation_params = self._parametros_grupo(manager, [detail_level for _, detail_level in tareas])
+        criterios, criterio = self._criterios_parada(limite)
+        with torch.no_grad():
+            inputs_embeds, attention_mask = self._fusionar_embeddings(manager, image_features, tokens)
+            gen_ids = model.generate(
+                input_ids=None,
+                inputs_embeds=inputs_embeds,
+                attention_mask=attention_mask,
+                stopping_criteria=criterios,
+                **generation_params
+            )
+        self._comprobar_interrupcion(criterio, items)
+
+        gen_texts = manager.processor.batch_decode(gen_ids, skip_special_tokens=False)
+        return {
+            task_tag: [
+                self._post_procesar(manager, gen_texts[t * n + k], task_tag, item["image_size"])
+                for k, item in enumerate(items)
+            ]
+            for t, task_tag in enumerate(task_tags)
+        }
+
+    def _fusionar_embeddings(self, manager, image_features, tokens):
+        """Concatena features de imagen y embeddings del prompt con su máscara de atención."""
+        model = manager.model
+        text_embeds = model.get_input_embeddings()(tokens["input_ids"])
+        inputs_embeds, _ = model._merge_input_ids_with_image_features(image_features, text_embeds)
+        # La máscara de Florence‑2 marca todo como válido; se usa la del tokenizer
+        # para que el padding de prompts de distinta longitud no reciba atención
+        image_mask = torch.ones(image_features.shape[:2], dtype=tokens["attention_mask"].dtype,
+                                device=tokens["attention_mask"].device)
+        attention_mask = torch.cat([image_mask, tokens["attention_mask"]], dim=1)
+        return inputs_embeds, attention_mask
+
     def _generar_descripcion(self, image: Image.Image, task_tag: str, detail_level: str = "largo"):
         """Genera texto u objeto detectado conforme a la tag solicitada."""
-        # 1. Preparar tensores (always float32 to match model)
-        inputs = self.manager.processor(text=task_tag, images=image, return_tensors="pt")
-        inputs = inputs.to(self.manager.model.device, dtype=self.manager.model.dtype)
+        item = {"path": "", "image_size": image.size, "image": image}
+        return self._generar_lote(self.manager, [item], task_tag, detail_level, self._nuevo_limite())[0]
+
+    def _generar_lote(self, manager, items: List[Dict], task_tag: str, detail_level: str,
+                      limite: Optional[float]) -> List:
+        """Genera la salida de `task_tag` para varias imágenes en un solo `generate`."""
+        images = [
+            item["image"] if "image" in item else Image.open(item["path"]).convert("RGB")
+            for item in items
+        ]
+        # 1. Preparar tensores en el dtype del modelo; mismo prompt para todo el lote
+        inputs = manager.processor(
+            text=[task_tag] * len(images), images=images, return_tensors="pt"
+        )
+        inputs = inputs.to(manager.model.device, dtype=manager.model.dtype)
 
         # 2. Parámetros optimizados según el nivel de detalle
         generation_params = self._get_generation_params(detail_level)
 
         # 3. Generar salida (sin grad) con parámetros optimizados
+        criterios, criterio = self._criterios_parada(limite)
         with torch.no_grad():
-            gen_ids = self.manager.model.generate(
+            gen_ids = manager.model.generate(
                 input_ids=inputs["input_ids"],
                 pixel_values=inputs["pixel_values"],
+                stopping_criteria=criterios,
                 **generation_params
             )
+        self._comprobar_interrupcion(criterio, items)
+
+        # 4. Decodificar y post‑procesar cada salida con el tamaño de su imagen
+        gen_texts = manager.processor.batch_decode(gen_ids, skip_special_tokens=False)
+        return [
+            self._post_procesar(manager, gen_text, task_tag, item["image_size"])
+            for gen_text, item in zip(gen_texts, items)
+        ]
+
+    # ------------------------------------------------------------------
+    #  Streaming
+    # ------------------------------------------------------------------
+    def _generar_en_streaming(self, item: Dict, tareas: List[Tuple[str, str]], on_token,
+                              limite: Optional[float]) -> Dict[str, List]:
+        """
+        Genera primero el caption transmitiéndolo a `on_token` y después el
+        resto de tareas (OD…) por el camino normal.
+        """
+        texto = next((t for t in tareas if t[0] in STREAMING_TASKS), None)
+        if texto is None:
+            return self._generar_tareas([item], tareas, limite)
+
+        task_tag, detail_level = texto
+        manager = self.manager
+        if self.registry is not None:
+            manager = self.registry.obtener(self.registry.variante_para(detail_level, task_tag))
+
+        params = self._parametros_sin_beams(detail_level)
+        clave = None
+        if self.cache is not None and item.get("hash") and InferenceCache.es_cacheable(params):
+            clave = InferenceCache.clave(item["hash"], task_tag, manager.firma_modelo(), params)
+            guardado = self.cache.obtener(clave)
+            if guardado is not None:
+                on_token(guardado)
+                return {task_tag: [guardado], **self._generar_resto(item, tareas, texto, limite)}
+
+        caption = self._generar_streaming(manager, item, task_tag, params, on_token, limite)
+        if clave is not None and not item.get("interrumpido"):
+            self.cache.guardar(clave, caption)
+        return {task_tag: [caption], **self._generar_resto(item, tareas, texto, limite)}
+
+    def _generar_resto(self, item: Dict, tareas: List[Tuple[str, str]], excluida: Tuple[str, str],
+                       limite: Optional[float]) -> Dict[str, List]:
+        resto = [t for t in tareas if t != excluida]
+        return self._generar_tareas([item], resto, limite) if resto else {}
+
+    def _parametros_sin_beams(self, detail_level: str) -> Dict:
+        """Preset del nivel con búsqueda voraz o muestreo (streaming y asistencia no admiten beams)."""
+        params = {k: v for k, v in self._get_generation_params(detail_level).items() if k not in BEAM_ONLY_PARAMS}
+        params["num_beams"] = 1
+        return params
+
+    def _generar_streaming(self, manager, item: Dict, task_tag: str, params: Dict, on_token,
+                           limite: Optional[float]):
+        """Un `generate` de una sola fila con `StreamerCallback`."""
+        from core.generation_utils import StreamerCallback
+
+        model = manager.model
+        streamer = StreamerCallback(manager.processor.tokenizer, on_token)
+        criterios, criterio = self._criterios_parada(limite)
+        params = {**params, "stopping_criteria": criterios}
+        with torch.no_grad():
+            if self.share_image_features and self._soporta_features(manager):
+                tokens = self._tokenizar_prompts(manager, [task_tag])
+                inputs_embeds, attention_mask = self._fusionar_embeddings(
+                    manager, self._codificar_imagenes(manager, [item]), tokens
+                )
+                gen_ids = model.generate(
+                    input_ids=None, inputs_embeds=inputs_embeds, attention_mask=attention_mask,
+                    streamer=streamer, **params
+                )
+            else:
+                image = item["image"] if "image" in item else Image.open(item["path"]).convert("RGB")
+                inputs = manager.processor(text=[task_tag], images=[image], return_tensors="pt")
+                inputs = inputs.to(model.device, dtype=model.dtype)
+                gen_ids = model.generate(
+                    input_ids=inputs["input_ids"], pixel_values=inputs["pixel_values"],
+                    streamer=streamer, **params
+                )
+        self._comprobar_interrupcion(criterio, [item])
+
+        gen_text = manager.processor.batch_decode(gen_ids, skip_special_tokens=False)[0]
+        return self._post_procesar(manager, gen_text, task_tag, item["image_size"])
+
+    # ------------------------------------------------------------------
+    #  Continuous batching
+    # ------------------------------------------------------------------
+    def _usar_scheduler(self, manager) -> bool:
+        """El planificador está ligado a un gestor concreto y necesita el language model de PyTorch."""
+        return (
+            self.scheduler is not None
+            and self.scheduler.manager is manager
+            and hasattr(manager.model, "language_model")
+        )
+
+    def _generar_con_scheduler(self, manager, image_features, items: List[Dict],
+                               tareas: List[Tuple[str, str]], limite: Optional[float]) -> Dict[str, List]:
+        """
+        Ejecuta aquí el encoder de texto de todas las filas (tarea x imagen) y
+        envía cada una al planificador con el preset de su nivel sin beams.
+        """
+        from core.continuous_batching import SolicitudDecoder
+        from core.generation_utils import CriterioInterrupcion
+
+        lm = manager.model.language_model
+        n = len(items)
+        task_tags = [task_tag for task_tag, _ in tareas]
+        tokens = self._tokenizar_prompts(manager, [task_tag for task_tag in task_tags for _ in range(n)])
+        if len(tareas) > 1:
+            image_features = image_features.repeat(len(tareas), 1, 1)
+        with torch.no_grad():
+            inputs_embeds, attention_mask = self._fusionar_embeddings(manager, image_features, tokens)
+            hidden = lm.get_encoder()(inputs_embeds=inputs_embeds, attention_mask=attention_mask)[0]
+
+        pendientes = []
+        for t, (task_tag, detail_level) in enumerate(tareas):
+            params = self._parametros_sin_beams(detail_level)
+            for k in range(n):
+                criterio = CriterioInterrupcion(self.cancel_token, limite)
+                futuro = self.scheduler.enviar(
+                    SolicitudDecoder(hidden[t * n + k], attention_mask[t * n + k], params, criterio)
+                )
+                pendientes.append((task_tag, k, criterio, futuro))
+
+        salidas = {task_tag: [None] * n for task_tag in task_tags}
+        for task_tag, k, criterio, futuro in pendientes:
+            gen_ids = futuro.result()
+            self._comprobar_interrupcion(criterio, [items[k]])
+            gen_text = manager.processor.batch_decode(gen_ids, skip_special_tokens=False)[0]
+            salidas[task_tag][k] = self._post_procesar(manager, gen_text, task_tag, items[k]["image_size"])
+        return salidas
+
+    # ------------------------------------------------------------------
+    #  Decodificación asistida
+    # ------------------------------------------------------------------
+    def _asistente_aplicable(self, manager, grupo: List[Tuple[str, str]]) -> bool:
+        """
+        Grupos de una tarea cuyo nivel tenga asistencia, con el modelo de PyTorch
+        (el `generate` de ONNX ignora `assistant_model`).
+        """
+        return (
+            self.asistente is not None
+            and len(grupo) == 1
+            and self.asistente.aplica(grupo[0][1])
+            and hasattr(manager.model, "language_model")
+        )
+
+    def _usar_asistente(self, manager, grupo: List[Tuple[str, str]]) -> bool:
+        """Como `_asistente_aplicable`, y además con el borrador cargado."""
+        return self._asistente_aplicable(manager, grupo) and self.asistente.preparar(manager.model.device)
+
+    def _parametros_asistidos(self, detail_level: str) -> Dict:
+        """Preset sin beams marcado como asistido (la caché no lo mezcla con la salida sin borrador)."""
+        return {**self._parametros_sin_beams(detail_level), "asistido": True}
+
+    def _generar_asistido(self, manager, image_features, items: List[Dict], tarea: Tuple[str, str],
+                          limite: Optional[float], usados: Dict[str, Dict]) -> Dict[str, List]:
+        """
+        Una llamada a `generate` por imagen con el borrador como `assistant_model`.
+
+        Si la versión de transformers o el checkpoint no admiten la asistencia,
+        se desactiva y el grupo se genera por el camino normal. `usados` recibe
+        los parámetros con los que se generó al final.
+        """
+        task_tag, detail_level = tarea
+        model = manager.model
+        params = self._parametros_sin_beams(detail_level)
+        tokens = self._tokenizar_prompts(manager, [task_tag])
+        salidas = []
+        try:
+            for k, item in enumerate(items):
+                inputs_embeds, attention_mask = self._fusionar_embeddings(manager, image_features[k:k + 1], tokens)
+                encoder_borrador = self.asistente.salidas_encoder(
+                    self._pixel_values(manager, [item]), tokens["input_ids"], attention_mask
+                )
+                criterios, criterio = self._criterios_parada(limite)
+                contador, restaurar = self.asistente.contar_propuestas()
+                t0 = time.perf_counter()
+                try:
+                    with torch.no_grad():
+                        gen_ids = model.generate(
+                            input_ids=None,
+                            inputs_embeds=inputs_embeds,
+                            attention_mask=attention_mask,
+                            assistant_model=self.asistente.modelo_asistente(),
+                            assistant_encoder_outputs=encoder_borrador,
+                            stopping_criteria=criterios,
+                            **params
+                        )
+                finally:
+                    restaurar()
+                self.asistente.registrar(detail_level, gen_ids.shape[-1] - 1, contador, time.perf_counter() - t0)
+                self._comprobar_interrupcion(criterio, [item])
+
+                gen_text = manager.processor.batch_decode(gen_ids, skip_special_tokens=False)[0]
+                salidas.append(self._post_procesar(manager, gen_text, task_tag, item["image_size"]))
+        except GeneracionInterrumpida:
+            raise
+        except (TypeError, ValueError, AttributeError) as exc:
+            self.asistente.desactivar(str(exc))
+            usados[task_tag] = self._get_generation_params(detail_level)
+            return self._generar_con_features(manager, image_features, items, [tarea], limite)
+        usados[task_tag] = self._parametros_asistidos(detail_level)
+        return {task_tag: salidas}
+
+    # ------------------------------------------------------------------
+    #  Cancelación y límite de tiempo
+    # ------------------------------------------------------------------
+    def _nuevo_limite(self) -> Optional[float]:
+        """Instante en que se agota el tiempo del lote que empieza ahora (todas sus imágenes a la vez)."""
+        return time.monotonic() + self.limite_por_imagen_s if self.limite_por_imagen_s > 0 else None
+
+    def _criterios_parada(self, limite: Optional[float]):
+        """`StoppingCriteriaList` para `generate` y el criterio para leer después el motivo."""
+        from transformers import StoppingCriteriaList
+        from core.generation_utils import CriterioInterrupcion
+
+        criterio = CriterioInterrupcion(self.cancel_token, limite)
+        return StoppingCriteriaList([criterio]), criterio
+
+    def _comprobar_interrupcion(self, criterio, items: List[Dict]):
+        """Marca los items si `generate` se cortó; cancelar o abortar descarta la salida."""
+        if criterio.motivo is None:
+            return
+        for item in items:
+            item["interrumpido"] = criterio.motivo
+        if criterio.motivo == MOTIVO_CANCELADO or self.accion_limite == "abortar":
+            raise GeneracionInterrumpida(criterio.motivo)
+
+    @staticmethod
+    def _marcar(resultado: Dict, item: Dict) -> Dict:
+        if item.get("interrumpido"):
+            resultado["interrumpido"] = item["interrumpido"]
+        return resultado
+
+    @staticmethod
+    def _resultado_interrumpido(image_path: str, motivo: str) -> Dict:
+        mensaje = "Cancelado por el usuario" if motivo == MOTIVO_CANCELADO else "Tiempo de generación agotado"
+        return {"error": mensaje, "interrumpido": motivo, "archivo": Path(image_path).name}
 
-        # 4. Decodificar y post‑procesar
-        gen_text = self.manager.processor.batch_decode(gen_ids, skip_special_tokens=False)[0]
-        parsed = self.manager.processor.post_process_generation(
-            gen_text, task=task_tag, image_size=(image.width, image.height)
+    def _post_procesar(self, manager, gen_text: str, task_tag: str, image_size: Tuple[int, int]):
+        """Aplica `post_process_generation` de Florence‑2 a un texto generado."""
+        parsed = manager.processor.post_process_generation(
+            gen_text, task=task_tag, image_size=tuple(image_size)
         )
         # Florence‑2 devuelve dict en OC / OD tareas
         if isinstance(parsed, dict):
@@ -0,0 +1,132 @@
+"""
+Caché persistente de resultados de inferencia de Florence‑2.
+
+Guarda en SQLite (junto a stockprep_images.db) la salida post‑procesada de
+cada tarea, indexada por (hash del contenido de la imagen, tarea, firma del
+modelo, parámetros de generación). Volver a procesar una carpeta, o ficheros
+que solo se han renombrado, no repite la inferencia.
+
+Solo se cachean tareas deterministas (`do_sample=False`): con sampling dos
+ejecuciones pueden dar textos distintos y servir uno guardado no sería fiel.
+"""
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional
+
+
+class InferenceCache:
+    """
+    Caché clave → resultado con expulsión LRU por tamaño total.
+
+    Args:
+        db_path: Fichero SQLite de la caché
+        max_mb: Tamaño máximo de los resultados guardados; al superarlo se
+            expulsan las entradas usadas hace más tiempo
+    """
+
+    def __init__(self, db_path: str = "stockprep_cache.db", max_mb: float = 64):
+        self.db_path = db_path
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.logger = logging.getLogger(__name__)
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._init_database()
+
+    def _init_database(self):
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS inference_cache (
+                    clave TEXT PRIMARY KEY,
+                    resultado TEXT NOT NULL,
+                    tamano INTEGER NOT NULL,
+                    creado REAL NOT NULL,
+                    ultimo_acceso REAL NOT NULL
+                )
+            """)
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_cache_ultimo_acceso ON inference_cache(ultimo_acceso)"
+            )
+
+    @staticmethod
+    def clave(content_hash: str, task_tag: str, firma_modelo: str, params: Dict) -> str:
+        """Clave estable a partir de los cuatro componentes."""
+        datos = json.dumps([content_hash, task_tag, firma_modelo, params], sort_keys=True, default=str)
+        return hashlib.sha256(datos.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def es_cacheable(params: Dict) -> bool:
+        return not params.get("do_sample", False)
+
+    def obtener(self, clave: str) -> Optional[Any]:
+        """Devuelve el resultado guardado o None; actualiza contadores y LRU."""
+        with self._lock:
+            try:
+                with sqlite3.connect(self.db_path) as conn:
+                    fila = conn.execute(
+                        "SELECT resultado FROM inference_cache WHERE clave = ?", (clave,)
+                    ).fetchone()
+                    if fila is None:
+                        self.misses += 1
+                        return None
+                    conn.execute(
+                        "UPDATE inference_cache SET ultimo_acceso = ? WHERE clave = ?", (time.time(), clave)
+                    )
+                self.hits += 1
+                return json.loads(fila[0])
+            except (sqlite3.Error, ValueError) as e:
+                self.logger.warning(f"Caché de inferencia no disponible: {e}")
+                self.misses += 1
+                return None
+
+    def guardar(self, clave: str, resultado: Any):
+        """Guarda un resultado y expulsa entradas antiguas si se supera `max_mb`."""
+        datos = json.dumps(resultado, ensure_ascii=False)
+        ahora = time.time()
+        with self._lock:
+            try:
+                with sqlite3.connect(self.db_path) as conn:
+                    conn.execute(
+                        "INSERT OR REPLACE INTO inference_cache VALUES (?, ?, ?, ?, ?)",
+                        (clave, datos, len(datos.encode("utf-8")), ahora, ahora),
+                    )
+                    self._expulsar(conn)
+            except sqlite3.Error as e:
+                self.logger.warning(f"No se pudo guardar en la caché de inferencia: {e}")
+
+    def _expulsar(self, conn: sqlite3.Connection):
+        total = conn.execute("SELECT COALESCE(SUM(tamano), 0) FROM inference_cache").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        exceso, claves = total - self.max_bytes, []
+        for clave, tamano in conn.execute(
+            "SELECT clave, tamano FROM inference_cache ORDER BY ultimo_acceso ASC"
+        ):
+            claves.append((clave,))
+            exceso -= tamano
+            if exceso <= 0:
+                break
+        conn.executemany("DELETE FROM inference_cache WHERE clave = ?", claves)
+
+    def estadisticas(self) -> Dict:
+        """Aciertos, fallos y ocupación de la caché."""
+        with sqlite3.connect(self.db_path) as conn:
+            entradas, tamano = conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(tamano), 0) FROM inference_cache"
+            ).fetchone()
+        consultas = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / consultas, 3) if consultas else 0.0,
+            "entradas": entradas,
+            "tamano_mb": round(tamano / 1024 / 1024, 2),
+        }
+
+    def limpiar(self):
+        with self._lock, sqlite3.connect(self.db_path) as conn:
+            conn.execute("DELETE FROM inference_cache")
@@ -0,0 +1,334 @@
+"""
+Diario persistente de trabajos por lotes.
+
+Cada lote (de BatchEngine o de la GUI) es un trabajo con su lista de entrada
+y el estado de cada imagen: pendiente → en vuelo → hecha / error. Si el
+proceso se cae a mitad, al reanudar se saltan las imágenes hechas y se
+reintentan las que estaban en vuelo.
+
+La lista de entrada se apunta según avanza el descubrimiento, y el trabajo
+recuerda si llegó a terminarlo: al reanudar uno que se cortó antes, se vuelve
+a recorrer la carpeta y se añade lo que falte. Un trabajo solo queda
+completado cuando el descubrimiento terminó y no queda nada pendiente.
+
+Los renombrados que hace el propio lote se apuntan en el momento, así que la
+ruta guardada siempre es la actual. Si una imagen en vuelo ya no está en su
+ruta (se renombró justo antes de la caída), se busca en su carpeta por tamaño
+y hash del contenido.
+
+Configuración (settings.yaml):
+
+    diario:
+      activado: true
+      ruta: stockprep_jobs.db
+"""
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from itertools import islice
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from core.cancelacion import MOTIVO_CANCELADO
+from core.model_manager import cargar_config_seccion
+
+# Estado de cada imagen
+PENDIENTE = "pending"
+EN_VUELO = "in_flight"
+HECHA = "done"
+ERROR = "error"
+
+# Estado del trabajo
+EN_CURSO = "running"
+DETENIDO = "stopped"
+COMPLETADO = "completed"
+
+
+def hash_fichero(ruta: str) -> Optional[str]:
+    """SHA‑256 del contenido (el mismo que `preparar_imagen`); None si no se puede leer."""
+    h = hashlib.sha256()
+    try:
+        with open(ruta, "rb") as f:
+            for bloque in iter(lambda: f.read(1 << 20), b""):
+                h.update(bloque)
+    except OSError:
+        return None
+    return h.hexdigest()
+
+
+def estado_de_resultado(resultado: Dict) -> str:
+    """
+    Estado final de una imagen según su resultado. Las cancelaciones del
+    usuario vuelven a pendiente (se reintentan al reanudar); los errores no.
+    """
+    if resultado.get("interrumpido") == MOTIVO_CANCELADO:
+        return PENDIENTE
+    return ERROR if resultado.get("error") else HECHA
+
+
+class JobJournal:
+    """
+    Trabajos e imágenes en SQLite (WAL), seguro entre hilos.
+
+    Args:
+        db_path: Fichero SQLite del diario
+    """
+
+    def __init__(self, db_path: str = "stockprep_jobs.db"):
+        self.db_path = db_path
+        self.logger = logging.getLogger(__name__)
+        self._lock = threading.Lock()
+        # Una conexión compartida: con decenas de miles de imágenes, abrir una por escritura pesa
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._init_database()
+
+    def _init_database(self):
+        with self._lock, self._conn:
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    origen TEXT NOT NULL,
+                    detail_level TEXT,
+                    estado TEXT NOT NULL,
+                    creado REAL NOT NULL,
+                    actualizado REAL NOT NULL,
+                    descubierto INTEGER NOT NULL DEFAULT 0
+                )
+            """)
+            columnas = {fila[1] for fila in self._conn.execute("PRAGMA table_info(jobs)")}
+            if "descubierto" not in columnas:
+                # Diarios anteriores: sin saber si el descubrimiento terminó, al reanudar se repite
+                self._conn.execute("ALTER TABLE jobs ADD COLUMN descubierto INTEGER NOT NULL DEFAULT 0")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS job_items (
+                    job_id TEXT NOT NULL,
+                    indice INTEGER NOT NULL,
+                    ruta TEXT NOT NULL,
+                    ruta_original TEXT NOT NULL,
+                    hash TEXT,
+                    tamano INTEGER,
+                    estado TEXT NOT NULL,
+                    error TEXT,
+                    actualizado REAL NOT NULL,
+                    PRIMARY KEY (job_id, indice)
+                )
+            """)
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_origen ON jobs(origen, estado)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_job_items_estado ON job_items(job_id, estado)")
+
+    # ------------------------------------------------------------------
+    #  Trabajos
+    # ------------------------------------------------------------------
+    def crear_trabajo(self, origen: str, detail_level: Optional[str] = None) -> str:
+        job_id = uuid.uuid4().hex[:12]
+        ahora = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO jobs (id, origen, detail_level, estado, creado, actualizado, descubierto) "
+                "VALUES (?, ?, ?, ?, ?, ?, 0)",
+                (job_id, str(origen), detail_level, EN_CURSO, ahora, ahora),
+            )
+        return job_id
+
+    def trabajo_pendiente(self, origen: str, detail_level: Optional[str] = None) -> Optional[str]:
+        """Último trabajo sin completar de ese origen (y nivel de detalle, si se indica)."""
+        consulta = "SELECT id FROM jobs WHERE origen = ? AND estado != ?"
+        params = [str(origen), COMPLETADO]
+        if detail_level is not None:
+            consulta += " AND detail_level = ?"
+            params.append(detail_level)
+        with self._lock:
+            fila = self._conn.execute(consulta + " ORDER BY creado DESC LIMIT 1", params).fetchone()
+        return fila[0] if fila else None
+
+    def finalizar(self, job_id: str):
+        """
+        Cierra el trabajo: completado si el descubrimiento terminó y no queda
+        nada pendiente, detenido en otro caso.
+        """
+        resumen = self.resumen(job_id)
+        completo = self.descubierto(job_id) and not (resumen.get(PENDIENTE) or resumen.get(EN_VUELO))
+        estado = COMPLETADO if completo else DETENIDO
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE jobs SET estado = ?, actualizado = ? WHERE id = ?", (estado, time.time(), job_id)
+            )
+        return estado
+
+    def descubierto(self, job_id: str) -> bool:
+        """Si la lista de entrada del trabajo está completa."""
+        with self._lock:
+            fila = self._conn.execute("SELECT descubierto FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return bool(fila and fila[0])
+
+    def resumen(self, job_id: str) -> Dict[str, int]:
+        """Nº de imágenes por estado."""
+        with self._lock:
+            return dict(self._conn.execute(
+                "SELECT estado, COUNT(*) FROM job_items WHERE job_id = ? GROUP BY estado", (job_id,)
+            ).fetchall())
+
+    # ------------------------------------------------------------------
+    #  Lista de entrada
+    # ------------------------------------------------------------------
+    def agregar(self, job_id: str, items: Iterable[Tuple[int, str]]):
+        ahora = time.time()
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO job_items (job_id, indice, ruta, ruta_original, estado, actualizado) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                [(job_id, indice, str(ruta), str(ruta), PENDIENTE, ahora) for indice, ruta in items],
+            )
+
+    def registrar_entradas(self, job_id: str, rutas: Iterable, bloque: int = 256) -> Iterator[Tuple[int, str]]:
+        """
+        Apunta las rutas según llegan (en bloques, una transacción por bloque)
+        y las devuelve como `(indice, ruta)`; cada ruta queda en el diario
+        antes de entrar en el lote.
+
+        Las rutas que el trabajo ya tiene (actuales u originales) se saltan y
+        los índices siguen tras los existentes, así que sirve también para
+        completar la lista al reanudar. Solo si `rutas` se agota el trabajo
+        queda como descubierto; si el lote deja de leer antes, no.
+        """
+        with self._lock:
+            conocidas = set()
+            for ruta, original in self._conn.execute(
+                "SELECT ruta, ruta_original FROM job_items WHERE job_id = ?", (job_id,)
+            ):
+                conocidas.add(ruta)
+                conocidas.add(original)
+            (ultimo,) = self._conn.execute(
+                "SELECT MAX(indice) FROM job_items WHERE job_id = ?", (job_id,)
+            ).fetchone()
+        indice = 0 if ultimo is None else ultimo + 1
+
+        nuevas = (str(ruta) for ruta in rutas if str(ruta) not in conocidas)
+        while True:
+            lote = [(indice + i, ruta) for i, ruta in enumerate(islice(nuevas, bloque))]
+            if not lote:
+                break
+            self.agregar(job_id, lote)
+            indice += len(lote)
+            yield from lote
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE jobs SET descubierto = 1, actualizado = ? WHERE id = ?", (time.time(), job_id)
+            )
+
+    def reanudar(self, job_id: str) -> List[Tuple[int, str]]:
+        """
+        Devuelve `(indice, ruta)` de lo que falta por hacer, en orden. Las
+        imágenes en vuelo vuelven a pendiente y se relocalizan si no están en su ruta.
+        """
+        with self._lock:
+            filas = self._conn.execute(
+                "SELECT indice, ruta, hash, tamano, estado FROM job_items "
+                "WHERE job_id = ? AND estado IN (?, ?) ORDER BY indice",
+                (job_id, PENDIENTE, EN_VUELO),
+            ).fetchall()
+            conocidas = {r for (r,) in self._conn.execute(
+                "SELECT ruta FROM job_items WHERE job_id = ?", (job_id,)
+            )}
+
+        pendientes, cambios = [], []
+        for indice, ruta, hash_, tamano, estado in filas:
+            if estado == EN_VUELO and not os.path.exists(ruta) and hash_:
+                nueva = self._relocalizar(ruta, hash_, tamano, conocidas)
+                if nueva:
+                    self.logger.info(f"♻️ {Path(ruta).name} se renombró a {Path(nueva).name}")
+                    ruta = nueva
+                    conocidas.add(nueva)
+            pendientes.append((indice, ruta))
+            cambios.append((ruta, PENDIENTE, time.time(), job_id, indice))
+
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "UPDATE job_items SET ruta = ?, estado = ?, actualizado = ? WHERE job_id = ? AND indice = ?",
+                cambios,
+            )
+            self._conn.execute(
+                "UPDATE jobs SET estado = ?, actualizado = ? WHERE id = ?", (EN_CURSO, time.time(), job_id)
+            )
+        return pendientes
+
+    @staticmethod
+    def _relocalizar(ruta: str, hash_: str, tamano: Optional[int], conocidas: set) -> Optional[str]:
+        """Busca en la carpeta de `ruta` un fichero desconocido con el mismo tamaño y contenido."""
+        try:
+            entradas = list(os.scandir(os.path.dirname(ruta) or "."))
+        except OSError:
+            return None
+        for entrada in entradas:
+            if entrada.path in conocidas or not entrada.is_file():
+                continue
+            try:
+                if tamano is not None and entrada.stat().st_size != tamano:
+                    continue
+            except OSError:
+                continue
+            if hash_fichero(entrada.path) == hash_:
+                return entrada.path
+        return None
+
+    # ------------------------------------------------------------------
+    #  Estado por imagen
+    # ------------------------------------------------------------------
+    def marcar_en_vuelo(self, job_id: str, items: Iterable[Tuple[int, str, Optional[str]]]):
+        """
+        `items`: `(indice, ruta, hash)`; el tamaño se lee aquí para poder relocalizar.
+
+        Sin hash (pool de CPU y GUI, que no preparan la imagen en este proceso)
+        se calcula aquí, antes de que el lote pueda renombrar el fichero.
+        """
+        ahora = time.time()
+        filas = []
+        for indice, ruta, hash_ in items:
+            try:
+                tamano = os.path.getsize(ruta)
+            except OSError:
+                tamano = None
+            filas.append((EN_VUELO, hash_ or hash_fichero(ruta), tamano, ahora, job_id, indice))
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "UPDATE job_items SET estado = ?, hash = COALESCE(?, hash), tamano = COALESCE(?, tamano), "
+                "actualizado = ? WHERE job_id = ? AND indice = ?",
+                filas,
+            )
+
+    def registrar_ruta(self, job_id: str, indice: int, ruta: str):
+        """Apunta un renombrado hecho por el lote."""
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE job_items SET ruta = ?, actualizado = ? WHERE job_id = ? AND indice = ?",
+                (str(ruta), time.time(), job_id, indice),
+            )
+
+    def marcar(self, job_id: str, indice: int, estado: str, error: Optional[str] = None):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE job_items SET estado = ?, error = ?, actualizado = ? WHERE job_id = ? AND indice = ?",
+                (estado, error, time.time(), job_id, indice),
+            )
+
+    def cerrar(self):
+        with self._lock:
+            self._conn.close()
+
+
+def crear_diario_desde_config() -> Optional[JobJournal]:
+    """Diario según `diario` de settings.yaml, o None si está desactivado."""
+    config = cargar_config_seccion("diario")
+    if not config.get("activado", True):
+        return None
+    try:
+        return JobJournal(config.get("ruta", "stockprep_jobs.db"))
+    except sqlite3.Error as e:
+        logging.getLogger(__name__).warning(f"⚠️ Diario de trabajos no disponible: {e}")
+        return None
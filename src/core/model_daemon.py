@@ -0,0 +1,421 @@
+"""
+Daemon local que mantiene Florence‑2 cargado entre ejecuciones.
+
+Cargar el modelo tarda minutos; con el daemon, la CLI y la GUI reutilizan un
+único `Florence2Manager` ya cargado a través de un socket Unix local.
+
+Protocolo: una petición JSON por línea y una respuesta JSON por línea.
+
+    {"cmd": "ping"}                              -> {"ok": true, "pid": ..., "modelo_cargado": ...}
+    {"cmd": "status"}                            -> {"ok": true, "device_info": {...}, ...}
+    {"cmd": "load"} / {"cmd": "unload"}          -> {"ok": true}
+    {"cmd": "process", "path": ..., "detail_level": ..., "tasks": [...]}
+                                                 -> {"ok": true, "result": {...}}
+    {"cmd": "process_batch", "paths": [...], "detail_level": ..., "batch_size": 4}
+                                                 -> {"ok": true, "results": [...]}
+    {"cmd": "cancel", "id": ...}                 -> {"ok": true}
+    {"cmd": "shutdown"}                          -> {"ok": true}
+
+`process` y `process_batch` admiten además `id` (para cancelarlas con
+`cancel` desde otra conexión), `cancelado` (llega ya cancelada) y `limite_s`
+(tiempo máximo de generación por imagen, como `procesamiento.limite_por_imagen_s`).
+Ambos se comprueban en cada token con `CriterioInterrupcion`; la imagen
+interrumpida vuelve con `interrumpido`, igual que sin daemon.
+
+Hay un solo modelo: las peticiones de todos los clientes se atienden de una
+en una, en orden de llegada. `ping` y `cancel` no esperan a las demás.
+
+El modelo se carga con la primera petición que lo necesita y se descarga
+tras `daemon.descarga_inactivo_s` segundos sin uso; la siguiente petición lo
+vuelve a cargar. En sistemas sin AF_UNIX el cliente informa de que no hay
+daemon y la aplicación carga el modelo en su propio proceso.
+
+Arranque: `python main.py --daemon`
+"""
+import json
+import logging
+import os
+import socket
+import socketserver
+import tempfile
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from core.cancelacion import CancellationToken
+
+logger = logging.getLogger(__name__)
+
+AF_UNIX_DISPONIBLE = hasattr(socket, "AF_UNIX")
+
+
+def _config_daemon() -> Dict:
+    from core.model_manager import cargar_config_seccion
+    return cargar_config_seccion("daemon")
+
+
+def ruta_socket_por_defecto() -> str:
+    """`daemon.socket` en settings.yaml o un socket por usuario en el directorio temporal."""
+    configurada = os.environ.get("STOCKPREP_DAEMON_SOCKET") or _config_daemon().get("socket")
+    if configurada:
+        return str(Path(configurada).expanduser())
+    uid = os.getuid() if hasattr(os, "getuid") else 0
+    return str(Path(tempfile.gettempdir()) / f"stockprep-{uid}.sock")
+
+
+# ============================================================================
+# Servidor
+# ============================================================================
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        for linea in self.rfile:
+            if not linea.strip():
+                continue
+            peticion = {}
+            try:
+                peticion = json.loads(linea)
+                respuesta = self.server.modelo_daemon.atender(peticion)
+            except Exception as exc:
+                logger.exception("Error atendiendo petición del daemon")
+                respuesta = {"ok": False, "error": str(exc)}
+            self.wfile.write((json.dumps(respuesta, ensure_ascii=False, default=str) + "\n").encode("utf-8"))
+            self.wfile.flush()
+            if peticion.get("cmd") == "shutdown":
+                threading.Thread(target=self.server.shutdown, daemon=True).start()
+                return
+
+
+class _Servidor(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class ModelDaemon:
+    """
+    Dueño de un `Florence2Manager` cargado, servido por socket Unix.
+
+    Args:
+        socket_path: Ruta del socket (ver `ruta_socket_por_defecto`)
+        idle_unload_s: Segundos sin peticiones antes de descargar el modelo (0 = nunca)
+    """
+
+    def __init__(self, socket_path: Optional[str] = None, idle_unload_s: Optional[float] = None):
+        from core.image_processor import ImageProcessor
+        from core.model_manager import crear_model_manager
+
+        config = _config_daemon()
+        self.socket_path = socket_path or ruta_socket_por_defecto()
+        self.idle_unload_s = float(idle_unload_s if idle_unload_s is not None
+                                   else config.get("descarga_inactivo_s", 1800))
+        self.manager = crear_model_manager()
+        self.processor = ImageProcessor(self.manager)
+        self._lock = threading.Lock()
+        # id -> cancelada, de las peticiones en curso o esperando a `self._lock`
+        self._peticiones: Dict[str, bool] = {}
+        self._en_curso: Optional[str] = None
+        self._lock_peticiones = threading.Lock()
+        self._ultimo_uso = time.monotonic()
+        self._servidor = None
+
+    # ------------------------------------------------------------------
+    #  Ciclo de vida del modelo
+    # ------------------------------------------------------------------
+    def _asegurar_modelo(self) -> bool:
+        """Carga el modelo si no lo está (bajo `self._lock`)."""
+        if self.manager.model is None:
+            logger.info("🔄 Daemon: cargando modelo...")
+            if not self.manager.cargar_modelo(callback=logger.info):
+                return False
+        return True
+
+    def _vigilar_inactividad(self):
+        while True:
+            time.sleep(max(1.0, min(30.0, self.idle_unload_s / 4)))
+            with self._lock:
+                inactivo = time.monotonic() - self._ultimo_uso
+                if self.manager.model is not None and inactivo >= self.idle_unload_s:
+                    logger.info(f"💤 Daemon: modelo descargado tras {inactivo:.0f}s sin uso")
+                    self.manager.descargar_modelo()
+
+    # ------------------------------------------------------------------
+    #  Peticiones
+    # ------------------------------------------------------------------
+    def atender(self, peticion: Dict) -> Dict:
+        cmd = peticion.get("cmd")
+        if cmd == "ping":
+            return {"ok": True, "pid": os.getpid(), "modelo_cargado": self.manager.model is not None}
+        if cmd == "shutdown":
+            return {"ok": True}
+        if cmd == "cancel":
+            self._cancelar(peticion.get("id"))
+            return {"ok": True}
+
+        id_peticion = peticion.get("id") or uuid.uuid4().hex
+        with self._lock_peticiones:
+            self._peticiones[id_peticion] = bool(peticion.get("cancelado"))
+        try:
+            return self._atender_en_orden(cmd, id_peticion, peticion)
+        finally:
+            with self._lock_peticiones:
+                self._peticiones.pop(id_peticion, None)
+                if self._en_curso == id_peticion:
+                    self._en_curso = None
+
+    def _cancelar(self, id_peticion: Optional[str]):
+        """Cancela la petición si está en curso o la marca si aún espera turno."""
+        with self._lock_peticiones:
+            if id_peticion not in self._peticiones:
+                return  # ya terminó
+            self._peticiones[id_peticion] = True
+            if self._en_curso == id_peticion:
+                self.processor.cancel_token.cancelar()
+
+    def _atender_en_orden(self, cmd: str, id_peticion: str, peticion: Dict) -> Dict:
+        """Atiende `peticion` con el modelo (una petición a la vez)."""
+        with self._lock:
+            self._ultimo_uso = time.monotonic()
+            if cmd == "status":
+                return {"ok": True, "device_info": self.manager.get_device_info(),
+                        "gpu_name": self.manager.get_gpu_name(), "backend": type(self.manager).__name__}
+            if cmd == "unload":
+                self.manager.descargar_modelo()
+                return {"ok": True}
+            if cmd not in ("load", "process", "process_batch"):
+                return {"ok": False, "error": f"Comando desconocido: {cmd}"}
+
+            if not self._asegurar_modelo():
+                return {"ok": False, "error": "No se pudo cargar el modelo en el daemon"}
+            if cmd == "load":
+                return {"ok": True}
+
+            with self._lock_peticiones:
+                self._en_curso = id_peticion
+                self.processor.cancel_token.reiniciar()
+                if self._peticiones.get(id_peticion):
+                    self.processor.cancel_token.cancelar()
+
+            # El límite del cliente solo dura esta petición (las demás esperan a `self._lock`)
+            limite_anterior = self.processor.limite_por_imagen_s
+            if peticion.get("limite_s") is not None:
+                self.processor.limite_por_imagen_s = float(peticion["limite_s"])
+            try:
+                detail_level = peticion.get("detail_level", "largo")
+                tasks = peticion.get("tasks")
+                if cmd == "process":
+                    return {"ok": True, "result": self.processor.process_image(peticion["path"], detail_level, tasks)}
+                return {"ok": True, "results": self.processor.process_images(
+                    peticion["paths"], detail_level, peticion.get("batch_size", 4), tasks
+                )}
+            finally:
+                self.processor.limite_por_imagen_s = limite_anterior
+
+    def servir(self):
+        """Escucha en el socket hasta recibir `shutdown`."""
+        if not AF_UNIX_DISPONIBLE:
+            raise RuntimeError("Este sistema no soporta sockets Unix (AF_UNIX)")
+        if DaemonClient(self.socket_path).disponible():
+            raise RuntimeError(f"Ya hay un daemon escuchando en {self.socket_path}")
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)  # socket huérfano de una ejecución anterior
+
+        self._servidor = _Servidor(self.socket_path, _Handler)
+        self._servidor.modelo_daemon = self
+        os.chmod(self.socket_path, 0o600)
+        if self.idle_unload_s > 0:
+            threading.Thread(target=self._vigilar_inactividad, name="stockprep-daemon-idle", daemon=True).start()
+
+        logger.info(f"🛰️ Daemon del modelo escuchando en {self.socket_path}")
+        try:
+            self._servidor.serve_forever()
+        finally:
+            self._servidor.server_close()
+            if os.path.exists(self.socket_path):
+                os.unlink(self.socket_path)
+            self.manager.descargar_modelo()
+            logger.info("🛑 Daemon detenido")
+
+
+# ============================================================================
+# Cliente y sustitutos de Florence2Manager / ImageProcessor
+# ============================================================================
+
+class DaemonClient:
+    """Cliente JSON‑lines del daemon (una conexión por petición)."""
+
+    def __init__(self, socket_path: Optional[str] = None, timeout_ping: float = 2.0):
+        self.socket_path = socket_path or ruta_socket_por_defecto()
+        self.timeout_ping = timeout_ping
+
+    def enviar(self, peticion: Dict, timeout: Optional[float] = None) -> Dict:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as conexion:
+            conexion.settimeout(timeout)
+            conexion.connect(self.socket_path)
+            conexion.sendall((json.dumps(peticion, ensure_ascii=False) + "\n").encode("utf-8"))
+            with conexion.makefile("rb") as lector:
+                linea = lector.readline()
+        if not linea:
+            raise ConnectionError("El daemon cerró la conexión sin responder")
+        return json.loads(linea)
+
+    def disponible(self) -> bool:
+        """True si hay un daemon respondiendo en el socket."""
+        if not AF_UNIX_DISPONIBLE or not os.path.exists(self.socket_path):
+            return False
+        try:
+            return bool(self.enviar({"cmd": "ping"}, timeout=self.timeout_ping).get("ok"))
+        except (OSError, ValueError):
+            return False
+
+
+class _CancelacionRemota(CancellationToken):
+    """`cancel_token` del cliente: al cancelar, avisa al daemon de la petición en curso."""
+
+    def __init__(self, cliente: DaemonClient):
+        super().__init__()
+        self.cliente = cliente
+        self.peticion: Optional[str] = None
+
+    def cancelar(self):
+        super().cancelar()
+        peticion = self.peticion
+        if peticion is None:
+            return
+        try:
+            self.cliente.enviar({"cmd": "cancel", "id": peticion}, timeout=self.cliente.timeout_ping)
+        except (OSError, ValueError):
+            pass  # el daemon ya no está: la petición en curso fallará por su cuenta
+
+
+class DaemonModelManager:
+    """Sustituye a `Florence2Manager` en la GUI cuando el modelo vive en el daemon."""
+
+    def __init__(self, cliente: DaemonClient):
+        self.cliente = cliente
+        self.model = None
+        self._estado: Dict = {}
+
+    def cargar_modelo(self, callback=None) -> bool:
+        if callback:
+            callback("🛰️ Usando el modelo del daemon local...")
+        respuesta = self.cliente.enviar({"cmd": "load"})
+        if not respuesta.get("ok"):
+            if callback:
+                callback(f"❌ {respuesta.get('error')}")
+            return False
+        self._estado = self.cliente.enviar({"cmd": "status"}, timeout=self.cliente.timeout_ping)
+        self.model = "daemon"
+        if callback:
+            callback("✅ Modelo del daemon listo")
+        return True
+
+    def descargar_modelo(self):
+        # El daemon es compartido: solo se suelta la referencia local
+        self.model = None
+
+    def get_device_info(self) -> Dict:
+        return self._estado.get("device_info", {"device": "daemon", "model_loaded": self.model is not None})
+
+    def get_gpu_name(self) -> str:
+        return self._estado.get("gpu_name", "CPU")
+
+    def check_gpu_memory_sufficient(self, required_gb=4.0):
+        return True, "El modelo se ejecuta en el daemon local"
+
+
+class DaemonImageProcessor:
+    """
+    API de `ImageProcessor` servida por el daemon.
+
+    Las keywords se recalculan aquí con el extractor local para respetar el
+    idioma elegido en la aplicación. `cancel_token.cancelar()` detiene la
+    generación en el daemon y el límite de tiempo es el de la configuración local.
+    """
+
+    def __init__(self, cliente: DaemonClient, keyword_extractor=None, idioma: str = "es"):
+        from core.model_manager import cargar_config_seccion
+        from utils.keyword_extractor import KeywordExtractor
+
+        self.cliente = cliente
+        self.keyword_extractor = keyword_extractor or KeywordExtractor(language=idioma)
+        self.cancel_token = _CancelacionRemota(cliente)
+        self.limite_por_imagen_s = float(cargar_config_seccion("procesamiento").get("limite_por_imagen_s") or 0)
+
+    def _enviar(self, peticion: Dict) -> Dict:
+        """Envía una petición de proceso cancelable con `cancel_token`."""
+        id_peticion = uuid.uuid4().hex
+        self.cancel_token.peticion = id_peticion
+        try:
+            return self.cliente.enviar({
+                **peticion, "id": id_peticion, "cancelado": self.cancel_token.cancelado,
+                "limite_s": self.limite_por_imagen_s,
+            })
+        finally:
+            self.cancel_token.peticion = None
+
+    def _completar(self, resultado: Dict) -> Dict:
+        if not resultado.get("error"):
+            resultado["keywords"] = self.extraer_keywords(resultado)
+            if isinstance(resultado.get("image_size"), list):
+                resultado["image_size"] = tuple(resultado["image_size"])
+        return resultado
+
+    def admite_streaming(self, detail_level: str) -> bool:
+        """El protocolo del daemon no transmite tokens."""
+        return False
+
+    def process_image(self, image_path: str, detail_level: str = "largo",
+                      tasks: Optional[List[str]] = None, on_token=None) -> Dict:
+        # El protocolo no transmite tokens: `on_token` se ignora y el resultado llega completo
+        try:
+            respuesta = self._enviar({
+                "cmd": "process", "path": str(Path(image_path).resolve()),
+                "detail_level": detail_level, "tasks": tasks,
+            })
+        except OSError as exc:
+            return {"error": f"Daemon no disponible: {exc}", "archivo": Path(image_path).name}
+        if not respuesta.get("ok"):
+            return {"error": respuesta.get("error"), "archivo": Path(image_path).name}
+        return self._completar(respuesta["result"])
+
+    def process_images(self, image_paths: List[str], detail_level: str = "largo",
+                       batch_size: int = 4, tasks: Optional[List[str]] = None) -> List[Dict]:
+        try:
+            respuesta = self._enviar({
+                "cmd": "process_batch", "paths": [str(Path(p).resolve()) for p in image_paths],
+                "detail_level": detail_level, "batch_size": batch_size, "tasks": tasks,
+            })
+        except OSError as exc:
+            respuesta = {"ok": False, "error": f"Daemon no disponible: {exc}"}
+        if not respuesta.get("ok"):
+            return [{"error": respuesta.get("error"), "archivo": Path(p).name} for p in image_paths]
+        return [self._completar(r) for r in respuesta["results"]]
+
+    def procesar_imagen(self, ruta_imagen: str, detail_level: str = "largo",
+                        tasks: Optional[List[str]] = None) -> Dict:
+        return self.process_image(ruta_imagen, detail_level, tasks)
+
+    def procesar_imagenes(self, rutas_imagenes: List[str], detail_level: str = "largo",
+                          batch_size: int = 4, tasks: Optional[List[str]] = None) -> List[Dict]:
+        return self.process_images(rutas_imagenes, detail_level, batch_size, tasks)
+
+    def extract_keywords(self, text: str) -> List[str]:
+        return self.keyword_extractor.extract_keywords(text)
+
+    def extraer_keywords(self, data) -> List[str]:
+        if isinstance(data, dict):
+            data = data.get("descripcion") or data.get("caption") or ""
+        return self.keyword_extractor.extract_keywords(data if isinstance(data, str) else "")
+
+    def change_language(self, new_language: str):
+        from utils.keyword_extractor import KeywordExtractor
+        self.keyword_extractor = KeywordExtractor(language=new_language)
+
+
+def conectar_daemon(keyword_extractor=None):
+    """Devuelve `(manager, processor)` del daemon si está activo, o None."""
+    cliente = DaemonClient()
+    if not cliente.disponible():
+        return None
+    return DaemonModelManager(cliente), DaemonImageProcessor(cliente, keyword_extractor)
@@ -1,78 +1,209 @@
 """
 Gestor del modelo Florence‑2 (versión parcheada para RTX 4090 y dtype coherente)
+
+El dtype sale de `modelo.dtype` en settings.yaml (float32, bfloat16, float16).
+En precisión reducida, si una clase de operación no está implementada para ese
+dtype, solo esa clase de módulo se ejecuta en fp32 y la llamada se repite.
+
+torch y transformers se importan al cargar el modelo, no al importar este
+módulo: la GUI y el gestor de base de datos arrancan sin pagar ese coste.
+
+La carga recuerda qué estrategia funcionó (mmap de safetensors, accelerate o
+low_cpu_mem_usage) para no repetir intentos fallidos, y desglosa sus tiempos.
 """
+from __future__ import annotations
 
+from contextlib import contextmanager
 from pathlib import Path
 from unittest.mock import patch
 
+import functools
 import gc
+import hashlib
+import json
 import os
+import re
+import time
 import yaml
 
-import torch
-from transformers import AutoModelForCausalLM, AutoProcessor
-from transformers.dynamic_module_utils import get_imports
+from utils.lazy_import import lazy_import
+
+torch = lazy_import("torch")
 
-# ============================================================================
-# OPTIMIZACIONES GPU PARA RTX 4090 - MÁXIMO RENDIMIENTO
-# ============================================================================
+# Se fija antes de que torch inicialice CUDA (solo afecta a la primera importación)
+os.environ.setdefault("PYTORCH_CUDA_ALLOC_CONF", "max_split_size_mb:512,roundup_power2_divisions:16")
 
-# 1. Activar optimizaciones Tensor Cores (TF32) para Ampere+
-# Proporciona ~1.6x aceleración en operaciones matriciales con mínima pérdida de precisión
-torch.backends.cuda.matmul.allow_tf32 = True
-torch.backends.cudnn.allow_tf32 = True
+_BACKEND_CUDA_CONFIGURADO = False
 
-# 2. Optimizar asignación de memoria CUDA
-# Reduce fragmentación y mejora eficiencia de memoria
-torch.backends.cuda.caching_allocator_settings = "max_split_size_mb:512"
 
-# 3. Habilitar fusión de operaciones en cuDNN (cuando esté disponible)
-# Combina operaciones para reducir overhead
-torch.backends.cudnn.benchmark = True
+def configurar_backend_cuda():
+    """
+    Optimizaciones GPU (RTX 4090 y Ampere+). Se aplican una vez, al cargar el
+    modelo, para no importar torch al importar este módulo.
+    """
+    global _BACKEND_CUDA_CONFIGURADO
+    if _BACKEND_CUDA_CONFIGURADO:
+        return
+    _BACKEND_CUDA_CONFIGURADO = True
+
+    # 1. Activar optimizaciones Tensor Cores (TF32) para Ampere+
+    # Proporciona ~1.6x aceleración en operaciones matriciales con mínima pérdida de precisión
+    torch.backends.cuda.matmul.allow_tf32 = True
+    torch.backends.cudnn.allow_tf32 = True
+
+    # 2. Optimizar asignación de memoria CUDA
+    # Reduce fragmentación y mejora eficiencia de memoria
+    torch.backends.cuda.caching_allocator_settings = "max_split_size_mb:512"
+
+    # 3. Habilitar fusión de operaciones en cuDNN (cuando esté disponible)
+    # Combina operaciones para reducir overhead
+    torch.backends.cudnn.benchmark = True
+
+
+ROOT_DIR = Path(__file__).resolve().parents[2]
+
+# Valores aceptados en `modelo.dtype` -> atributo de torch
+DTYPES = {
+    "float32": "float32", "fp32": "float32",
+    "bfloat16": "bfloat16", "bf16": "bfloat16",
+    "float16": "float16", "fp16": "float16", "half": "float16",
+}
+
+# Estrategias de carga de pesos, en orden de preferencia
+ESTRATEGIAS_CARGA = ("mmap", "device_map", "low_cpu_mem")
+
+# Processors ya resueltos por checkpoint (tokenizer + código remoto); se reutilizan
+# al recargar tras una descarga por inactividad o en el registro de modelos.
+# Entre procesos se reutiliza la copia de `_ruta_cache_processor`
+_PROCESSORS: dict = {}
+
+# Kernel que aparece en el error de PyTorch -> clase de módulo (torch.nn) que lo ejecuta
+FP32_FALLBACK_OPS = [
+    (re.compile(r"layer_?norm", re.I), "LayerNorm"),
+    (re.compile(r"group_?norm", re.I), "GroupNorm"),
+    (re.compile(r"batch_?norm", re.I), "BatchNorm2d"),
+    (re.compile(r"conv", re.I), "Conv2d"),
+    (re.compile(r"addmm|baddbmm|\bbmm\b|\bmm\b|matmul|linear", re.I), "Linear"),
+    (re.compile(r"embedding", re.I), "Embedding"),
+]
 
-# 4. Configurar estrategia de memoria para modelos grandes
-# Permite usar más memoria virtual si es necesario
-os.environ.setdefault("PYTORCH_CUDA_ALLOC_CONF", "max_split_size_mb:512,roundup_power2_divisions:16")
+
+def cargar_config_seccion(seccion: str) -> dict:
+    """Lee una sección de config/settings.yaml (vacía si no existe)."""
+    cfg_file = ROOT_DIR / "config/settings.yaml"
+    if not cfg_file.is_file():
+        return {}
+    try:
+        with open(cfg_file, "r", encoding="utf-8") as f:
+            config = yaml.safe_load(f) or {}
+        return config.get(seccion, {}) or {}
+    except Exception:
+        return {}
+
+
+def cargar_config_modelo() -> dict:
+    """Lee la sección `modelo` de config/settings.yaml (vacía si no existe)."""
+    return cargar_config_seccion("modelo")
 
 
 class Florence2Manager:
     """Carga y gestiona un checkpoint local de Florence‑2."""
 
-    def __init__(self):
+    def __init__(self, cpu_quantization: str | None = None, model_path: str | None = None):
+        """
+        Args:
+            cpu_quantization: "int8" para cuantización dinámica de las capas Linear
+                cuando el modelo corre en CPU; "none" para fp32. Por defecto se
+                toma de `modelo.cuantizacion_cpu` en settings.yaml o de la
+                variable de entorno STOCKPREP_CPU_QUANT.
+            model_path: Carpeta del checkpoint. Por defecto FLORENCE2_MODEL_PATH
+                o `modelo.ruta_local` (el registro de modelos pasa una por variante).
+        """
         self.model = None
         self.processor = None
         
-        # Detección mejorada de dispositivo
-        self.device = self._detect_best_device()
-        self.gpu_info = self._get_gpu_info()
+        # Dispositivo, GPU y dtype se resuelven al usarlos (importan torch)
+        self._device = None
+        self._gpu_info = None
+        self._dtype = None
         
+        self.config = cargar_config_modelo()
         env_path = os.getenv("FLORENCE2_MODEL_PATH")
-        model_path: Path | None = None
 
-        if env_path:
+        if model_path:
+            model_path = Path(model_path)
+        elif env_path:
             model_path = Path(env_path)
-        else:
-            cfg_file = Path(__file__).resolve().parents[2] / "config/settings.yaml"
-            if cfg_file.is_file():
-                try:
-                    with open(cfg_file, "r", encoding="utf-8") as f:
-                        config = yaml.safe_load(f) or {}
-                    ruta = config.get("modelo", {}).get("ruta_local")
-                    if ruta:
-                        model_path = Path(ruta)
-                except Exception:
-                    model_path = None
+        elif self.config.get("ruta_local"):
+            model_path = Path(self.config["ruta_local"])
 
-        if model_path is None:
-            root_dir = Path(__file__).resolve().parents[2]
-            model_path = root_dir / "models/Florence-2-large-ft-safetensors"
+        if not model_path:
+            model_path = ROOT_DIR / "models/Florence-2-large-ft-safetensors"
 
         self.model_id = str(model_path.expanduser().resolve())
 
+        # Cuantización int8 opcional (solo CPU)
+        self.cpu_quantization = (
+            cpu_quantization
+            or os.getenv("STOCKPREP_CPU_QUANT")
+            or self.config.get("cuantizacion_cpu")
+            or "none"
+        ).lower()
+        self.quantize_encoder = bool(self.config.get("cuantizar_encoder", False))
+        self.quantized = False
+
+        # Calibración de hilos en CPU y pasada de calentamiento al cargar
+        # (el pool de workers fija sus propios hilos y desactiva el autoajuste)
+        self.autoajuste_cpu = bool(self.config.get("autoajuste_cpu", True))
+        self.calentar_al_cargar = bool(self.config.get("calentar_al_cargar", True))
+
+        self._fp32_fallbacks = set()
+        self._callback = None
+        # Desglose de la última carga: processor, config, pesos, dispositivo
+        self.tiempos_carga: dict = {}
+        self.estrategia_carga: str | None = None
+
+    # ---------------------------------------------------------------------
+    #  Atributos perezosos (la primera lectura importa torch)
+    # ---------------------------------------------------------------------
+    @property
+    def device(self) -> str:
+        """Detección mejorada de dispositivo"""
+        if self._device is None:
+            self._device = self._detect_best_device()
+        return self._device
+
+    @device.setter
+    def device(self, valor: str):
+        self._device = valor
+
+    @property
+    def gpu_info(self) -> dict:
+        if self._gpu_info is None:
+            self._gpu_info = self._get_gpu_info()
+        return self._gpu_info
+
+    @gpu_info.setter
+    def gpu_info(self, valor: dict):
+        self._gpu_info = valor
+
+    @property
+    def dtype(self):
+        """Precisión de pesos, entradas y generación"""
+        if self._dtype is None:
+            self._dtype = self._resolver_dtype(self.config.get("dtype"))
+        return self._dtype
+
+    @dtype.setter
+    def dtype(self, valor):
+        self._dtype = valor
+
     # ---------------------------------------------------------------------
     #  Utilidad para evitar que Flash‑Attn se cargue si no está disponible
     # ---------------------------------------------------------------------
     def _fixed_get_imports(self, filename):
+        from transformers.dynamic_module_utils import get_imports
+
         imports = get_imports(filename)
         if str(filename).endswith("modeling_florence2.py") and "flash_attn" in imports:
             imports = [imp for imp in imports if imp != "flash_attn"]
@@ -83,10 +214,23 @@ class Florence2Manager:
     #  Carga de modelo y processor
     # ---------------------------------------------------------------------
     def cargar_modelo(self, callback=None):
-        """Carga Florence‑2 en **float32** para evitar errores de tipo mezclado."""
+        """Carga Florence‑2 en el dtype configurado (`modelo.dtype`, fp32 por defecto)."""
+        self._callback = callback
+        self.tiempos_carga = {}
+        inicio = time.perf_counter()
         try:
+            configurar_backend_cuda()
+
+            # int8 dinámico parte siempre de pesos fp32
+            if self.device == "cpu" and self.cpu_quantization == "int8":
+                self.dtype = torch.float32
+            elif not self._dtype_soportado(self.dtype):
+                if callback:
+                    callback(f"⚠️ {self._nombre_dtype()} no soportado en {self.device}, usando float32")
+                self.dtype = torch.float32
+
             if callback:
-                callback("🧠 Cargando modelo desde carpeta local (dtype float32)…")
+                callback(f"🧠 Cargando modelo desde carpeta local (dtype {self._nombre_dtype()})…")
                 
                 # Mostrar información de dispositivo
                 if self.gpu_info["available"]:
@@ -106,39 +250,25 @@ class Florence2Manager:
                 if callback:
                     callback("📝 Cargando tokenizer y processor...")
                     
-                self.processor = AutoProcessor.from_pretrained(
-                    self.model_id, trust_remote_code=True
-                )
+                self._cargar_processor()
 
-                # Modelo – TODO: usa siempre float32 para coherencia con las entradas
+                # Modelo – las entradas se convierten a model.dtype en ImageProcessor
                 if callback:
                     callback("🔄 Cargando modelo Florence-2 (esto puede tomar varios minutos)...")
                     
                 # Cargar modelo con configuración robusta para diferentes variantes de Florence-2
-                try:
-                    # Si usamos device_map="auto", NO forzamos .to(self.device) para evitar conflictos con accelerate
-                    self.model = AutoModelForCausalLM.from_pretrained(
-                        self.model_id,
-                        trust_remote_code=True,
-                        use_safetensors=True,
-                        torch_dtype=torch.float32,  #  <-- forzamos fp32
-                        device_map="auto",
-                        attn_implementation="eager",
-                    )
-                    self.model.eval()
-                except Exception as e:
-                    if callback:
-                        callback(f"⚠️ Reintentando carga con configuración alternativa...")
-                    
-                    # Fallback: cargar sin device_map para mayor compatibilidad
-                    self.model = AutoModelForCausalLM.from_pretrained(
-                        self.model_id,
-                        trust_remote_code=True,
-                        use_safetensors=True,
-                        torch_dtype=torch.float32,
-                        low_cpu_mem_usage=True,
-                    ).to(self.device)
-                    self.model.eval()
+                usar_int8 = self.device == "cpu" and self.cpu_quantization == "int8"
+                if usar_int8 and self._ruta_cache_int8().is_file():
+                    with self._medir("pesos"):
+                        self._cargar_cache_int8(callback)
+                    self.estrategia_carga = "cache_int8"
+                else:
+                    self._cargar_pesos(callback)
+                    if usar_int8:
+                        with self._medir("cuantizacion"):
+                            self._cuantizar_int8(callback)
+                if self.dtype != torch.float32:
+                    self._instalar_fallback_fp32()
 
                 # Limpiar caché y mostrar uso de memoria
                 if self.device.startswith("cuda"):
@@ -156,7 +286,15 @@ class Florence2Manager:
                 else:
                     if callback:
                         callback("✅ Modelo cargado correctamente en CPU")
-                        
+
+            with self._medir("calentamiento"):
+                self._ajustar_y_calentar(callback)
+
+            self.tiempos_carga["total"] = time.perf_counter() - inicio
+            if callback:
+                callback("⏱️ Carga: " + " · ".join(
+                    f"{etapa} {segundos:.1f}s" for etapa, segundos in self.tiempos_carga.items()
+                ) + (f" (estrategia {self.estrategia_carga})" if self.estrategia_carga else ""))
             return True
 
         except Exception as exc:
@@ -167,6 +305,411 @@ class Florence2Manager:
                     callback("💡 O considera usar un modelo más pequeño")
             return False
 
+    def _ajustar_y_calentar(self, callback=None):
+        """Hilos calibrados por equipo en CPU y una pasada de calentamiento (sin abortar la carga)."""
+        from core import cpu_tuner
+
+        try:
+            if self.device == "cpu" and self.autoajuste_cpu:
+                ruta = Path(self.config.get("ruta_ajuste_cpu") or ROOT_DIR / "models/ajuste_cpu.json")
+                cpu_tuner.ajustar_cpu(self, ruta, callback=callback)
+            elif self.calentar_al_cargar:
+                cpu_tuner.calentar(self)
+        except Exception as exc:
+            if callback:
+                callback(f"⚠️ Calibración/calentamiento omitido: {exc}")
+
+    @contextmanager
+    def _medir(self, etapa: str):
+        """Acumula en `tiempos_carga[etapa]` el tiempo del bloque."""
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.tiempos_carga[etapa] = self.tiempos_carga.get(etapa, 0.0) + time.perf_counter() - t0
+
+    def _cargar_processor(self):
+        """
+        Processor del checkpoint, reutilizado entre cargas del mismo `model_id`.
+
+        La primera vez se guarda con `save_pretrained` en `ruta_cache_processor`
+        (tokenizer rápido ya convertido); los arranques siguientes y los workers
+        del pool lo leen de ahí.
+        """
+        from transformers import AutoProcessor
+
+        with self._medir("processor"):
+            if self.model_id not in _PROCESSORS:
+                ruta = self._ruta_cache_processor()
+                processor = self._leer_cache_processor(ruta) if ruta else None
+                if processor is None:
+                    processor = AutoProcessor.from_pretrained(self.model_id, trust_remote_code=True)
+                    if ruta:
+                        self._guardar_cache_processor(processor, ruta)
+                _PROCESSORS[self.model_id] = processor
+            self.processor = _PROCESSORS[self.model_id]
+
+    def _ruta_cache_processor(self) -> Path | None:
+        """Carpeta del processor guardado, invalidada si cambian sus ficheros o la versión de transformers."""
+        import transformers
+
+        origen = Path(self.model_id)
+        if not origen.is_dir():
+            return None
+        ficheros = sorted(p for p in origen.iterdir() if p.is_file() and p.suffix != ".safetensors")
+        firma = "|".join([self.model_id, transformers.__version__] + [
+            f"{p.name}:{p.stat().st_mtime_ns}:{p.stat().st_size}" for p in ficheros
+        ])
+        clave = hashlib.sha1(firma.encode("utf-8")).hexdigest()[:16]
+        cache_dir = Path(self.config.get("ruta_cache_processor") or ROOT_DIR / "models/cache_processor")
+        return cache_dir / f"{origen.name}-{clave}"
+
+    @staticmethod
+    def _leer_cache_processor(ruta: Path):
+        from transformers import AutoProcessor
+
+        if not ruta.is_dir():
+            return None
+        try:
+            return AutoProcessor.from_pretrained(str(ruta), trust_remote_code=True)
+        except Exception:
+            return None  # copia incompleta o de otra versión: se vuelve al checkpoint
+
+    def _guardar_cache_processor(self, processor, ruta: Path):
+        """Guarda en una carpeta temporal y la renombra, por si varios workers arrancan a la vez."""
+        import shutil
+
+        temporal = ruta.with_name(f"{ruta.name}.tmp{os.getpid()}")
+        try:
+            processor.save_pretrained(str(temporal))
+            # El código remoto (processing_florence2.py…) y la config a la que apunta `auto_map`
+            for fichero in Path(self.model_id).iterdir():
+                if (fichero.suffix == ".py" or fichero.name == "config.json") and not (temporal / fichero.name).exists():
+                    shutil.copy2(fichero, temporal / fichero.name)
+            os.replace(temporal, ruta)
+        except Exception:
+            pass  # otro proceso la guardó antes, o no se puede escribir: solo se pierde la caché
+        finally:
+            shutil.rmtree(temporal, ignore_errors=True)
+
+    def _cargar_pesos(self, callback=None):
+        """
+        Carga los pesos probando primero la estrategia que funcionó la última
+        vez en este equipo; las demás solo se intentan si esa falla.
+        """
+        recordada = self._estrategia_recordada()
+        orden = [recordada] if recordada in ESTRATEGIAS_CARGA else []
+        orden += [e for e in ESTRATEGIAS_CARGA if e not in orden]
+
+        ultimo_error = None
+        for estrategia in orden:
+            try:
+                getattr(self, f"_cargar_{estrategia}")()
+                self.model.eval()
+                self.estrategia_carga = estrategia
+                if estrategia != recordada:
+                    self._recordar_estrategia(estrategia)
+                return
+            except Exception as exc:
+                ultimo_error = exc
+                self.model = None
+                gc.collect()
+                if callback:
+                    callback(f"⚠️ Estrategia de carga '{estrategia}' falló ({exc}), probando otra...")
+        raise ultimo_error
+
+    def _cargar_mmap(self):
+        """
+        Esqueleto desde la config con los parámetros en el dispositivo `meta`
+        (sin memoria) y safetensors mapeados en memoria, asignados directamente:
+        en RAM solo hay una copia de los pesos, la del mmap.
+        """
+        from accelerate import init_empty_weights
+        from safetensors.torch import load_file
+        from transformers import AutoConfig, AutoModelForCausalLM
+        from transformers.modeling_utils import no_init_weights
+
+        archivos = sorted(Path(self.model_id).glob("*.safetensors"))
+        if not archivos:
+            raise FileNotFoundError(f"No hay .safetensors en {self.model_id}")
+
+        with self._medir("config"):
+            config = AutoConfig.from_pretrained(self.model_id, trust_remote_code=True)
+            # Solo los parámetros van a `meta`; los buffers se crean de verdad
+            # porque no todos están en el checkpoint (p. ej. los no persistentes)
+            with init_empty_weights(include_buffers=False), no_init_weights():
+                model = AutoModelForCausalLM.from_config(
+                    config, trust_remote_code=True, torch_dtype=self.dtype, attn_implementation="eager",
+                )
+
+        with self._medir("pesos"):
+            esperadas = set(model.state_dict().keys())
+            cargadas = set()
+            for archivo in archivos:
+                estado = {
+                    nombre: tensor.to(self.dtype) if tensor.is_floating_point() else tensor
+                    for nombre, tensor in load_file(str(archivo), device="cpu").items()
+                }
+                model.load_state_dict(estado, strict=False, assign=True)
+                cargadas.update(estado.keys())
+            model.tie_weights()
+            # Las claves ausentes solo pueden ser pesos atados (embeddings / lm_head)
+            atadas = {n for n, _ in model.named_parameters(remove_duplicate=False)} - {
+                n for n, _ in model.named_parameters()
+            }
+            faltan = esperadas - cargadas - atadas
+            faltan |= {n for n, p in model.named_parameters() if p.is_meta}
+            if faltan:
+                raise RuntimeError(f"{len(faltan)} pesos sin cargar (p. ej. {sorted(faltan)[0]})")
+
+        with self._medir("dispositivo"):
+            self.model = model.to(self.device)
+
+    def _cargar_device_map(self):
+        """accelerate con device_map="auto" (coloca los pesos al cargarlos)."""
+        from transformers import AutoModelForCausalLM
+
+        with self._medir("pesos"):
+            # Si usamos device_map="auto", NO forzamos .to(self.device) para evitar conflictos con accelerate
+            self.model = AutoModelForCausalLM.from_pretrained(
+                self.model_id,
+                trust_remote_code=True,
+                use_safetensors=True,
+                torch_dtype=self.dtype,
+                device_map="auto",
+                attn_implementation="eager",
+            )
+
+    def _cargar_low_cpu_mem(self):
+        """Carga sin device_map para mayor compatibilidad y mueve después al dispositivo."""
+        from transformers import AutoModelForCausalLM
+
+        with self._medir("pesos"):
+            model = AutoModelForCausalLM.from_pretrained(
+                self.model_id,
+                trust_remote_code=True,
+                use_safetensors=True,
+                torch_dtype=self.dtype,
+                low_cpu_mem_usage=True,
+            )
+        with self._medir("dispositivo"):
+            self.model = model.to(self.device)
+
+    def _ruta_estrategias(self) -> Path:
+        return Path(self.config.get("ruta_estrategia_carga") or ROOT_DIR / "models/estrategia_carga.json")
+
+    def _clave_estrategia(self) -> str:
+        return f"{self.model_id}|{self.device}|{self._nombre_dtype()}"
+
+    def _estrategia_recordada(self) -> str | None:
+        try:
+            datos = json.loads(self._ruta_estrategias().read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return None
+        return (datos.get(self._clave_estrategia()) or {}).get("estrategia")
+
+    def _recordar_estrategia(self, estrategia: str):
+        ruta = self._ruta_estrategias()
+        try:
+            datos = json.loads(ruta.read_text(encoding="utf-8")) if ruta.is_file() else {}
+        except (OSError, ValueError):
+            datos = {}
+        datos[self._clave_estrategia()] = {"estrategia": estrategia, "fecha": time.strftime("%Y-%m-%d %H:%M:%S")}
+        try:
+            ruta.parent.mkdir(parents=True, exist_ok=True)
+            ruta.write_text(json.dumps(datos, ensure_ascii=False, indent=2), encoding="utf-8")
+        except OSError:
+            pass
+
+    # ------------------------------------------------------------------
+    #  Precisión reducida (bfloat16 / float16)
+    # ------------------------------------------------------------------
+    def _resolver_dtype(self, nombre) -> torch.dtype:
+        """Convierte `modelo.dtype` (o STOCKPREP_DTYPE) en un torch.dtype."""
+        nombre = str(os.getenv("STOCKPREP_DTYPE") or nombre or "float32").lower()
+        return getattr(torch, DTYPES.get(nombre, "float32"))
+
+    def _nombre_dtype(self) -> str:
+        return str(self.dtype).replace("torch.", "")
+
+    def _dtype_soportado(self, dtype: torch.dtype) -> bool:
+        """Comprueba si el dispositivo puede ejecutar el modelo en `dtype`."""
+        if dtype == torch.float32:
+            return True
+        if self.device.startswith("cuda"):
+            return dtype == torch.float16 or torch.cuda.is_bf16_supported()
+        if dtype == torch.bfloat16:
+            # Sin AVX512‑BF16/AMX funciona igual (emulado), pero sin ganancia de velocidad
+            try:
+                if not torch.ops.mkldnn._is_mkldnn_bf16_supported() and self._callback:
+                    self._callback("ℹ️ CPU sin bf16 nativo: se ahorra RAM pero no tiempo")
+            except Exception:
+                pass
+        return True
+
+    def _instalar_fallback_fp32(self):
+        """
+        Envuelve `generate` y `_encode_image` del modelo: si fallan por una
+        operación no implementada en el dtype reducido, esa clase de módulo
+        pasa a fp32 y la llamada se repite. ImageProcessor no necesita saberlo.
+        """
+        for nombre in ("generate", "_encode_image"):
+            original = getattr(self.model, nombre, None)
+            if original is not None:
+                setattr(self.model, nombre, self._con_fallback_fp32(original))
+
+    def _con_fallback_fp32(self, fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            while True:
+                try:
+                    return fn(*args, **kwargs)
+                except RuntimeError as exc:
+                    clase = self._clase_op_fallida(exc)
+                    if clase is None:
+                        raise
+                    self._activar_fp32(clase)
+        return wrapper
+
+    def _clase_op_fallida(self, exc: RuntimeError):
+        """Clase de módulo responsable de un error de dtype, o None si no aplica."""
+        mensaje = str(exc)
+        if not re.search(r"Half|BFloat16|dtype|scalar type", mensaje):
+            return None
+        for patron, nombre_clase in FP32_FALLBACK_OPS:
+            clase = getattr(torch.nn, nombre_clase)
+            if patron.search(mensaje) and clase not in self._fp32_fallbacks:
+                return clase
+        return None
+
+    def _activar_fp32(self, clase):
+        """Ejecuta en fp32 todos los módulos de `clase`, convirtiendo entradas y salidas."""
+        dtype = self.dtype
+
+        def convertir(valor, destino):
+            if torch.is_tensor(valor) and valor.is_floating_point():
+                return valor.to(destino)
+            if isinstance(valor, (tuple, list)):
+                return type(valor)(convertir(v, destino) for v in valor)
+            return valor
+
+        def pre_hook(_modulo, args, kwargs):
+            return convertir(args, torch.float32), {k: convertir(v, torch.float32) for k, v in kwargs.items()}
+
+        def post_hook(_modulo, _args, salida):
+            return convertir(salida, dtype)
+
+        for modulo in self.model.modules():
+            if type(modulo) is clase:
+                modulo.float()
+                modulo.register_forward_pre_hook(pre_hook, with_kwargs=True)
+                modulo.register_forward_hook(post_hook)
+        self._fp32_fallbacks.add(clase)
+        if self._callback:
+            self._callback(f"⚠️ {clase.__name__} no soporta {self._nombre_dtype()}: se ejecuta en float32")
+
+    # ------------------------------------------------------------------
+    #  Cuantización dinámica int8 (CPU)
+    # ------------------------------------------------------------------
+    def _modulos_int8(self, model):
+        """Submódulos cuyas capas Linear se cuantizan."""
+        modulos = [model.language_model]
+        if self.quantize_encoder:
+            modulos.append(model.vision_tower)
+        return modulos
+
+    def _cuantizar_int8(self, callback=None):
+        """
+        Cuantiza a int8 las capas Linear del modelo de lenguaje (y del encoder
+        de visión si `cuantizar_encoder` está activo) y guarda el resultado en
+        caché para que el siguiente arranque use `_cargar_cache_int8`.
+        """
+        inicio = time.perf_counter()
+        for modulo in self._modulos_int8(self.model):
+            torch.ao.quantization.quantize_dynamic(
+                modulo, {torch.nn.Linear}, dtype=torch.qint8, inplace=True
+            )
+        self.model.eval()
+        self.quantized = True
+
+        cache_file = self._ruta_cache_int8()
+        try:
+            cache_file.parent.mkdir(parents=True, exist_ok=True)
+            torch.save(self.model.state_dict(), cache_file)
+        except Exception as exc:
+            if callback:
+                callback(f"⚠️ No se pudo guardar la caché int8: {exc}")
+        if callback:
+            alcance = "decoder + encoder" if self.quantize_encoder else "modelo de lenguaje"
+            callback(f"⚡ Modo CPU int8 ({alcance}) cuantizado en {time.perf_counter() - inicio:.1f}s")
+
+    def _cargar_cache_int8(self, callback=None):
+        """
+        Reconstruye el modelo int8 desde la caché sin leer los pesos fp32 ni
+        volver a cuantizar: se crea el esqueleto desde la config, se sustituyen
+        las Linear por su versión dinámica int8 y se cargan los pesos empaquetados.
+        """
+        from torch.ao.nn.quantized.dynamic import Linear as DynamicLinear
+        from transformers import AutoConfig, AutoModelForCausalLM
+        from transformers.modeling_utils import no_init_weights
+
+        inicio = time.perf_counter()
+        config = AutoConfig.from_pretrained(self.model_id, trust_remote_code=True)
+        with no_init_weights():
+            model = AutoModelForCausalLM.from_config(
+                config, trust_remote_code=True, torch_dtype=torch.float32,
+                attn_implementation="eager",
+            )
+
+        def sustituir_linear(modulo):
+            for nombre, hijo in modulo.named_children():
+                if type(hijo) is torch.nn.Linear:
+                    setattr(modulo, nombre, DynamicLinear(
+                        hijo.in_features, hijo.out_features,
+                        bias_=hijo.bias is not None, dtype=torch.qint8,
+                    ))
+                else:
+                    sustituir_linear(hijo)
+
+        for modulo in self._modulos_int8(model):
+            sustituir_linear(modulo)
+        model.load_state_dict(torch.load(self._ruta_cache_int8(), map_location="cpu"))
+        self.model = model.eval()
+        self.quantized = True
+        if callback:
+            callback(f"⚡ Modelo int8 cargado desde caché en {time.perf_counter() - inicio:.1f}s")
+
+    def _firma_pesos(self) -> list:
+        pesos = sorted(Path(self.model_id).glob("*.safetensors"))
+        return [f"{p.name}:{p.stat().st_mtime_ns}:{p.stat().st_size}" for p in pesos]
+
+    def estimar_memoria_gb(self) -> float:
+        """Memoria aproximada del modelo antes de cargarlo (tamaño de los safetensors)."""
+        return sum(p.stat().st_size for p in Path(self.model_id).glob("*.safetensors")) / 1024 ** 3
+
+    def memoria_modelo_gb(self) -> float:
+        """Memoria de parámetros y buffers del modelo cargado."""
+        if self.model is None:
+            return 0.0
+        if not hasattr(self.model, "parameters"):
+            return self.estimar_memoria_gb()
+        tensores = list(self.model.parameters()) + list(self.model.buffers())
+        return sum(t.numel() * t.element_size() for t in tensores) / 1024 ** 3
+
+    def firma_modelo(self) -> str:
+        """Identifica backend, pesos y precisión (para cachear resultados de inferencia)."""
+        return "|".join(
+            [type(self).__name__, self.model_id, self._nombre_dtype(), f"int8={self.quantized}"]
+            + self._firma_pesos()
+        )
+
+    def _ruta_cache_int8(self) -> Path:
+        """Ruta del state_dict int8, invalidada si cambian los pesos o la versión de torch."""
+        firma = "|".join([self.model_id, torch.__version__, str(self.quantize_encoder)] + self._firma_pesos())
+        clave = hashlib.sha1(firma.encode("utf-8")).hexdigest()[:16]
+        cache_dir = Path(self.config.get("ruta_cache_int8") or ROOT_DIR / "models/cache_int8")
+        return cache_dir / f"{Path(self.model_id).name}-{clave}.pt"
+
     # ------------------------------------------------------------------
     #  Liberar recursos
     # ------------------------------------------------------------------
@@ -177,6 +720,8 @@ class Florence2Manager:
         if self.processor is not None:
             del self.processor
             self.processor = None
+        self.quantized = False
+        self._fp32_fallbacks = set()
 
         if str(self.device).startswith("cuda"):
             torch.cuda.empty_cache()
@@ -275,3 +820,19 @@ class Florence2Manager:
             }
         except Exception as e:
             return {"available": False, "error": str(e)}
+
+
+def crear_model_manager(**kwargs) -> Florence2Manager:
+    """
+    Devuelve el gestor del backend configurado en `modelo.backend`
+    (o STOCKPREP_BACKEND): "pytorch" (por defecto), "onnx" (ONNX Runtime en CPU)
+    o "fake" (modelo simulado sin pesos, para pruebas de carga).
+    """
+    backend = (os.environ.get("STOCKPREP_BACKEND") or cargar_config_modelo().get("backend") or "pytorch").lower()
+    if backend == "onnx":
+        from core.onnx_backend import OnnxFlorence2Manager
+        return OnnxFlorence2Manager(**kwargs)
+    if backend == "fake":
+        from core.fake_backend import FakeFlorence2Manager
+        return FakeFlorence2Manager(**kwargs)
+    return Florence2Manager(**kwargs)
@@ -0,0 +1,167 @@
+"""
+Registro de variantes de Florence‑2 cargadas bajo demanda.
+
+Asocia niveles de detalle y tareas a variantes del modelo (p. ej. base para
+`minimo`, large para `largo`) y mantiene las cargadas en un LRU limitado por
+un presupuesto de memoria (VRAM en GPU, RAM en CPU). Al no caber una variante
+nueva se descargan las usadas hace más tiempo con `descargar_modelo`.
+
+Configuración (settings.yaml):
+
+    modelos:
+      variantes:
+        base: models/Florence-2-base-ft
+        large: models/Florence-2-large-ft-safetensors
+      por_nivel: {minimo: base, medio: large, largo: large, objects: large}
+      por_tarea: {}
+      presupuesto_gb: 0   # 0 = automático
+"""
+import logging
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Tuple
+
+from core.model_manager import Florence2Manager, cargar_config_seccion, crear_model_manager
+from utils.memoria_sistema import memoria_total_gb
+
+logger = logging.getLogger(__name__)
+
+# Fracción de la memoria total que se reserva a modelos en modo automático
+FRACCION_VRAM = 0.85
+FRACCION_RAM = 0.5
+
+
+class ModelRegistry:
+    """
+    LRU de `Florence2Manager` por variante, con presupuesto de memoria.
+
+    Args:
+        variantes: nombre -> ruta del checkpoint
+        por_nivel: nivel de detalle -> variante
+        por_tarea: tag de tarea -> variante (tiene prioridad sobre el nivel)
+        presupuesto_gb: Memoria máxima para modelos cargados (0 = automático)
+        por_defecto: Variante cuando el nivel/tarea no está asignado
+        manager_factory: Crea el gestor de una ruta (por defecto `crear_model_manager`)
+    """
+
+    def __init__(self, variantes: Dict[str, str], por_nivel: Optional[Dict[str, str]] = None,
+                 por_tarea: Optional[Dict[str, str]] = None, presupuesto_gb: float = 0,
+                 por_defecto: Optional[str] = None,
+                 manager_factory: Optional[Callable[..., Florence2Manager]] = None):
+        if not variantes:
+            raise ValueError("El registro necesita al menos una variante de modelo")
+        self.variantes = dict(variantes)
+        self.por_nivel = dict(por_nivel or {})
+        self.por_tarea = dict(por_tarea or {})
+        self.por_defecto = por_defecto or next(iter(self.variantes))
+        self.presupuesto_gb = float(presupuesto_gb or 0)
+        self._factory = manager_factory or crear_model_manager
+        self._managers: "OrderedDict[str, Florence2Manager]" = OrderedDict()
+        self._lock = threading.RLock()
+        self._aviso_presupuesto = False
+
+    # ------------------------------------------------------------------
+    #  Resolución de variantes
+    # ------------------------------------------------------------------
+    def variante_para(self, detail_level: Optional[str] = None, task_tag: Optional[str] = None) -> str:
+        variante = self.por_tarea.get(task_tag) or self.por_nivel.get(detail_level) or self.por_defecto
+        if variante not in self.variantes:
+            raise KeyError(f"Variante de modelo no configurada: {variante}")
+        return variante
+
+    def agrupar(self, tareas: List[Tuple[str, str]]) -> Dict[str, List[Tuple[str, str]]]:
+        """Reparte `(task_tag, detail_level)` por la variante que las ejecuta."""
+        grupos: Dict[str, List[Tuple[str, str]]] = {}
+        for task_tag, detail_level in tareas:
+            grupos.setdefault(self.variante_para(detail_level, task_tag), []).append((task_tag, detail_level))
+        return grupos
+
+    def manager(self, variante: Optional[str] = None) -> Florence2Manager:
+        """Gestor de la variante (creado si hace falta, sin cargar)."""
+        variante = variante or self.por_defecto
+        with self._lock:
+            if variante not in self._managers:
+                self._managers[variante] = self._factory(model_path=self.variantes[variante])
+            return self._managers[variante]
+
+    # ------------------------------------------------------------------
+    #  Carga con presupuesto de memoria
+    # ------------------------------------------------------------------
+    def obtener(self, variante: Optional[str] = None, callback=None) -> Florence2Manager:
+        """Devuelve el gestor de la variante con el modelo cargado, expulsando LRU si no cabe."""
+        variante = variante or self.por_defecto
+        with self._lock:
+            manager = self.manager(variante)
+            if manager.model is None:
+                self._liberar_para(manager.estimar_memoria_gb(), excepto=variante)
+                logger.info(f"🔄 Registro: cargando variante '{variante}'")
+                if not manager.cargar_modelo(callback):
+                    raise RuntimeError(f"No se pudo cargar la variante '{variante}' ({manager.model_id})")
+            self._managers.move_to_end(variante)
+            return manager
+
+    def memoria_usada_gb(self) -> float:
+        with self._lock:
+            return sum(m.memoria_modelo_gb() for m in self._managers.values() if m.model is not None)
+
+    def presupuesto(self) -> float:
+        """
+        Presupuesto configurado o, si es 0, una fracción de la VRAM/RAM total.
+
+        Si no se puede saber la memoria total, el presupuesto es 0: solo queda
+        cargada la variante en uso hasta que se configure `presupuesto_gb`.
+        """
+        if self.presupuesto_gb > 0:
+            return self.presupuesto_gb
+        referencia = self.manager(self.por_defecto)
+        if str(referencia.device).startswith("cuda"):
+            total, fraccion = referencia.gpu_info.get("total_memory_gb"), FRACCION_VRAM
+        else:
+            total, fraccion = memoria_total_gb(), FRACCION_RAM
+        if total:
+            return total * fraccion
+        if not self._aviso_presupuesto:
+            self._aviso_presupuesto = True
+            logger.warning("⚠️ Registro: no se pudo medir la memoria total; se mantiene una sola variante "
+                           "cargada (configura modelos.presupuesto_gb en settings.yaml)")
+        return 0.0
+
+    def _liberar_para(self, necesario_gb: float, excepto: str):
+        presupuesto = self.presupuesto()
+        for variante, manager in list(self._managers.items()):
+            if self.memoria_usada_gb() + necesario_gb <= presupuesto:
+                return
+            if variante == excepto or manager.model is None:
+                continue
+            logger.info(f"💤 Registro: descargando variante '{variante}' para liberar memoria")
+            manager.descargar_modelo()
+
+    def descargar_todo(self):
+        with self._lock:
+            for manager in self._managers.values():
+                if manager.model is not None:
+                    manager.descargar_modelo()
+
+    def estado(self) -> Dict:
+        """Variantes cargadas (en orden LRU), memoria usada y presupuesto."""
+        with self._lock:
+            return {
+                "cargadas": [v for v, m in self._managers.items() if m.model is not None],
+                "memoria_usada_gb": round(self.memoria_usada_gb(), 2),
+                "presupuesto_gb": round(self.presupuesto(), 2),
+            }
+
+
+def crear_registro_desde_config() -> Optional[ModelRegistry]:
+    """Registro según la sección `modelos` de settings.yaml, o None si no hay variantes."""
+    config = cargar_config_seccion("modelos")
+    variantes = config.get("variantes") or {}
+    if not variantes:
+        return None
+    return ModelRegistry(
+        variantes,
+        por_nivel=config.get("por_nivel"),
+        por_tarea=config.get("por_tarea"),
+        presupuesto_gb=config.get("presupuesto_gb", 0),
+        por_defecto=config.get("por_defecto"),
+    )
@@ -0,0 +1,375 @@
+"""
+Backend ONNX Runtime (CPU) para Florence‑2.
+
+Exporta una sola vez el checkpoint local a cinco grafos ONNX y los ejecuta con
+el CPUExecutionProvider de ONNX Runtime:
+
+• vision_encoder.onnx          pixel_values -> image_features
+• embed_tokens.onnx            input_ids -> inputs_embeds
+• encoder_model.onnx           inputs_embeds + attention_mask -> hidden states
+• decoder_model.onnx           primer paso del decoder (devuelve la KV‑cache)
+• decoder_with_past_model.onnx pasos siguientes reutilizando la KV‑cache
+
+`OnnxFlorence2Model` expone la misma superficie que el modelo PyTorch
+(`generate`, `_encode_image`, `get_input_embeddings`, `device`, `dtype`…), así
+que `ImageProcessor` no necesita saber qué backend está activo.
+
+Limitación: la búsqueda por beams no está implementada; con `num_beams > 1` se
+decodifica en greedy (o sampling si `do_sample=True`).
+"""
+import json
+import logging
+from pathlib import Path
+from typing import Dict, List
+from unittest.mock import patch
+
+import numpy as np
+import torch
+
+try:
+    import onnxruntime as ort  # Import opcional
+    ORT_AVAILABLE = True
+except Exception:
+    ort = None
+    ORT_AVAILABLE = False
+
+from core.generation_utils import crear_procesadores_logits
+from core.model_manager import ROOT_DIR, Florence2Manager
+
+logger = logging.getLogger(__name__)
+
+ONNX_OPSET = 17
+EXPORT_INFO = "export_info.json"
+
+
+# ============================================================================
+# Exportación (una sola vez, con el modelo PyTorch en CPU/fp32)
+# ============================================================================
+
+class _VisionEncoder(torch.nn.Module):
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+
+    def forward(self, pixel_values):
+        return self.model._encode_image(pixel_values)
+
+
+class _EmbedTokens(torch.nn.Module):
+    def __init__(self, model):
+        super().__init__()
+        self.embed = model.get_input_embeddings()
+
+    def forward(self, input_ids):
+        return self.embed(input_ids)
+
+
+class _Encoder(torch.nn.Module):
+    def __init__(self, language_model):
+        super().__init__()
+        self.encoder = language_model.get_encoder()
+
+    def forward(self, inputs_embeds, attention_mask):
+        return self.encoder(inputs_embeds=inputs_embeds, attention_mask=attention_mask,
+                            return_dict=True).last_hidden_state
+
+
+class _Decoder(torch.nn.Module):
+    """Primer paso del decoder: devuelve logits y la KV‑cache completa (self + cross)."""
+
+    def __init__(self, language_model):
+        super().__init__()
+        self.decoder = language_model.get_decoder()
+        self.lm_head = language_model.lm_head
+        self.register_buffer("bias", getattr(language_model, "final_logits_bias", torch.zeros(1)))
+
+    def forward(self, input_ids, encoder_hidden_states, encoder_attention_mask):
+        out = self.decoder(input_ids=input_ids, encoder_hidden_states=encoder_hidden_states,
+                           encoder_attention_mask=encoder_attention_mask, use_cache=True, return_dict=True)
+        logits = self.lm_head(out.last_hidden_state) + self.bias
+        return (logits, *[t for capa in out.past_key_values for t in capa])
+
+
+class _DecoderWithPast(_Decoder):
+    """Pasos siguientes: reutiliza la KV‑cache y devuelve solo la self‑attention nueva."""
+
+    def forward(self, input_ids, encoder_hidden_states, encoder_attention_mask, *past):
+        past_key_values = tuple(tuple(past[i:i + 4]) for i in range(0, len(past), 4))
+        out = self.decoder(input_ids=input_ids, encoder_hidden_states=encoder_hidden_states,
+                           encoder_attention_mask=encoder_attention_mask,
+                           past_key_values=past_key_values, use_cache=True, return_dict=True)
+        logits = self.lm_head(out.last_hidden_state) + self.bias
+        return (logits, *[t for capa in out.past_key_values for t in capa[:2]])
+
+
+def _nombres_past(num_layers: int, prefijo: str, incluir_cross: bool = True) -> List[str]:
+    nombres = []
+    for i in range(num_layers):
+        nombres += [f"{prefijo}.{i}.decoder.key", f"{prefijo}.{i}.decoder.value"]
+        if incluir_cross:
+            nombres += [f"{prefijo}.{i}.encoder.key", f"{prefijo}.{i}.encoder.value"]
+    return nombres
+
+
+def exportar_onnx(model, processor, onnx_dir: Path, callback=None) -> Dict:
+    """Exporta `model` (Florence‑2 PyTorch en CPU/fp32) a `onnx_dir`."""
+    onnx_dir.mkdir(parents=True, exist_ok=True)
+    lm = model.language_model
+    text_config = lm.config
+    num_layers = text_config.decoder_layers
+
+    # Entradas de ejemplo
+    pixel_values = torch.zeros(1, 3, 768, 768)
+    input_ids = processor.tokenizer(["What does the image describe?"], return_tensors="pt")["input_ids"]
+
+    with torch.no_grad():
+        image_features = model._encode_image(pixel_values)
+        inputs_embeds = torch.cat([image_features, model.get_input_embeddings()(input_ids)], dim=1)
+        attention_mask = torch.ones(inputs_embeds.shape[:2], dtype=torch.long)
+        hidden = _Encoder(lm)(inputs_embeds, attention_mask)
+        decoder_ids = torch.full((1, 1), text_config.decoder_start_token_id, dtype=torch.long)
+        first = _Decoder(lm)(decoder_ids, hidden, attention_mask)
+
+    def exportar(modulo, args, nombre, input_names, output_names, dynamic_axes):
+        if callback:
+            callback(f"📦 Exportando {nombre}...")
+        torch.onnx.export(
+            modulo, args, str(onnx_dir / nombre), opset_version=ONNX_OPSET,
+            input_names=input_names, output_names=output_names, dynamic_axes=dynamic_axes,
+        )
+
+    exportar(_VisionEncoder(model), (pixel_values,), "vision_encoder.onnx",
+             ["pixel_values"], ["image_features"],
+             {"pixel_values": {0: "batch"}, "image_features": {0: "batch"}})
+    exportar(_EmbedTokens(model), (input_ids,), "embed_tokens.onnx",
+             ["input_ids"], ["inputs_embeds"],
+             {"input_ids": {0: "batch", 1: "seq"}, "inputs_embeds": {0: "batch", 1: "seq"}})
+    exportar(_Encoder(lm), (inputs_embeds, attention_mask), "encoder_model.onnx",
+             ["inputs_embeds", "attention_mask"], ["last_hidden_state"],
+             {"inputs_embeds": {0: "batch", 1: "enc_seq"}, "attention_mask": {0: "batch", 1: "enc_seq"},
+              "last_hidden_state": {0: "batch", 1: "enc_seq"}})
+
+    present = _nombres_past(num_layers, "present")
+    ejes_kv = {}
+    for nombre in present:
+        ejes_kv[nombre] = {0: "batch", 2: "enc_seq" if ".encoder." in nombre else "dec_seq"}
+    ejes_dec = {"input_ids": {0: "batch", 1: "dec_len"}, "encoder_hidden_states": {0: "batch", 1: "enc_seq"},
+                "encoder_attention_mask": {0: "batch", 1: "enc_seq"}, "logits": {0: "batch", 1: "dec_len"}}
+    exportar(_Decoder(lm), (decoder_ids, hidden, attention_mask), "decoder_model.onnx",
+             ["input_ids", "encoder_hidden_states", "encoder_attention_mask"], ["logits", *present],
+             {**ejes_dec, **ejes_kv})
+
+    past = _nombres_past(num_layers, "past_key_values")
+    present_self = _nombres_past(num_layers, "present", incluir_cross=False)
+    ejes_past = {
+        nombre: {0: "batch", 2: "enc_seq" if ".encoder." in nombre else "past_seq"} for nombre in past
+    }
+    ejes_past.update({nombre: {0: "batch", 2: "dec_seq"} for nombre in present_self})
+    exportar(_DecoderWithPast(lm), (decoder_ids, hidden, attention_mask, *first[1:]),
+             "decoder_with_past_model.onnx",
+             ["input_ids", "encoder_hidden_states", "encoder_attention_mask", *past], ["logits", *present_self],
+             {**ejes_dec, **ejes_past})
+
+    info = {
+        "num_layers": num_layers,
+        "decoder_start_token_id": text_config.decoder_start_token_id,
+        "eos_token_id": text_config.eos_token_id,
+        "pad_token_id": text_config.pad_token_id,
+        "forced_bos_token_id": getattr(text_config, "forced_bos_token_id", None),
+    }
+    (onnx_dir / EXPORT_INFO).write_text(json.dumps(info, indent=2), encoding="utf-8")
+    return info
+
+
+# ============================================================================
+# Ejecución con ONNX Runtime
+# ============================================================================
+
+class _EmbeddingOnnx:
+    """Callable equivalente a `model.get_input_embeddings()`."""
+
+    def __init__(self, model):
+        self.model = model
+
+    def __call__(self, input_ids: torch.Tensor) -> torch.Tensor:
+        return self.model._run("embed_tokens", {"input_ids": input_ids})[0]
+
+
+class OnnxFlorence2Model:
+    """Florence‑2 sobre ONNX Runtime con la interfaz que usa `ImageProcessor`."""
+
+    def __init__(self, onnx_dir: Path, num_threads: int = 0):
+        if not ORT_AVAILABLE:
+            raise RuntimeError("onnxruntime no está instalado. Ejecuta: pip install onnxruntime")
+        self.onnx_dir = Path(onnx_dir)
+        self.info = json.loads((self.onnx_dir / EXPORT_INFO).read_text(encoding="utf-8"))
+        self.device = torch.device("cpu")
+        self.dtype = torch.float32
+
+        opciones = ort.SessionOptions()
+        opciones.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if num_threads:
+            opciones.intra_op_num_threads = num_threads
+        self.sessions = {
+            nombre: ort.InferenceSession(
+                str(self.onnx_dir / f"{nombre}.onnx"), sess_options=opciones,
+                providers=["CPUExecutionProvider"],
+            )
+            for nombre in ("vision_encoder", "embed_tokens", "encoder_model",
+                           "decoder_model", "decoder_with_past_model")
+        }
+        self._past_names = _nombres_past(self.info["num_layers"], "past_key_values")
+        self._aviso_beams = False
+
+    def eval(self):
+        return self
+
+    def _run(self, sesion: str, entradas: Dict) -> List[torch.Tensor]:
+        feeds = {
+            nombre: (valor.detach().cpu().numpy() if torch.is_tensor(valor) else valor)
+            for nombre, valor in entradas.items()
+        }
+        return [torch.from_numpy(np.asarray(salida)) for salida in self.sessions[sesion].run(None, feeds)]
+
+    # ------------------------------------------------------------------
+    #  Misma superficie que Florence2ForConditionalGeneration
+    # ------------------------------------------------------------------
+    def _encode_image(self, pixel_values: torch.Tensor) -> torch.Tensor:
+        return self._run("vision_encoder", {"pixel_values": pixel_values.float()})[0]
+
+    def get_input_embeddings(self):
+        return _EmbeddingOnnx(self)
+
+    def _merge_input_ids_with_image_features(self, image_features, inputs_embeds):
+        image_mask = torch.ones(image_features.shape[:2], dtype=torch.long)
+        if inputs_embeds is None:
+            return image_features, image_mask
+        text_mask = torch.ones(inputs_embeds.shape[:2], dtype=torch.long)
+        return torch.cat([image_features, inputs_embeds], dim=1), torch.cat([image_mask, text_mask], dim=1)
+
+    def generate(self, input_ids=None, pixel_values=None, inputs_embeds=None, attention_mask=None,
+                 max_new_tokens: int = 1024, do_sample: bool = False, num_beams: int = 1,
+                 temperature: float = 1.0, top_p: float = 1.0, top_k: int = 0,
+                 repetition_penalty: float = 1.0, no_repeat_ngram_size: int = 0, min_length: int = 0,
+                 logits_processor=None, stopping_criteria=None, streamer=None, **kwargs) -> torch.LongTensor:
+        """Decodificación greedy/sampling con KV‑cache sobre los grafos ONNX."""
+        if num_beams > 1 and not self._aviso_beams:
+            logger.info("Backend ONNX: num_beams=%s no soportado, se usa %s",
+                        num_beams, "sampling" if do_sample else "greedy")
+            self._aviso_beams = True
+
+        # 1. Embeddings de entrada (imagen + prompt) y encoder
+        if inputs_embeds is None:
+            inputs_embeds = self.get_input_embeddings()(input_ids) if input_ids is not None else None
+            if pixel_values is not None:
+                image_features = self._encode_image(pixel_values)
+                inputs_embeds, attention_mask = self._merge_input_ids_with_image_features(
+                    image_features, inputs_embeds
+                )
+        if attention_mask is None:
+            attention_mask = torch.ones(inputs_embeds.shape[:2], dtype=torch.long)
+        attention_mask = attention_mask.long()
+        hidden = self._run("encoder_model", {"inputs_embeds": inputs_embeds.float(),
+                                             "attention_mask": attention_mask})[0]
+
+        # 2. Procesadores de logits con la misma semántica que transformers
+        eos = self.info["eos_token_id"]
+        procesadores = crear_procesadores_logits(
+            eos, self.info.get("forced_bos_token_id"), min_length=min_length,
+            repetition_penalty=repetition_penalty, no_repeat_ngram_size=no_repeat_ngram_size,
+            do_sample=do_sample, temperature=temperature, top_k=top_k, top_p=top_p, extra=logits_processor,
+        )
+
+        # 3. Bucle de decodificación reutilizando la KV‑cache
+        batch = hidden.shape[0]
+        ids = torch.full((batch, 1), self.info["decoder_start_token_id"], dtype=torch.long)
+        terminadas = torch.zeros(batch, dtype=torch.bool)
+        cross, self_kv = None, None
+        if streamer is not None:
+            # Igual que transformers: primero los ids de inicio del decoder
+            streamer.put(ids)
+        for _ in range(max_new_tokens):
+            comunes = {"encoder_hidden_states": hidden, "encoder_attention_mask": attention_mask}
+            if self_kv is None:
+                salidas = self._run("decoder_model", {"input_ids": ids, **comunes})
+                kv = salidas[1:]
+                cross = [t for i, t in enumerate(kv) if i % 4 >= 2]
+                self_kv = [t for i, t in enumerate(kv) if i % 4 < 2]
+            else:
+                past = []
+                for capa in range(self.info["num_layers"]):
+                    past += self_kv[2 * capa:2 * capa + 2] + cross[2 * capa:2 * capa + 2]
+                salidas = self._run("decoder_with_past_model", {
+                    "input_ids": ids[:, -1:], **comunes, **dict(zip(self._past_names, past))
+                })
+                self_kv = salidas[1:]
+
+            scores = procesadores(ids, salidas[0][:, -1, :].float())
+            if do_sample:
+                siguiente = torch.multinomial(torch.softmax(scores, dim=-1), num_samples=1).squeeze(1)
+            else:
+                siguiente = scores.argmax(dim=-1)
+            siguiente = torch.where(terminadas, torch.full_like(siguiente, self.info["pad_token_id"]), siguiente)
+            ids = torch.cat([ids, siguiente[:, None]], dim=1)
+            if streamer is not None:
+                streamer.put(siguiente)
+
+            terminadas |= siguiente == eos
+            if terminadas.all():
+                break
+            if stopping_criteria is not None and bool(torch.as_tensor(stopping_criteria(ids, scores)).all()):
+                break
+
+        if streamer is not None:
+            streamer.end()
+        return ids
+
+
+class OnnxFlorence2Manager(Florence2Manager):
+    """
+    `Florence2Manager` con backend ONNX Runtime en CPU.
+
+    En el primer arranque exporta el checkpoint a `models/onnx/<modelo>/`
+    (requiere cargar una vez el modelo PyTorch); después solo carga los grafos.
+    """
+
+    def _detect_best_device(self):
+        return "cpu"
+
+    def _get_gpu_info(self):
+        return {"available": False, "reason": "Backend ONNX Runtime (CPU)"}
+
+    def _ruta_onnx(self) -> Path:
+        base = Path(self.config.get("ruta_onnx") or ROOT_DIR / "models/onnx")
+        return base / Path(self.model_id).name
+
+    def cargar_modelo(self, callback=None):
+        """Carga el processor y las sesiones ONNX, exportando antes si hace falta."""
+        self._callback = callback
+        try:
+            if not ORT_AVAILABLE:
+                raise RuntimeError("onnxruntime no está instalado. Ejecuta: pip install onnxruntime")
+
+            with patch("transformers.dynamic_module_utils.get_imports", self._fixed_get_imports):
+                if callback:
+                    callback("📝 Cargando tokenizer y processor...")
+                self._cargar_processor()
+
+                onnx_dir = self._ruta_onnx()
+                if not (onnx_dir / EXPORT_INFO).is_file():
+                    if callback:
+                        callback("🔄 Primera ejecución: exportando Florence-2 a ONNX (solo una vez)...")
+                    self.dtype = torch.float32
+                    self._cargar_pesos(callback)
+                    exportar_onnx(self.model.float().cpu().eval(), self.processor, onnx_dir, callback)
+                    self.model = None
+
+            self.model = OnnxFlorence2Model(onnx_dir, int(self.config.get("onnx_threads") or 0))
+            if callback:
+                callback("✅ Modelo cargado con ONNX Runtime (CPU)")
+            return True
+
+        except Exception as exc:
+            if callback:
+                callback(f"❌ Error al cargar modelo ONNX: {exc}")
+            return False
@@ -0,0 +1,186 @@
+"""
+Etapas de procesamiento conectadas por colas acotadas.
+
+Cada etapa es un grupo de hilos que lee trabajos de su cola de entrada y
+escribe los resultados en la de salida. Las colas tienen tamaño máximo, así
+que una etapa lenta frena a las anteriores en lugar de acumular memoria.
+
+El fin del flujo se señala con `FIN`: cuando el último hilo de una etapa
+termina, lo pasa a la siguiente. Una etapa que deja de trabajar antes de
+tiempo (detención o error) sigue vaciando su entrada hasta `FIN`, para que
+las anteriores nunca queden bloqueadas en un `put`.
+
+La entrada de cada etapa se puede leer sin bloquear (`tomar`, `tomar_lote`):
+con un origen en vivo (modo vigilancia) una etapa entrega lo que ya tiene en
+lugar de esperar a completar un lote que quizá tarde minutos en llegar.
+"""
+import logging
+import queue
+import threading
+import time
+from typing import Callable, Iterable, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Marca de fin de flujo que recorre las colas
+FIN = object()
+# Devuelto por `tomar()` cuando no llegó nada en el plazo
+VACIA = object()
+
+
+class LectorCola:
+    """
+    Itera la cola hasta `FIN`, que se devuelve a la cola para los demás hilos
+    de la etapa. `tomar(timeout)` espera como mucho `timeout` segundos.
+    """
+
+    def __init__(self, cola: queue.Queue):
+        self.cola = cola
+        self.terminado = False
+
+    def __iter__(self) -> "LectorCola":
+        return self
+
+    def __next__(self):
+        return self.tomar()
+
+    def tomar(self, timeout: Optional[float] = None):
+        """Siguiente trabajo, o `VACIA` si no llega en `timeout` s; `StopIteration` al llegar a `FIN`."""
+        if self.terminado:
+            raise StopIteration
+        try:
+            trabajo = self.cola.get(timeout=timeout) if timeout is None or timeout > 0 else self.cola.get_nowait()
+        except queue.Empty:
+            return VACIA
+        if trabajo is FIN:
+            self.cola.put(FIN)
+            self.terminado = True
+            raise StopIteration
+        return trabajo
+
+
+def leer_cola(cola: queue.Queue) -> LectorCola:
+    return LectorCola(cola)
+
+
+class Mapeo:
+    """`funcion` aplicada a cada elemento de `fuente`, conservando `tomar()`."""
+
+    def __init__(self, fuente: Iterable, funcion: Callable):
+        self.fuente = fuente if hasattr(fuente, "tomar") else iter(fuente)
+        self.funcion = funcion
+
+    def __iter__(self) -> "Mapeo":
+        return self
+
+    def __next__(self):
+        return self.funcion(next(self.fuente))
+
+    def tomar(self, timeout: Optional[float] = None):
+        elemento = tomar(self.fuente, timeout)
+        return elemento if elemento is VACIA else self.funcion(elemento)
+
+
+def tomar(fuente: Iterator, timeout: Optional[float] = None):
+    """
+    Siguiente elemento de `fuente` esperando como mucho `timeout` s (`VACIA`
+    si no llega; `StopIteration` al final). Los iteradores sin `tomar()`
+    siempre bloquean.
+    """
+    if timeout is not None and hasattr(fuente, "tomar"):
+        return fuente.tomar(timeout)
+    return next(fuente)
+
+
+def tomar_lote(fuente: Iterator, tamano: int, espera_s: Optional[float] = None,
+               bloquear: bool = True) -> List:
+    """
+    Hasta `tamano` elementos de `fuente`.
+
+    El primero se espera si `bloquear` (si no, solo se toma si ya está); con
+    `espera_s`, los demás solo mientras lleguen en ese plazo, así un origen en
+    vivo no retiene un lote a medias. Lista vacía al final de `fuente` (o si
+    no había nada listo con `bloquear=False`).
+    """
+    lote = []
+    limite = None if espera_s is None else time.monotonic() + espera_s
+    while len(lote) < tamano:
+        if not lote:
+            timeout = None if bloquear else 0
+        else:
+            timeout = None if limite is None else max(0.0, limite - time.monotonic())
+        try:
+            elemento = tomar(fuente, timeout)
+        except StopIteration:
+            break
+        if elemento is VACIA:
+            break
+        lote.append(elemento)
+    return lote
+
+
+def por_trabajo(funcion: Callable) -> Callable[[Iterable], Iterator]:
+    """Adapta una función 1:1 (`trabajo -> trabajo | None`) al formato de etapa."""
+    def etapa(trabajos):
+        for trabajo in trabajos:
+            yield funcion(trabajo)
+    return etapa
+
+
+class Etapa:
+    """
+    Grupo de hilos de una etapa.
+
+    Args:
+        nombre: Nombre de la etapa (hilos y mensajes de error)
+        funcion: Recibe el iterador de trabajos de la entrada (None si la
+            etapa es el origen) y genera los trabajos de salida; los None se descartan
+        entrada: Cola de entrada (None para el origen)
+        salida: Cola de salida (None para la última etapa)
+        workers: Nº de hilos; cada uno ejecuta su propia `funcion`
+        al_fallar: Se llama con `(nombre, excepción)` si un hilo falla
+    """
+
+    def __init__(self, nombre: str, funcion: Callable, entrada: Optional[queue.Queue],
+                 salida: Optional[queue.Queue], workers: int = 1, al_fallar: Callable = None):
+        self.nombre = nombre
+        self.funcion = funcion
+        self.entrada = entrada
+        self.salida = salida
+        self.workers = 1 if entrada is None else max(1, int(workers))
+        self.al_fallar = al_fallar
+        self._vivos = self.workers
+        self._lock = threading.Lock()
+        self._hilos: List[threading.Thread] = []
+
+    def iniciar(self) -> "Etapa":
+        for i in range(self.workers):
+            hilo = threading.Thread(target=self._trabajar, name=f"etapa-{self.nombre}-{i}", daemon=True)
+            self._hilos.append(hilo)
+            hilo.start()
+        return self
+
+    def _trabajar(self):
+        trabajos = leer_cola(self.entrada) if self.entrada is not None else None
+        try:
+            for resultado in self.funcion(trabajos):
+                if resultado is not None and self.salida is not None:
+                    self.salida.put(resultado)
+        except Exception as exc:
+            logger.exception(f"❌ Error en la etapa {self.nombre}")
+            if self.al_fallar:
+                self.al_fallar(self.nombre, exc)
+        finally:
+            # Vaciar lo que quede para no bloquear a la etapa anterior
+            if trabajos is not None:
+                for _ in trabajos:
+                    pass
+            with self._lock:
+                self._vivos -= 1
+                ultimo = self._vivos == 0
+            if ultimo and self.salida is not None:
+                self.salida.put(FIN)
+
+    def esperar(self):
+        for hilo in self._hilos:
+            hilo.join()
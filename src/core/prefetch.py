@@ -0,0 +1,111 @@
+"""
+Prefetch de imágenes para el procesamiento por lotes.
+
+Decodifica y preprocesa las próximas K imágenes en un pool de hilos o de
+procesos mientras el modelo genera la actual, de modo que `generate` no
+espere al JPEG decode ni al resize.
+
+Solo se espera al origen de rutas cuando no hay nada en vuelo: si el origen
+admite `tomar()` (ver core.pipeline), el resto se repone con lo que ya esté
+listo, así una imagen que llega sola no queda esperando a las siguientes.
+"""
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Dict, Iterable, Iterator
+
+from core.image_processor import preparar_imagen
+from core.pipeline import VACIA, tomar
+
+# Processor de imagen de cada proceso del pool (se envía una vez, no por tarea)
+_worker_image_processor = None
+
+
+def _init_worker(image_processor):
+    global _worker_image_processor
+    _worker_image_processor = image_processor
+
+
+def _preparar_en_worker(image_path: str) -> Dict:
+    return preparar_imagen(image_path, _worker_image_processor)
+
+
+class ImagePrefetcher:
+    """
+    Iterador acotado que entrega imágenes preparadas en el orden de entrada.
+
+    Como mucho `depth` imágenes están en vuelo a la vez, así que la memoria
+    queda acotada aunque la carpeta tenga miles de fotos. Los fallos de
+    decodificación se devuelven como `{"path": ..., "error": ...}` para que
+    el lote siga adelante.
+
+    Args:
+        image_paths: Rutas a preparar
+        image_processor: `ImageProcessor` cuyo `preparar_imagen` se usa
+        depth: Nº de imágenes preparadas por adelantado (K)
+        workers: Tamaño del pool
+        mode: "thread" (por defecto) o "process"
+    """
+
+    def __init__(self, image_paths: Iterable[str], image_processor, depth: int = 8,
+                 workers: int = 2, mode: str = "thread"):
+        if mode not in ("thread", "process"):
+            raise ValueError(f"Modo de prefetch no válido: {mode}")
+        self._paths = image_paths if hasattr(image_paths, "tomar") else iter(image_paths)
+        self.depth = max(1, int(depth))
+        self._pendientes = deque()
+
+        if mode == "process":
+            # Solo viaja el image processor (picklable); el modelo se queda en este proceso
+            hf_image_processor = None
+            if image_processor.share_image_features and image_processor._soporta_features():
+                hf_image_processor = image_processor.manager.processor.image_processor
+            self._executor = ProcessPoolExecutor(
+                max_workers=max(1, int(workers)), initializer=_init_worker, initargs=(hf_image_processor,)
+            )
+            self._preparar = _preparar_en_worker
+        else:
+            self._executor = ThreadPoolExecutor(max_workers=max(1, int(workers)),
+                                                thread_name_prefix="stockprep-prefetch")
+            self._preparar = image_processor.preparar_imagen
+
+    def _rellenar(self, esperar: bool):
+        """Completa hasta `depth`; al origen solo se le espera si `esperar` y no hay nada en vuelo."""
+        while len(self._pendientes) < self.depth:
+            try:
+                path = tomar(self._paths, None if esperar and not self._pendientes else 0)
+            except StopIteration:
+                return
+            if path is VACIA:
+                return
+            path = str(path)
+            self._pendientes.append((path, self._executor.submit(self._preparar, path)))
+
+    def __iter__(self) -> Iterator[Dict]:
+        return self
+
+    def __next__(self) -> Dict:
+        self._rellenar(esperar=True)
+        if not self._pendientes:
+            self.close()
+            raise StopIteration
+        path, future = self._pendientes.popleft()
+        try:
+            item = future.result()
+        except Exception as exc:
+            item = {"path": path, "error": str(exc)}
+        # Reponer el hueco antes de devolver, para que el pool trabaje durante generate()
+        self._rellenar(esperar=False)
+        return item
+
+    def close(self):
+        """Cancela el trabajo pendiente y libera el pool."""
+        for _, future in self._pendientes:
+            future.cancel()
+        self._pendientes.clear()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
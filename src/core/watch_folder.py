@@ -0,0 +1,313 @@
+"""
+Modo vigilancia: procesa las imágenes según llegan a una carpeta de entrada.
+
+En Linux se usa inotify (con ctypes, sin dependencias); si no está
+disponible se sondea la carpeta cada `intervalo_s`. Un fichero solo entra en
+el lote cuando su tamaño y su fecha de modificación no cambian durante
+`estabilidad_s`, para no leer copias a medias desde la tarjeta o la red.
+
+La memoria y la CPU no crecen con el tiempo: los ficheros procesados salen
+de la carpeta (a `procesadas/`, o a `errores/` si fallan) y solo se siguen
+los pendientes de estabilizarse y los que están en el lote.
+
+Configuración (settings.yaml):
+
+    vigilancia:
+      estabilidad_s: 2
+      intervalo_s: 1
+      carpeta_destino: ""
+      carpeta_errores: ""
+      sondeo: false
+"""
+import ctypes
+import ctypes.util
+import logging
+import os
+import select
+import shutil
+import struct
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from core.batch_engine import ruta_libre
+from core.cancelacion import MOTIVO_CANCELADO
+from core.model_manager import cargar_config_seccion
+from utils.image_discovery import FORMATOS, detectar_formato
+
+logger = logging.getLogger(__name__)
+
+# Constantes de <sys/inotify.h>
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+
+# Ficheros que no son imagen recordados para no releerlos en cada sondeo
+MAX_DESCARTADOS = 4096
+
+# struct inotify_event: wd, mask, cookie, len (+ nombre de `len` bytes)
+_CABECERA = struct.Struct("iIII")
+
+
+class _Inotify:
+    """Lo mínimo de inotify para vigilar carpetas (Linux)."""
+
+    MASCARA = IN_CREATE | IN_CLOSE_WRITE | IN_MOVED_TO
+
+    def __init__(self):
+        self._libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self.fd = self._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1")
+        self._carpetas: Dict[int, str] = {}
+
+    def vigilar(self, carpeta: str):
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(carpeta), self.MASCARA)
+        if wd < 0:
+            raise OSError(ctypes.get_errno(), f"inotify_add_watch {carpeta}")
+        self._carpetas[wd] = carpeta
+
+    def leer(self, timeout: float) -> List[Tuple[Optional[str], int]]:
+        """Eventos `(ruta, máscara)` hasta `timeout`; ruta None si la cola del kernel se desbordó."""
+        listos, _, _ = select.select([self.fd], [], [], timeout)
+        if not listos:
+            return []
+        try:
+            datos = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+        eventos, pos = [], 0
+        while pos + _CABECERA.size <= len(datos):
+            wd, mascara, _, longitud = _CABECERA.unpack_from(datos, pos)
+            pos += _CABECERA.size
+            nombre = datos[pos:pos + longitud].rstrip(b"\0")
+            pos += longitud
+            if mascara & IN_Q_OVERFLOW:
+                eventos.append((None, mascara))
+            elif mascara & IN_IGNORED:
+                # La carpeta se borró o se movió: el kernel ya quitó la vigilancia
+                self._carpetas.pop(wd, None)
+            elif nombre and wd in self._carpetas:
+                eventos.append((os.path.join(self._carpetas[wd], os.fsdecode(nombre)), mascara))
+        return eventos
+
+    def cerrar(self):
+        os.close(self.fd)
+
+
+class FolderWatcher:
+    """
+    Iterador sin fin de imágenes nuevas y estables de una carpeta.
+
+    Args:
+        carpeta: Carpeta de entrada
+        estabilidad_s: Segundos sin cambios de tamaño antes de entregar un fichero
+        intervalo_s: Cada cuánto se comprueban los candidatos (y se sondea, sin inotify)
+        recursivo: Vigilar también las subcarpetas (sesiones copiadas como carpeta)
+        excluir: Carpetas que no se vigilan (destino y errores, si cuelgan de la entrada)
+        sondeo: Forzar el sondeo aunque haya inotify
+    """
+
+    def __init__(self, carpeta: str, estabilidad_s: float = 2.0, intervalo_s: float = 1.0,
+                 recursivo: bool = True, excluir=(), sondeo: bool = False):
+        self.carpeta = os.path.abspath(carpeta)
+        self.estabilidad_s = float(estabilidad_s)
+        self.intervalo_s = max(0.1, float(intervalo_s))
+        self.recursivo = recursivo
+        self.excluir = {os.path.abspath(c) for c in excluir if c}
+        # ruta -> (tamaño, mtime, desde cuándo no cambia)
+        self._candidatos: Dict[str, Tuple[int, float, float]] = {}
+        # Ficheros estables que no son imágenes (ruta -> (tamaño, mtime)), acotado
+        self._descartados: "OrderedDict[str, Tuple[int, float]]" = OrderedDict()
+        self._en_vuelo = set()
+        self._lock = threading.Lock()
+        self._parar = threading.Event()
+        self._inotify = None
+        if not sondeo:
+            try:
+                self._inotify = _Inotify()
+            except (OSError, AttributeError) as exc:
+                logger.info(f"inotify no disponible ({exc}); se sondeará la carpeta")
+        self.modo = "inotify" if self._inotify is not None else "sondeo"
+
+    def rutas(self) -> Iterator[str]:
+        """Entrega cada imagen una vez, cuando deja de cambiar; termina con `detener()`."""
+        try:
+            self._explorar(self.carpeta)
+            while not self._parar.is_set():
+                if self._inotify is not None:
+                    for ruta, mascara in self._inotify.leer(self.intervalo_s):
+                        if ruta is None:
+                            # Se perdieron eventos: volver a mirar toda la carpeta
+                            self._explorar(self.carpeta)
+                        elif mascara & IN_ISDIR:
+                            if self.recursivo and self._incluida(ruta):
+                                self._explorar(ruta)
+                        else:
+                            self._anotar(ruta)
+                else:
+                    self._parar.wait(self.intervalo_s)
+                    self._explorar(self.carpeta)
+                yield from self._estables()
+        finally:
+            if self._inotify is not None:
+                self._inotify.cerrar()
+
+    def __iter__(self) -> Iterator[str]:
+        return self.rutas()
+
+    def terminado(self, ruta: str):
+        """El lote ya no tiene `ruta` en vuelo."""
+        with self._lock:
+            self._en_vuelo.discard(ruta)
+
+    def detener(self):
+        self._parar.set()
+
+    # ------------------------------------------------------------------
+    def _incluida(self, carpeta: str) -> bool:
+        return os.path.abspath(carpeta) not in self.excluir
+
+    def _explorar(self, carpeta: str):
+        """Anota los ficheros de `carpeta` (y subcarpetas), vigilándolas con inotify."""
+        pendientes = [carpeta]
+        while pendientes:
+            actual = pendientes.pop()
+            try:
+                # Vigilar antes de listar: lo que llegue mientras tanto genera evento
+                if self._inotify is not None:
+                    self._inotify.vigilar(actual)
+                with os.scandir(actual) as entradas:
+                    for entrada in entradas:
+                        if entrada.is_dir(follow_symlinks=False):
+                            if self.recursivo and self._incluida(entrada.path):
+                                pendientes.append(entrada.path)
+                        elif entrada.is_file():
+                            self._anotar(entrada.path)
+            except OSError as exc:
+                logger.warning(f"⚠️ No se puede vigilar {actual}: {exc}")
+
+    def _anotar(self, ruta: str):
+        if os.path.basename(ruta).startswith("."):
+            return
+        with self._lock:
+            if ruta in self._en_vuelo or ruta in self._candidatos:
+                return
+            if ruta in self._descartados:
+                try:
+                    st = os.stat(ruta)
+                except OSError:
+                    del self._descartados[ruta]
+                    return
+                if (st.st_size, st.st_mtime) == self._descartados[ruta]:
+                    return
+                del self._descartados[ruta]  # ha cambiado: se vuelve a mirar
+            self._candidatos[ruta] = (-1, 0.0, 0.0)
+
+    def _estables(self) -> List[str]:
+        """Candidatos cuyo tamaño y mtime no han cambiado en `estabilidad_s`, que pasan a en vuelo."""
+        ahora = time.monotonic()
+        listos = []
+        with self._lock:
+            for ruta, (tamano, mtime, desde) in list(self._candidatos.items()):
+                try:
+                    st = os.stat(ruta)
+                except OSError:
+                    del self._candidatos[ruta]  # borrado o movido antes de estabilizarse
+                    continue
+                if (st.st_size, st.st_mtime) != (tamano, mtime):
+                    self._candidatos[ruta] = (st.st_size, st.st_mtime, ahora)
+                elif st.st_size > 0 and ahora - desde >= self.estabilidad_s:
+                    del self._candidatos[ruta]
+                    # El formato se mira ya completo: la cabecera puede no estar escrita antes
+                    if detectar_formato(ruta) not in FORMATOS:
+                        self._descartados[ruta] = (st.st_size, st.st_mtime)
+                        if len(self._descartados) > MAX_DESCARTADOS:
+                            self._descartados.popitem(last=False)
+                        continue
+                    self._en_vuelo.add(ruta)
+                    listos.append(ruta)
+        return sorted(listos)
+
+
+class WatchMode:
+    """
+    Ejecuta un `BatchEngine` sobre las imágenes que llegan a una carpeta.
+
+    Las procesadas se mueven (renombradas) a `carpeta_destino` y las que
+    fallan a `carpeta_errores`; por defecto, `procesadas/` y `errores/`
+    dentro de la carpeta vigilada, que no se vigilan.
+    """
+
+    def __init__(self, engine, carpeta: str, carpeta_destino: Optional[str] = None,
+                 carpeta_errores: Optional[str] = None, estabilidad_s: float = 2.0,
+                 intervalo_s: float = 1.0, sondeo: bool = False):
+        self.engine = engine
+        self.carpeta = os.path.abspath(carpeta)
+        self.carpeta_destino = carpeta_destino or os.path.join(self.carpeta, "procesadas")
+        self.carpeta_errores = carpeta_errores or os.path.join(self.carpeta, "errores")
+        engine.carpeta_destino = self.carpeta_destino
+        self.watcher = FolderWatcher(
+            self.carpeta, estabilidad_s, intervalo_s,
+            excluir=(self.carpeta_destino, self.carpeta_errores), sondeo=sondeo,
+        )
+        self.procesadas = 0
+        self.errores = 0
+
+    def _log(self, mensaje: str):
+        if self.engine.status_callback:
+            self.engine.status_callback('log', mensaje)
+
+    def ejecutar(self):
+        """Bloquea hasta `detener()`."""
+        self._log(f"👀 Vigilando {self.carpeta} ({self.watcher.modo}); "
+                  f"las imágenes procesadas van a {self.carpeta_destino}")
+        self.engine.procesar(self.watcher, al_resultado=self._al_resultado, acumular=False)
+        self._log(f"👀 Vigilancia terminada: {self.procesadas} procesadas, {self.errores} con error")
+
+    def detener(self, inmediato: bool = False):
+        """
+        Deja de aceptar imágenes nuevas; las que están en el lote terminan. Con
+        `inmediato` también se cancela el lote y esas se quedan en la entrada.
+        """
+        self.watcher.detener()
+        if inmediato:
+            self.engine.stop()
+
+    def _al_resultado(self, resultado: Dict):
+        ruta = resultado.get("ruta_original")
+        if not ruta:
+            return
+        self.watcher.terminado(ruta)
+        if resultado.get("interrumpido") == MOTIVO_CANCELADO:
+            return  # se queda en la entrada y se procesa en la próxima ejecución
+        if resultado.get("error"):
+            self.errores += 1
+        else:
+            self.procesadas += 1
+        # Lo que no se pudo procesar o mover sale de la entrada para no repetirse sin fin
+        if os.path.exists(ruta):
+            try:
+                destino = ruta_libre(Path(self.carpeta_errores), Path(ruta).name)
+                shutil.move(ruta, str(destino))
+                self._log(f"  🗂️ Movido a errores: {destino.name}")
+            except OSError as exc:
+                logger.warning(f"⚠️ No se pudo mover {ruta} a errores: {exc}")
+
+
+def crear_vigilancia_desde_config(engine, carpeta: str) -> WatchMode:
+    """`WatchMode` con los parámetros de `vigilancia` de settings.yaml."""
+    config = cargar_config_seccion("vigilancia")
+    return WatchMode(
+        engine, carpeta,
+        carpeta_destino=config.get("carpeta_destino") or None,
+        carpeta_errores=config.get("carpeta_errores") or None,
+        estabilidad_s=config.get("estabilidad_s", 2),
+        intervalo_s=config.get("intervalo_s", 1),
+        sondeo=bool(config.get("sondeo", False)),
+    )
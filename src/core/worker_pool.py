@@ -0,0 +1,149 @@
+"""
+Pool de procesos de inferencia en CPU.
+
+En CPU, un solo `generate` deja de escalar a partir de pocos hilos, así que en
+máquinas con muchos núcleos es más rápido tener N procesos, cada uno con su
+propio Florence‑2 y una parte fija de los núcleos (`torch.set_num_threads`).
+
+`InferenceWorkerPool.imap` reparte las rutas en lotes entre los workers y
+devuelve los resultados en el mismo orden de entrada.
+"""
+import logging
+import multiprocessing
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from core.pipeline import Mapeo, tomar_lote
+from utils.memoria_sistema import memoria_disponible_gb
+
+logger = logging.getLogger(__name__)
+
+# Modo "auto": hilos por worker a partir de los cuales generate apenas escala
+HILOS_POR_WORKER_AUTO = 4
+# Memoria estimada de un worker con Florence‑2 large en fp32 (pesos + activaciones)
+MEMORIA_POR_WORKER_GB = 3.0
+
+# Estado de cada proceso del pool (se crea una vez en el initializer)
+_worker_processor = None
+
+
+def resolver_workers(workers="auto", threads_per_worker: int = 0) -> Tuple[int, int]:
+    """
+    Calcula (nº de workers, hilos por worker).
+
+    Con `workers="auto"` (o 0) se usan bloques de `threads_per_worker` núcleos
+    (HILOS_POR_WORKER_AUTO por defecto), limitados por la memoria disponible.
+    Si no se indican los hilos, los núcleos se reparten a partes iguales.
+    """
+    cores = os.cpu_count() or 1
+    if workers in (None, "auto", 0, "0"):
+        hilos = int(threads_per_worker or HILOS_POR_WORKER_AUTO)
+        workers = max(1, cores // max(1, hilos))
+        memoria = memoria_disponible_gb()
+        if memoria is not None:
+            workers = max(1, min(workers, int(memoria // MEMORIA_POR_WORKER_GB)))
+    else:
+        workers = max(1, int(workers))
+    hilos = int(threads_per_worker or 0) or max(1, cores // workers)
+    return workers, hilos
+
+
+def _init_worker(threads: int, manager_kwargs: Dict):
+    """Carga el modelo una sola vez por proceso, en CPU y con sus hilos asignados."""
+    global _worker_processor
+    import torch
+
+    from core.image_processor import ImageProcessor
+    from core.model_manager import crear_model_manager
+
+    torch.set_num_threads(threads)
+    try:
+        torch.set_num_interop_threads(1)
+    except RuntimeError:
+        pass
+
+    manager = crear_model_manager(**manager_kwargs)
+    manager.device = "cpu"
+    # Los hilos del worker los decide el pool, no la calibración
+    manager.autoajuste_cpu = False
+    if not manager.config.get("onnx_threads"):
+        manager.config["onnx_threads"] = threads
+    if not manager.cargar_modelo():
+        raise RuntimeError(f"El worker {os.getpid()} no pudo cargar el modelo")
+    _worker_processor = ImageProcessor(manager)
+
+
+def _procesar_en_worker(paths: List[str], detail_level: str, tasks: Optional[List[str]]) -> List[Dict]:
+    return _worker_processor.process_images(paths, detail_level, batch_size=len(paths), tasks=tasks)
+
+
+class InferenceWorkerPool:
+    """
+    N procesos con un modelo cada uno y un despachador que conserva el orden.
+
+    Args:
+        workers: Nº de procesos o "auto"
+        threads_per_worker: Hilos de PyTorch por proceso (0 = repartir núcleos)
+        chunk_size: Imágenes por tarea (cada tarea es un lote de `process_images`)
+        depth: Lotes en vuelo como máximo (por defecto 2 por worker)
+        manager_kwargs: Argumentos para `crear_model_manager` en cada worker
+    """
+
+    def __init__(self, workers="auto", threads_per_worker: int = 0, chunk_size: int = 4,
+                 depth: Optional[int] = None, manager_kwargs: Optional[Dict] = None):
+        self.workers, self.threads_per_worker = resolver_workers(workers, threads_per_worker)
+        self.chunk_size = max(1, int(chunk_size))
+        self.depth = max(self.workers, int(depth or 2 * self.workers))
+        # spawn: cada worker arranca limpio (sin heredar hilos ni estado de torch del padre)
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(self.threads_per_worker, manager_kwargs or {}),
+        )
+        logger.info("Pool de inferencia: %s workers x %s hilos", self.workers, self.threads_per_worker)
+
+    def imap(self, image_paths: Iterable[str], detail_level: str = "largo",
+             tasks: Optional[List[str]] = None,
+             espera_s: Optional[float] = None) -> Iterator[Tuple[List[str], List[Dict]]]:
+        """
+        Entrega `(rutas_del_lote, resultados)` en el orden de `image_paths`.
+
+        Con `espera_s` (origen en vivo que admite `tomar()`, ver core.pipeline)
+        un lote sale a medias si no se completa en ese plazo, y con lotes en
+        vuelo solo se encola lo que el origen ya tenga listo.
+        """
+        rutas = Mapeo(image_paths, str)
+        pendientes = deque()
+
+        def rellenar(esperar: bool):
+            while len(pendientes) < self.depth:
+                lote = tomar_lote(rutas, self.chunk_size, espera_s, bloquear=esperar and not pendientes)
+                if not lote:
+                    return
+                pendientes.append((lote, self._executor.submit(_procesar_en_worker, lote, detail_level, tasks)))
+
+        rellenar(esperar=True)
+        while pendientes:
+            lote, future = pendientes.popleft()
+            try:
+                resultados = future.result()
+            except Exception as exc:
+                resultados = [{"error": f"Error en el worker: {exc}", "archivo": Path(p).name} for p in lote]
+            rellenar(esperar=espera_s is None)
+            yield lote, resultados
+            if not pendientes:
+                rellenar(esperar=True)
+
+    def close(self):
+        """Cancela los lotes pendientes y cierra los procesos."""
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
@@ -2,7 +2,7 @@
 Hilos de procesamiento para la interfaz gráfica
 """
 import logging
-from typing import Dict
+from typing import Dict, List
 from PySide6.QtCore import QThread, Signal
 
 logger = logging.getLogger(__name__)
@@ -36,24 +36,57 @@ class ProcessingThread(QThread):
     finished = Signal(dict)
     error = Signal(str)
     progress = Signal(int)
+    # Fragmentos del caption según se generan (solo con streaming)
+    token = Signal(str)
     
-    def __init__(self, image_path: str, processor, detail_level: str = "largo"):
+    def __init__(self, image_path: str, processor, detail_level: str = "largo", streaming: bool = False):
         super().__init__()
         self.image_path = image_path
         self.processor = processor
         self.detail_level = detail_level
+        self.streaming = streaming
     
     def run(self):
         """Ejecuta el procesamiento de imagen"""
         try:
             self.progress.emit(10)
             
-            # Procesar imagen con nivel de detalle específico
-            results = self.processor.process_image(self.image_path, self.detail_level)
+            # Procesar imagen con nivel de detalle específico; en streaming el
+            # caption llega por `token` y el resultado final lo sustituye
+            on_token = self.token.emit if self.streaming else None
+            results = self.processor.process_image(self.image_path, self.detail_level, on_token=on_token)
             
             self.progress.emit(100)
             self.finished.emit(results)
             
         except Exception as e:
             logger.error(f"Error procesando imagen: {e}")
-            self.error.emit(str(e)) 
\ No newline at end of file
+            self.error.emit(str(e)) 
+
+class BatchProcessingThread(QThread):
+    """Hilo que procesa un bloque de imágenes con una llamada por lote al modelo"""
+    finished = Signal(list)
+    error = Signal(str)
+    progress = Signal(int)
+    
+    def __init__(self, image_paths: List[str], processor, detail_level: str = "largo", batch_size: int = 4):
+        super().__init__()
+        self.image_paths = image_paths
+        self.processor = processor
+        self.detail_level = detail_level
+        self.batch_size = batch_size
+    
+    def run(self):
+        """Ejecuta el procesamiento del bloque"""
+        try:
+            self.progress.emit(10)
+            
+            # Un dict por imagen; los errores vienen aislados en cada dict
+            results = self.processor.process_images(self.image_paths, self.detail_level, self.batch_size)
+            
+            self.progress.emit(100)
+            self.finished.emit(results)
+            
+        except Exception as e:
+            logger.error(f"Error procesando lote: {e}")
+            self.error.emit(str(e))
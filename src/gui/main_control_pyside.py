@@ -21,8 +21,8 @@ if str(current_dir) not in sys.path:
     sys.path.insert(0, str(current_dir))
 
 if PYSIDE6_AVAILABLE:
-    from gui.modern_gui_win11 import StockPrepWin11App
-    from gui.database_gui_pyside import DatabaseManagerAppPyside
+    # Las ventanas se importan al abrirlas: el centro de control arranca sin
+    # cargar el procesador de imágenes ni sus dependencias
 
     class MainControlPyside(QMainWindow):
         """Ventana principal que actúa como centro de control."""
@@ -77,6 +77,7 @@ if PYSIDE6_AVAILABLE:
 
         def launch_image_processor(self):
             if not self.image_processor_window:
+                from gui.modern_gui_win11 import StockPrepWin11App
                 self.image_processor_window = StockPrepWin11App()
                 self.image_processor_window.setAttribute(Qt.WA_DeleteOnClose)
                 self.image_processor_window.destroyed.connect(
@@ -87,6 +88,7 @@ if PYSIDE6_AVAILABLE:
 
         def launch_db_manager(self):
             if not self.db_manager_window:
+                from gui.database_gui_pyside import DatabaseManagerAppPyside
                 self.db_manager_window = DatabaseManagerAppPyside()
                 self.db_manager_window.setAttribute(Qt.WA_DeleteOnClose)
                 self.db_manager_window.destroyed.connect(
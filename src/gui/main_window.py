@@ -333,6 +333,9 @@ class StockPrepApp:
 
         # Preparar para procesamiento
         self.procesando = True
+        token = getattr(self.processor, "cancel_token", None)
+        if token is not None:
+            token.reiniciar()
         self.btn_procesar.config(state=tk.DISABLED)
         self.btn_detener.config(state=tk.NORMAL)
         self.progreso['value'] = 0
@@ -541,6 +544,10 @@ class StockPrepApp:
     def detener_procesamiento(self):
         """Detiene el procesamiento en curso"""
         self.procesando = False
+        # Corta también el generate en curso, no solo el bucle entre imágenes
+        token = getattr(self.processor, "cancel_token", None)
+        if token is not None:
+            token.cancelar()
         self.btn_detener.config(state=tk.DISABLED)
         self.escribir_log("⏹️ Procesamiento detenido por el usuario")
 
@@ -17,6 +17,7 @@ try:
     from core.enhanced_database_manager import EnhancedDatabaseManager
     from output.output_handler_v2 import OutputHandlerV2
     from utils.keyword_extractor import KeywordExtractor
+    from utils.image_discovery import descubrir_imagenes
     from utils.safe_image_manager import create_safe_photoimage, cleanup_photoimage, cleanup_all_photoimages, shutdown_image_manager
 except ImportError:
     # Fallback para importaciones relativas
@@ -27,6 +28,7 @@ except ImportError:
     from core.enhanced_database_manager import EnhancedDatabaseManager
     from output.output_handler_v2 import OutputHandlerV2
     from utils.keyword_extractor import KeywordExtractor
+    from utils.image_discovery import descubrir_imagenes
     from utils.safe_image_manager import create_safe_photoimage, cleanup_photoimage, cleanup_all_photoimages, shutdown_image_manager
 
 logger = logging.getLogger(__name__)
@@ -635,18 +637,12 @@ class StockPrepApp:
                 self.status_label.config(text="No se encontraron imágenes en la carpeta")
     
     def find_images_in_folder(self, folder_path):
-        """Busca todas las imágenes en una carpeta"""
-        image_extensions = {'.png', '.jpg', '.jpeg', '.bmp', '.gif', '.tiff', '.webp'}
+        """Busca todas las imágenes en una carpeta y sus subcarpetas"""
         images = []
         
         try:
-            folder = Path(folder_path)
-            for file_path in folder.iterdir():
-                if file_path.is_file() and file_path.suffix.lower() in image_extensions:
-                    images.append(str(file_path))
-            
             # Ordenar alfabéticamente
-            images.sort()
+            images = sorted(descubrir_imagenes(folder_path))
             
         except Exception as e:
             logger.error(f"Error buscando imágenes: {e}")
@@ -22,7 +22,7 @@ try:
     from PySide6.QtCore import Qt, QThread, Signal, QTimer, QSize
     from PySide6.QtGui import (
         QPixmap, QFont, QIcon, QPalette, QColor, QAction,
-        QPainter, QBrush, QLinearGradient
+        QPainter, QBrush, QLinearGradient, QTextCursor
     )
     PYSIDE6_AVAILABLE = True
 except ImportError:
@@ -35,11 +35,15 @@ if PYSIDE6_AVAILABLE:
     if str(current_dir) not in sys.path:
         sys.path.insert(0, str(current_dir))
     
-    from core.model_manager import Florence2Manager
+    from core.model_manager import cargar_config_seccion, crear_model_manager
+    from core.model_daemon import conectar_daemon
+    from core.model_registry import crear_registro_desde_config
     from core.image_processor import ImageProcessor
     from core.enhanced_database_manager import EnhancedDatabaseManager
+    from core.job_journal import crear_diario_desde_config, estado_de_resultado, ERROR, HECHA
     from output.output_handler_v2 import OutputHandlerV2
     from utils.keyword_extractor import KeywordExtractor
+    from utils.image_discovery import descubrir_imagenes
 
     logger = logging.getLogger(__name__)
 
@@ -72,20 +76,25 @@ if PYSIDE6_AVAILABLE:
         finished = Signal(dict)
         error = Signal(str)
         progress = Signal(int)
+        # Fragmentos del caption según se generan (solo con streaming)
+        token = Signal(str)
         
-        def __init__(self, image_path: str, processor, detail_level: str = "largo"):
+        def __init__(self, image_path: str, processor, detail_level: str = "largo", streaming: bool = False):
             super().__init__()
             self.image_path = image_path
             self.processor = processor
             self.detail_level = detail_level
+            self.streaming = streaming
         
         def run(self):
             """Ejecuta el procesamiento de imagen"""
             try:
                 self.progress.emit(10)
                 
-                # Procesar imagen con nivel de detalle específico
-                results = self.processor.process_image(self.image_path, self.detail_level)
+                # Procesar imagen con nivel de detalle específico; en streaming el
+                # caption llega por `token` y el resultado final lo sustituye
+                on_token = self.token.emit if self.streaming else None
+                results = self.processor.process_image(self.image_path, self.detail_level, on_token=on_token)
                 
                 self.progress.emit(100)
                 self.finished.emit(results)
@@ -94,6 +103,34 @@ if PYSIDE6_AVAILABLE:
                 logger.error(f"Error procesando imagen: {e}")
                 self.error.emit(str(e))
 
+    class BatchProcessingThread(QThread):
+        """Hilo que procesa un bloque de imágenes con una llamada por lote al modelo"""
+        finished = Signal(list)
+        error = Signal(str)
+        progress = Signal(int)
+        
+        def __init__(self, image_paths: List[str], processor, detail_level: str = "largo", batch_size: int = 4):
+            super().__init__()
+            self.image_paths = image_paths
+            self.processor = processor
+            self.detail_level = detail_level
+            self.batch_size = batch_size
+        
+        def run(self):
+            """Ejecuta el procesamiento del bloque"""
+            try:
+                self.progress.emit(10)
+                
+                # Un dict por imagen; los errores vienen aislados en cada dict
+                results = self.processor.process_images(self.image_paths, self.detail_level, self.batch_size)
+                
+                self.progress.emit(100)
+                self.finished.emit(results)
+                
+            except Exception as e:
+                logger.error(f"Error procesando lote: {e}")
+                self.error.emit(str(e))
+
     class ModernStatsWidget(QWidget):
         """Widget moderno para mostrar estadísticas"""
         
@@ -184,6 +221,12 @@ if PYSIDE6_AVAILABLE:
             self.batch_images = []
             self.batch_processing = False
             self.batch_current_index = 0
+            self.batch_size = 4  # Imágenes por llamada al modelo
+            self.batch_chunk = []
+            # Diario de trabajos: posición de cada imagen del lote en su trabajo
+            self.journal = None
+            self.batch_job_id = None
+            self.batch_indices = []
             
             # Variables para carpeta de salida
             self.output_directory = None
@@ -207,14 +250,24 @@ if PYSIDE6_AVAILABLE:
         def init_core_components(self):
             """Inicializa los componentes del core"""
             try:
-                self.model_manager = Florence2Manager()
                 self.db_manager = EnhancedDatabaseManager("stockprep_images.db")
                 self.output_handler = OutputHandlerV2(output_directory=self.output_directory or "output", db_path="stockprep_images.db")
                 self.keyword_extractor = KeywordExtractor()
-                self.image_processor = ImageProcessor(
-                    model_manager=self.model_manager,
-                    keyword_extractor=self.keyword_extractor
-                )
+                self.journal = crear_diario_desde_config()
+                # Si hay un daemon con el modelo ya cargado se usa; si no, carga local
+                daemon = conectar_daemon(self.keyword_extractor)
+                if daemon:
+                    self.model_manager, self.image_processor = daemon
+                    logger.info("Usando el modelo del daemon local")
+                else:
+                    # Con `modelos.variantes` cada nivel de detalle usa su variante (base/large)
+                    registro = crear_registro_desde_config()
+                    self.model_manager = registro.manager() if registro else crear_model_manager()
+                    self.image_processor = ImageProcessor(
+                        model_manager=self.model_manager,
+                        keyword_extractor=self.keyword_extractor,
+                        registry=registro
+                    )
                 logger.info("Componentes del core inicializados correctamente")
             except Exception as e:
                 logger.error(f"Error inicializando componentes: {e}")
@@ -794,19 +847,10 @@ if PYSIDE6_AVAILABLE:
                     self.status_bar.showMessage("No se encontraron imágenes en la carpeta")
         
         def find_images_in_folder(self, folder_path: str):
-            """Encuentra todas las imágenes en una carpeta"""
-            extensions = {'.png', '.jpg', '.jpeg', '.bmp', '.gif', '.tiff', '.webp'}
-            images = []
-            
+            """Encuentra todas las imágenes en una carpeta y sus subcarpetas"""
             try:
-                folder = Path(folder_path)
-                for ext in extensions:
-                    images.extend(folder.glob(f"*{ext}"))
-                    images.extend(folder.glob(f"*{ext.upper()}"))
-                
                 # Ordenar por nombre
-                images.sort()
-                return [str(img) for img in images]
+                return sorted(descubrir_imagenes(folder_path))
                 
             except Exception as e:
                 logger.error(f"Error buscando imágenes: {e}")
@@ -892,9 +936,16 @@ if PYSIDE6_AVAILABLE:
             self.progress_bar.setValue(0)
             
             # Crear y iniciar hilo de procesamiento con nivel de detalle
+            # Solo si está activado y el nivel lo admite (el gestor del daemon no transmite tokens)
+            admite_streaming = getattr(self.image_processor, "admite_streaming", None)
+            streaming = (bool(cargar_config_seccion("procesamiento").get("streaming_gui", False))
+                         and admite_streaming is not None and admite_streaming(self.detail_level))
             self.processing_thread = ProcessingThread(
-                self.current_image_path, self.image_processor, self.detail_level
+                self.current_image_path, self.image_processor, self.detail_level, streaming
             )
+            if streaming:
+                self.caption_text.clear()
+                self.processing_thread.token.connect(self.on_caption_token)
             self.processing_thread.finished.connect(self.on_processing_finished)
             self.processing_thread.error.connect(self.on_processing_error)
             self.processing_thread.progress.connect(self.progress_bar.setValue)
@@ -922,6 +973,10 @@ if PYSIDE6_AVAILABLE:
             # Inicializar variables de lote
             self.batch_processing = True
             self.batch_current_index = 0
+            self.iniciar_trabajo_lote()
+            if not self.batch_images:
+                self.finish_batch_processing()
+                return
             
             # Deshabilitar botones
             self.process_btn.setEnabled(False)
@@ -934,71 +989,140 @@ if PYSIDE6_AVAILABLE:
             # Procesar primera imagen
             self.process_next_batch_image()
         
+        def iniciar_trabajo_lote(self):
+            """Abre el trabajo del lote en el diario, ofreciendo reanudar uno sin terminar."""
+            self.batch_job_id = None
+            self.batch_indices = list(range(len(self.batch_images)))
+            if self.journal is None:
+                return
+            origen = str(Path(self.current_folder_path).resolve()) if self.current_folder_path else ""
+            try:
+                job_id = self.journal.trabajo_pendiente(origen, self.detail_level) if origen else None
+                if job_id is not None:
+                    resumen = self.journal.resumen(job_id)
+                    hechas = resumen.get(HECHA, 0) + resumen.get(ERROR, 0)
+                    reply = QMessageBox.question(
+                        self, "Reanudar Lote",
+                        f"Hay un lote sin terminar de esta carpeta ({hechas} imágenes ya procesadas).\n\n"
+                        "¿Continuar donde se quedó?",
+                        QMessageBox.Yes | QMessageBox.No
+                    )
+                    if reply == QMessageBox.Yes:
+                        pendientes = self.journal.reanudar(job_id)
+                        # Lo que haya en la carpeta y el trabajo aún no tenga (lote cortado a medio descubrir)
+                        pendientes += list(self.journal.registrar_entradas(job_id, self.batch_images))
+                        self.batch_job_id = job_id
+                        self.batch_indices = [indice for indice, _ in pendientes]
+                        self.batch_images = [ruta for _, ruta in pendientes]
+                        return
+                self.batch_job_id = self.journal.crear_trabajo(origen, self.detail_level)
+                for _ in self.journal.registrar_entradas(self.batch_job_id, self.batch_images):
+                    pass
+            except Exception as e:
+                # Sin diario el lote funciona igual, solo que no se puede reanudar
+                logger.warning(f"Diario de trabajos no disponible: {e}")
+                self.batch_job_id = None
+        
+        def marcar_en_diario(self, offset: int, results: Optional[Dict] = None, error: Optional[str] = None):
+            """Apunta en el diario el estado de la imagen `offset` del lote."""
+            if self.batch_job_id is None:
+                return
+            try:
+                indice = self.batch_indices[offset]
+                if results is not None:
+                    self.journal.marcar(self.batch_job_id, indice, estado_de_resultado(results), results.get('error'))
+                else:
+                    self.journal.marcar(self.batch_job_id, indice, ERROR, error)
+            except Exception as e:
+                logger.warning(f"No se pudo actualizar el diario de trabajos: {e}")
+        
         def process_next_batch_image(self):
-            """Procesa la siguiente imagen en el lote"""
+            """Procesa el siguiente bloque de imágenes del lote"""
             if self.batch_current_index >= len(self.batch_images):
                 self.finish_batch_processing()
                 return
             
-            current_image = self.batch_images[self.batch_current_index]
+            self.batch_chunk = self.batch_images[self.batch_current_index:self.batch_current_index + self.batch_size]
+            current_image = self.batch_chunk[0]
             
             # Actualizar etiquetas de progreso
-            progress_text = f"Procesando imagen {self.batch_current_index + 1} de {len(self.batch_images)}"
+            last_index = self.batch_current_index + len(self.batch_chunk)
+            progress_text = f"Procesando imágenes {self.batch_current_index + 1}-{last_index} de {len(self.batch_images)}"
             self.batch_progress_label.setText(progress_text)
             
             overall_progress = int((self.batch_current_index / len(self.batch_images)) * 100)
             self.progress_bar.setValue(overall_progress)
             
-            # Actualizar preview con imagen actual
+            # Actualizar preview con la primera imagen del bloque
             self.load_image_preview(current_image)
             
+            if self.batch_job_id is not None:
+                inicio = self.batch_current_index
+                try:
+                    self.journal.marcar_en_vuelo(self.batch_job_id, [
+                        (self.batch_indices[inicio + i], ruta, None) for i, ruta in enumerate(self.batch_chunk)
+                    ])
+                except Exception as e:
+                    logger.warning(f"No se pudo actualizar el diario de trabajos: {e}")
+            
             # Crear y iniciar hilo de procesamiento con nivel de detalle
-            self.processing_thread = ProcessingThread(current_image, self.image_processor, self.detail_level)
-            self.processing_thread.finished.connect(self.on_batch_image_finished)
+            self.processing_thread = BatchProcessingThread(
+                self.batch_chunk, self.image_processor, self.detail_level, self.batch_size
+            )
+            self.processing_thread.finished.connect(self.on_batch_chunk_finished)
             self.processing_thread.error.connect(self.on_batch_image_error)
             self.processing_thread.progress.connect(self.progress_bar.setValue)
             self.processing_thread.start()
             
             self.status_bar.showMessage(f"Procesando lote: {Path(current_image).name}")
         
-        def on_batch_image_finished(self, results: Dict):
+        def on_batch_chunk_finished(self, results_list: List[Dict]):
+            """Maneja los resultados de un bloque de imágenes del lote"""
+            for i, (current_image, results) in enumerate(zip(self.batch_chunk, results_list)):
+                self.on_batch_image_finished(current_image, results)
+                self.marcar_en_diario(self.batch_current_index + i, results=results)
+            
+            # Avanzar al siguiente bloque
+            self.batch_current_index += len(self.batch_chunk)
+            self.batch_chunk = []
+            self.processing_thread = None
+            
+            # Procesar siguiente bloque
+            QApplication.processEvents()  # Permitir que la UI se actualice
+            QTimer.singleShot(100, self.process_next_batch_image)  # Pequeña pausa
+        
+        def on_batch_image_finished(self, current_image: str, results: Dict):
             """Maneja el resultado de una imagen del lote"""
             try:
-                current_image = self.batch_images[self.batch_current_index]
-                
                 # Guardar resultados
                 self.output_handler.save_results(current_image, results, self.copy_and_rename)
                 
                 # Mostrar resultados de la imagen actual
                 self.update_results_display(results)
                 
-                # Avanzar al siguiente
-                self.batch_current_index += 1
-                self.processing_thread = None
-                
-                # Procesar siguiente imagen
-                QApplication.processEvents()  # Permitir que la UI se actualice
-                QTimer.singleShot(100, self.process_next_batch_image)  # Pequeña pausa
-                
             except Exception as e:
-                logger.error(f"Error procesando imagen del lote: {e}")
-                self.on_batch_image_error(str(e))
+                logger.error(f"Error procesando {current_image}: {e}")
         
         def on_batch_image_error(self, error_msg: str):
             """Maneja errores en el procesamiento de lote"""
-            current_image = self.batch_images[self.batch_current_index]
-            logger.error(f"Error procesando {current_image}: {error_msg}")
+            for i, current_image in enumerate(self.batch_chunk):
+                logger.error(f"Error procesando {current_image}: {error_msg}")
+                self.marcar_en_diario(self.batch_current_index + i, error=error_msg)
             
-            # Avanzar al siguiente (saltar imagen con error)
-            self.batch_current_index += 1
+            # Avanzar al siguiente bloque (saltar imágenes con error)
+            self.batch_current_index += len(self.batch_chunk)
+            self.batch_chunk = []
             self.processing_thread = None
             
-            # Continuar con la siguiente imagen
+            # Continuar con el siguiente bloque
             QTimer.singleShot(100, self.process_next_batch_image)
         
         def finish_batch_processing(self):
             """Finaliza el procesamiento en lote"""
             self.batch_processing = False
+            if self.batch_job_id is not None:
+                self.journal.finalizar(self.batch_job_id)
+                self.batch_job_id = None
             
             # Ocultar barras de progreso
             self.progress_bar.setVisible(False)
@@ -1024,6 +1148,13 @@ if PYSIDE6_AVAILABLE:
             # Actualizar historial
             self.refresh_history()
         
+        def on_caption_token(self, fragmento: str):
+            """Añade al caption el texto recibido en streaming."""
+            cursor = self.caption_text.textCursor()
+            cursor.movePosition(QTextCursor.End)
+            cursor.insertText(fragmento)
+            self.caption_text.setTextCursor(cursor)
+
         def update_results_display(self, results: Dict):
             """Actualiza la visualización de resultados"""
             # Mostrar resultados en la interfaz
@@ -1281,6 +1412,10 @@ if PYSIDE6_AVAILABLE:
                     self.model_loading_thread.wait(1000) # Esperar max 1 seg
 
                 if self.processing_thread and self.processing_thread.isRunning():
+                    # quit() no interrumpe run(): cancelar el generate en curso
+                    token = getattr(self.image_processor, "cancel_token", None)
+                    if token is not None:
+                        token.cancelar()
                     self.processing_thread.quit()
                     self.processing_thread.wait(1000) # Esperar max 1 seg
                 
@@ -0,0 +1,151 @@
+"""
+Descubrimiento de imágenes en carpetas.
+
+Un solo generador para el lote, la GUI y la base de datos:
+
+• una pasada con `os.scandir` por carpeta (recursiva), sin un glob por extensión
+• el formato se reconoce por los primeros bytes del fichero, no por la
+  extensión: entran `IMG_0001` sin extensión y no entran los `._foto.jpg` de macOS
+• cada fichero sale una sola vez aunque haya enlaces duros o simbólicos (inodo)
+• las rutas salen según se encuentran, así el procesamiento empieza antes de
+  terminar de listar un árbol de cientos de miles de ficheros
+"""
+import logging
+import os
+from typing import Iterable, Iterator, Optional
+
+logger = logging.getLogger(__name__)
+
+# Formatos que Florence‑2 recibe a través de PIL
+FORMATOS = frozenset({"jpeg", "png", "bmp", "gif", "tiff", "webp"})
+
+# Extensiones válidas de cada formato; la primera es la que se usa al renombrar
+EXTENSIONES = {
+    "jpeg": (".jpg", ".jpeg", ".jpe", ".jfif"),
+    "png": (".png",),
+    "bmp": (".bmp", ".dib"),
+    "gif": (".gif",),
+    "tiff": (".tif", ".tiff"),
+    "webp": (".webp",),
+}
+
+# Bytes necesarios para reconocer todos los formatos (RIFF....WEBP)
+_BYTES_CABECERA = 12
+
+
+def formato_de_cabecera(cabecera: bytes) -> Optional[str]:
+    """Formato de imagen según los magic bytes, o None si no es una imagen conocida."""
+    if cabecera.startswith(b"\xff\xd8\xff"):
+        return "jpeg"
+    if cabecera.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "png"
+    if cabecera[:6] in (b"GIF87a", b"GIF89a"):
+        return "gif"
+    if cabecera[:4] in (b"II*\x00", b"MM\x00*"):
+        return "tiff"
+    if cabecera[:4] == b"RIFF" and cabecera[8:12] == b"WEBP":
+        return "webp"
+    if cabecera.startswith(b"BM"):
+        return "bmp"
+    return None
+
+
+def detectar_formato(ruta: str) -> Optional[str]:
+    """Lee la cabecera de `ruta` y devuelve su formato (None si no es imagen o no se puede leer)."""
+    try:
+        with open(ruta, "rb") as f:
+            return formato_de_cabecera(f.read(_BYTES_CABECERA))
+    except OSError:
+        return None
+
+
+def es_imagen(ruta: str, formatos: Iterable[str] = FORMATOS) -> bool:
+    return detectar_formato(ruta) in set(formatos)
+
+
+def extension_de(ruta: str) -> str:
+    """
+    Extensión (en minúsculas) que corresponde al contenido de `ruta`: la suya
+    si encaja con el formato detectado, la del formato si falta o no encaja
+    (`IMG_0001` → `.jpg`, un PNG llamado `.jpg` → `.png`).
+    """
+    sufijo = os.path.splitext(ruta)[1].lower()
+    validas = EXTENSIONES.get(detectar_formato(ruta))
+    if validas is None or sufijo in validas:
+        return sufijo
+    return validas[0]
+
+
+def descubrir_imagenes(raiz: str, recursivo: bool = True, excluir: Iterable[str] = (),
+                       formatos: Iterable[str] = FORMATOS, ocultos: bool = False,
+                       seguir_enlaces: bool = False) -> Iterator[str]:
+    """
+    Genera las rutas de las imágenes bajo `raiz`, según se encuentran.
+
+    Args:
+        raiz: Carpeta de partida (o un fichero suelto)
+        recursivo: Entrar en subcarpetas
+        excluir: Carpetas que se saltan (p. ej. la de destino del lote)
+        formatos: Formatos admitidos (ver `FORMATOS`)
+        ocultos: Incluir ficheros y carpetas que empiezan por "."
+        seguir_enlaces: Entrar en carpetas que son enlaces simbólicos
+
+    Si `raiz` no existe se lanza `FileNotFoundError`; las subcarpetas que no
+    se pueden leer se registran y se saltan.
+    """
+    formatos = frozenset(formatos)
+    excluir = {os.path.abspath(c) for c in excluir if c}
+    if os.path.isfile(raiz):
+        if detectar_formato(raiz) in formatos:
+            yield raiz
+        return
+
+    vistos = set()        # (dispositivo, inodo) de los ficheros ya entregados
+    carpetas_vistas = set()
+    pendientes = [raiz]
+    while pendientes:
+        carpeta = pendientes.pop()
+        try:
+            st = os.stat(carpeta)
+        except OSError as exc:
+            if carpeta is raiz:
+                raise FileNotFoundError(f"No existe la carpeta: {raiz}") from exc
+            logger.warning(f"⚠️ No se puede leer {carpeta}: {exc}")
+            continue
+        if (st.st_dev, st.st_ino) in carpetas_vistas:
+            continue  # ciclo de enlaces simbólicos
+        carpetas_vistas.add((st.st_dev, st.st_ino))
+
+        subcarpetas = []
+        try:
+            with os.scandir(carpeta) as entradas:
+                for entrada in entradas:
+                    if not ocultos and entrada.name.startswith("."):
+                        continue
+                    try:
+                        if entrada.is_dir(follow_symlinks=seguir_enlaces):
+                            if recursivo and os.path.abspath(entrada.path) not in excluir:
+                                subcarpetas.append(entrada.path)
+                            continue
+                        if not entrada.is_file():
+                            continue
+                        # El inodo de la entrada viene del propio listado; los enlaces
+                        # simbólicos se resuelven para deduplicar por el fichero real
+                        if entrada.is_symlink():
+                            destino = os.stat(entrada.path)
+                            clave = (destino.st_dev, destino.st_ino)
+                        else:
+                            clave = (st.st_dev, entrada.inode())
+                    except OSError:
+                        continue
+                    if clave in vistos or detectar_formato(entrada.path) not in formatos:
+                        continue
+                    vistos.add(clave)
+                    yield entrada.path
+        except OSError as exc:
+            if carpeta is raiz:
+                raise
+            logger.warning(f"⚠️ No se puede leer {carpeta}: {exc}")
+
+        # Orden estable: las subcarpetas se recorren por nombre
+        pendientes.extend(sorted(subcarpetas, reverse=True))
@@ -0,0 +1,37 @@
+"""
+Importación diferida de módulos pesados (torch, transformers…).
+
+`torch = lazy_import("torch")` devuelve un sustituto que solo importa el módulo
+real al acceder al primer atributo, así abrir la GUI o el gestor de base de
+datos no paga los segundos de `import torch` si nunca se carga un modelo.
+"""
+import importlib
+import sys
+import types
+
+
+class _LazyModule(types.ModuleType):
+    def __init__(self, nombre: str):
+        super().__init__(nombre)
+        self.__dict__["_modulo"] = None
+
+    def _cargar(self):
+        if self._modulo is None:
+            self.__dict__["_modulo"] = importlib.import_module(self.__name__)
+        return self._modulo
+
+    def __getattr__(self, attr):
+        return getattr(self._cargar(), attr)
+
+    def __dir__(self):
+        return dir(self._cargar())
+
+
+def lazy_import(nombre: str):
+    """Devuelve el módulo si ya está importado o un sustituto que lo importa al usarlo."""
+    return sys.modules.get(nombre) or _LazyModule(nombre)
+
+
+def modulo_importado(nombre: str) -> bool:
+    """True si `nombre` ya se ha importado de verdad en este proceso."""
+    return nombre in sys.modules
@@ -0,0 +1,84 @@
+"""
+Memoria RAM total y disponible del sistema, en GB.
+
+Usa psutil si está instalado; si no, GlobalMemoryStatusEx en Windows,
+/proc/meminfo en Linux y `os.sysconf` en el resto de Unix (solo el total).
+Las funciones devuelven None cuando no hay forma de saberlo.
+"""
+import os
+import sys
+from typing import Optional, Tuple
+
+try:
+    import psutil
+except ImportError:  # opcional
+    psutil = None
+
+_GB = 1024 ** 3
+
+
+def memoria_total_gb() -> Optional[float]:
+    """RAM física total; None si no se puede saber."""
+    return _consultar()[0]
+
+
+def memoria_disponible_gb() -> Optional[float]:
+    """RAM que se puede usar sin hacer swap; None si no se puede saber."""
+    return _consultar()[1]
+
+
+def _consultar() -> Tuple[Optional[float], Optional[float]]:
+    if psutil is not None:
+        memoria = psutil.virtual_memory()
+        return memoria.total / _GB, memoria.available / _GB
+    if sys.platform == "win32":
+        return _windows()
+    total, disponible = _meminfo()
+    if total is None:
+        total = _sysconf()
+    return total, disponible
+
+
+def _windows() -> Tuple[Optional[float], Optional[float]]:
+    import ctypes
+    from ctypes import wintypes
+
+    class MEMORYSTATUSEX(ctypes.Structure):
+        _fields_ = [
+            ("dwLength", wintypes.DWORD),
+            ("dwMemoryLoad", wintypes.DWORD),
+            ("ullTotalPhys", ctypes.c_ulonglong),
+            ("ullAvailPhys", ctypes.c_ulonglong),
+            ("ullTotalPageFile", ctypes.c_ulonglong),
+            ("ullAvailPageFile", ctypes.c_ulonglong),
+            ("ullTotalVirtual", ctypes.c_ulonglong),
+            ("ullAvailVirtual", ctypes.c_ulonglong),
+            ("ullAvailExtendedVirtual", ctypes.c_ulonglong),
+        ]
+
+    estado = MEMORYSTATUSEX()
+    estado.dwLength = ctypes.sizeof(MEMORYSTATUSEX)
+    if not ctypes.windll.kernel32.GlobalMemoryStatusEx(ctypes.byref(estado)):
+        return None, None
+    return estado.ullTotalPhys / _GB, estado.ullAvailPhys / _GB
+
+
+def _meminfo() -> Tuple[Optional[float], Optional[float]]:
+    """MemTotal y MemAvailable de Linux (en kB en el fichero)."""
+    valores = {}
+    try:
+        with open("/proc/meminfo", "r", encoding="utf-8") as f:
+            for linea in f:
+                clave, _, resto = linea.partition(":")
+                if clave in ("MemTotal", "MemAvailable"):
+                    valores[clave] = int(resto.split()[0]) * 1024 / _GB
+    except (OSError, ValueError, IndexError):
+        pass
+    return valores.get("MemTotal"), valores.get("MemAvailable")
+
+
+def _sysconf() -> Optional[float]:
+    try:
+        return os.sysconf("SC_PHYS_PAGES") * os.sysconf("SC_PAGE_SIZE") / _GB
+    except (AttributeError, ValueError, OSError):
+        return None
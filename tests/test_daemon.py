@@ -0,0 +1,85 @@
+"""
+Daemon del modelo: un cliente cancela su generación en curso y envía su
+límite de tiempo, que el daemon aplica solo a esa petición.
+"""
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+import pytest
+
+from core import model_daemon
+from core.cancelacion import MOTIVO_CANCELADO, CancellationToken
+
+
+class ProcesadorLento:
+    """Genera "token a token" hasta que se cancela, como `CriterioInterrupcion`."""
+
+    def __init__(self):
+        self.cancel_token = CancellationToken()
+        self.limite_por_imagen_s = 0.0
+        self.limites = []
+        self.empezado = threading.Event()
+
+    def process_image(self, path, detail_level, tasks):
+        self.limites.append(self.limite_por_imagen_s)
+        self.empezado.set()
+        fin = time.monotonic() + 10
+        while time.monotonic() < fin:
+            if self.cancel_token.cancelado:
+                return {"error": "Cancelado por el usuario", "interrumpido": MOTIVO_CANCELADO}
+            time.sleep(0.01)
+        return {"descripcion": "completa"}
+
+
+class GestorFalso:
+    model = "cargado"
+
+    def descargar_modelo(self):
+        self.model = None
+
+
+@pytest.fixture
+def daemon():
+    if not model_daemon.AF_UNIX_DISPONIBLE:
+        pytest.skip("sin sockets Unix")
+    carpeta = tempfile.mkdtemp(prefix="spd")  # rutas cortas: límite de AF_UNIX
+    servidor = model_daemon.ModelDaemon.__new__(model_daemon.ModelDaemon)
+    servidor.__dict__.update(
+        socket_path=str(Path(carpeta) / "d.sock"), idle_unload_s=0, manager=GestorFalso(),
+        processor=ProcesadorLento(), _lock=threading.Lock(), _peticiones={}, _en_curso=None,
+        _lock_peticiones=threading.Lock(), _ultimo_uso=time.monotonic(), _servidor=None,
+    )
+    hilo = threading.Thread(target=servidor.servir, daemon=True)
+    hilo.start()
+    cliente = model_daemon.DaemonClient(servidor.socket_path)
+    for _ in range(100):
+        if cliente.disponible():
+            break
+        time.sleep(0.02)
+    yield servidor, cliente
+    cliente.enviar({"cmd": "shutdown"})
+    hilo.join(5)
+
+
+def test_cancelar_detiene_la_generacion_del_daemon(daemon, tmp_path):
+    servidor, cliente = daemon
+    procesador = model_daemon.DaemonImageProcessor(cliente)
+    procesador.limite_por_imagen_s = 30.0
+    imagen = tmp_path / "foto.jpg"
+    imagen.write_bytes(b"x")
+
+    resultado = {}
+    hilo = threading.Thread(target=lambda: resultado.update(procesador.process_image(str(imagen), "largo")))
+    inicio = time.monotonic()
+    hilo.start()
+    assert servidor.processor.empezado.wait(5)
+    procesador.cancel_token.cancelar()
+    hilo.join(5)
+
+    assert resultado.get("interrumpido") == MOTIVO_CANCELADO
+    assert time.monotonic() - inicio < 5
+    assert servidor.processor.limites == [30.0]
+    # El límite del cliente no se queda en el daemon
+    assert servidor.processor.limite_por_imagen_s == 0.0
@@ -0,0 +1,19 @@
+"""
+Diario de trabajos: una imagen renombrada justo antes de una caída se
+reencuentra al reanudar, también cuando se marcó en vuelo sin hash (pool, GUI).
+"""
+from core.job_journal import JobJournal
+
+
+def test_reanudar_relocaliza_renombrado_marcado_sin_hash(tmp_path):
+    original = tmp_path / "foto.jpg"
+    original.write_bytes(b"contenido de prueba")
+    diario = JobJournal(str(tmp_path / "diario.db"))
+    job_id = diario.crear_trabajo(str(tmp_path))
+    [(indice, ruta)] = list(diario.registrar_entradas(job_id, [str(original)]))
+
+    diario.marcar_en_vuelo(job_id, [(indice, ruta, None)])
+    renombrada = original.rename(tmp_path / "playa_al_atardecer.jpg")
+
+    assert diario.reanudar(job_id) == [(indice, str(renombrada))]
+    diario.cerrar()
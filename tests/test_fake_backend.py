@@ -0,0 +1,11 @@
+"""
+El backend simulado se importa y se configura sin torch, PIL ni transformers.
+"""
+from core.fake_backend import FakeFlorence2Manager
+
+
+def test_gestor_simulado_sin_pila_del_modelo():
+    manager = FakeFlorence2Manager(latencia_token_ms=1.0)
+    assert manager.device == "cpu"
+    assert manager.gpu_info["available"] is False
+    assert '"latencia_token_ms": 1.0' in manager.firma_modelo()
@@ -0,0 +1,97 @@
+"""
+Con un origen en vivo (modo vigilancia), una imagen que llega sola se procesa
+sin esperar a que lleguen más ni a que el origen se detenga.
+"""
+import queue
+import threading
+import time
+
+import pytest
+
+from core.pipeline import VACIA, LectorCola, tomar, tomar_lote
+
+
+class OrigenBloqueante:
+    """Entrega una ruta y después se queda esperando hasta `detener()`, como un FolderWatcher."""
+
+    def __init__(self, ruta):
+        self.ruta = ruta
+        self._parar = threading.Event()
+
+    def __iter__(self):
+        yield self.ruta
+        self._parar.wait()
+
+    def detener(self):
+        self._parar.set()
+
+
+class ProcesadorFalso:
+    """Lo mínimo de ImageProcessor que usa BatchEngine, sin modelo."""
+
+    class manager:
+        device = "cuda"
+
+    cancel_token = None
+
+    def preparar_imagen(self, ruta):
+        return {"path": ruta}
+
+    def process_prepared(self, items, detail_level):
+        return [{"descripcion": "", "keywords": ["prueba"]} for _ in items]
+
+    def extraer_keywords(self, resultado):
+        return []
+
+
+def test_tomar_lote_entrega_lote_parcial():
+    cola = queue.Queue()
+    cola.put("a")
+    inicio = time.monotonic()
+    assert tomar_lote(LectorCola(cola), 4, espera_s=0.05) == ["a"]
+    assert time.monotonic() - inicio < 1
+
+
+def test_tomar_sin_nada_listo_devuelve_vacia():
+    assert tomar(LectorCola(queue.Queue()), 0) is VACIA
+    assert tomar_lote(LectorCola(queue.Queue()), 4, bloquear=False) == []
+
+
+def test_prefetcher_no_espera_a_mas_rutas():
+    pytest.importorskip("PIL")
+    from core.prefetch import ImagePrefetcher
+
+    cola = queue.Queue()
+    cola.put("una.jpg")
+    prefetcher = ImagePrefetcher(LectorCola(cola), ProcesadorFalso(), depth=8)
+    entregados = []
+    hilo = threading.Thread(target=lambda: entregados.append(next(prefetcher)), daemon=True)
+    hilo.start()
+    hilo.join(timeout=5)
+    prefetcher.close()
+    assert entregados == [{"path": "una.jpg"}]
+
+
+def test_engine_procesa_una_ruta_sin_esperar_al_origen(tmp_path):
+    pytest.importorskip("PIL")
+    from core.batch_engine import BatchEngine
+
+    ruta = tmp_path / "una.jpg"
+    ruta.write_bytes(b"\xff\xd8\xff\xe0")
+    origen = OrigenBloqueante(str(ruta))
+    engine = BatchEngine(ProcesadorFalso(), batch_size=4, prefetch_depth=8)
+    llegada = threading.Event()
+
+    def al_resultado(resultado):
+        # El origen sigue vivo cuando llega el resultado
+        assert not origen._parar.is_set()
+        llegada.set()
+
+    hilo = threading.Thread(target=engine.procesar, args=(origen, al_resultado, False), daemon=True)
+    hilo.start()
+    try:
+        assert llegada.wait(timeout=5), "la imagen no se procesó hasta detener el origen"
+    finally:
+        engine.stop()
+        hilo.join(timeout=5)
+    assert not hilo.is_alive()
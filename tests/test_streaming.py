@@ -0,0 +1,22 @@
+"""
+Niveles de detalle que la GUI puede transmitir token a token (`streaming_gui`).
+"""
+import pytest
+
+
+def test_niveles_de_muestreo_admiten_streaming():
+    pytest.importorskip("PIL")
+    from core.image_processor import ImageProcessor
+
+    procesador = ImageProcessor.__new__(ImageProcessor)
+    assert procesador.admite_streaming("medio")
+    assert procesador.admite_streaming("largo")
+    # Determinista con beams: transmitirlo cambiaría el caption
+    assert not procesador.admite_streaming("minimo")
+
+
+def test_daemon_no_admite_streaming():
+    from core.model_daemon import DaemonImageProcessor
+
+    procesador = DaemonImageProcessor.__new__(DaemonImageProcessor)
+    assert not procesador.admite_streaming("largo")